@@ -0,0 +1,223 @@
+"""Micro-benchmarks for the page parsing of every crawler. Times the
+   extraction of exposes from result pages, of expose details and of
+   addresses, over the saved HTML fixtures and over synthetic pages with
+   hundreds of listings, and compares the timings and memory allocations
+   with a stored baseline. Exits with a non-zero status if any case got
+   slower or allocates more than the baseline allows.
+
+   Timings are stored relative to a reference case - parsing a fixed HTML
+   page with BeautifulSoup, without any crawler code - timed in the same
+   run, so that a baseline stored on one machine applies on others. The
+   ratios still vary with the CPU, its load and the versions of lxml and
+   BeautifulSoup, so a case only fails when it takes twice its baseline
+   ratio by default. Allocations hardly vary, and have a tighter tolerance.
+   Store a new baseline after upgrading lxml or BeautifulSoup.
+
+   Run from the project root (after 'pip install -e .'):
+
+       python benchmarks/parsers.py            # compare with the baseline
+       python benchmarks/parsers.py --save     # store a new baseline"""
+import os
+import sys
+import json
+import timeit
+import logging
+import argparse
+import tracemalloc
+from collections import namedtuple
+
+from bs4 import BeautifulSoup
+
+from flathunter.crawl_ebaykleinanzeigen import CrawlEbayKleinanzeigen
+from flathunter.crawl_immobilienscout import CrawlImmobilienscout
+from flathunter.crawl_immowelt import CrawlImmowelt
+from flathunter.crawl_wggesucht import CrawlWgGesucht
+from flathunter.standin import PORTALS, Listing
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+FIXTURES = os.path.join(os.path.dirname(BENCHMARKS), 'test', 'fixtures')
+BASELINE = os.path.join(BENCHMARKS, 'parsers_baseline.json')
+SYNTHETIC_LISTINGS = 300
+
+Case = namedtuple('Case', ['name', 'run', 'exposes'])
+Result = namedtuple('Result', ['name', 'seconds', 'relative', 'exposes_per_second',
+                               'peak_bytes'])
+
+REFERENCE_PAGE = ('<html><body><ul>%s</ul></body></html>' % ''.join(
+    '<li class="item" id="item-%d"><a href="/item/%d"><h2>Item %d</h2></a>'
+    '<div class="facts"><span>%d EUR</span><span>%d m²</span></div></li>'
+    % (i, i, i, 500 + i, 20 + i % 100) for i in range(SYNTHETIC_LISTINGS))).encode('utf-8')
+
+def fixture(name):
+    """The content of a saved HTML page"""
+    with open(os.path.join(FIXTURES, name), 'rb') as fixture_file:
+        return fixture_file.read()
+
+def synthetic_results(host, listings=SYNTHETIC_LISTINGS, structured_data=False):
+    """A result page of the portal with the given number of listings, and
+       with embedded JSON if 'structured_data' is set"""
+    portal = PORTALS[host]
+    settings = {'listings': listings, 'page_size': listings, 'structured_data': structured_data}
+    return portal.result_page([Listing(expose_id) for expose_id in
+                               portal.listing_ids('/benchmark', 1, settings)],
+                              settings).encode('utf-8')
+
+def synthetic_expose(host):
+    """An expose page of the portal"""
+    portal = PORTALS[host]
+    return portal.expose_page(Listing(portal.ID_BASE)).encode('utf-8')
+
+def result_case(name, crawler, content):
+    """Parsing a result page and extracting its exposes"""
+    exposes = len(crawler.extract_content(content)[0])
+    return Case(name, lambda: crawler.extract_content(content), exposes)
+
+def details_case(name, crawler, content):
+    """Parsing an expose page and adding its details to an expose"""
+    return Case(name, lambda: crawler.extract_expose_page({'url': ''}, content), 1)
+
+def address_case(name, extract_address, content):
+    """Parsing an expose page and reading its address, as load_address does"""
+    return Case(name, lambda: extract_address(content), 1)
+
+def cases():
+    """All benchmarked cases"""
+    immoscout = CrawlImmobilienscout()
+    immowelt = CrawlImmowelt()
+    ebay = CrawlEbayKleinanzeigen()
+    wggesucht = CrawlWgGesucht()
+    return [
+        result_case('immobilienscout.results.fixture', immoscout,
+                    fixture('immobilienscout_results.html')),
+        result_case('immobilienscout.results.synthetic', immoscout,
+                    synthetic_results('www.immobilienscout24.de')),
+        result_case('immobilienscout.results.structured', immoscout,
+                    synthetic_results('www.immobilienscout24.de', structured_data=True)),
+        details_case('immobilienscout.details.fixture', immoscout,
+                     fixture('immobilienscout_expose.html')),
+        details_case('immobilienscout.details.synthetic', immoscout,
+                     synthetic_expose('www.immobilienscout24.de')),
+        result_case('immowelt.results.fixture', immowelt, fixture('immowelt_results.html')),
+        result_case('immowelt.results.synthetic', immowelt,
+                    synthetic_results('www.immowelt.de')),
+        details_case('immowelt.details.synthetic', immowelt,
+                     synthetic_expose('www.immowelt.de')),
+        result_case('ebaykleinanzeigen.results.fixture', ebay,
+                    fixture('ebaykleinanzeigen_results.html')),
+        result_case('ebaykleinanzeigen.results.synthetic', ebay,
+                    synthetic_results('www.ebay-kleinanzeigen.de')),
+        details_case('ebaykleinanzeigen.details.synthetic', ebay,
+                     synthetic_expose('www.ebay-kleinanzeigen.de')),
+        address_case('ebaykleinanzeigen.address.synthetic',
+                     lambda content: ebay.extract_address(ebay.parse_page(content)),
+                     synthetic_expose('www.ebay-kleinanzeigen.de')),
+        result_case('wggesucht.results.fixture', wggesucht, fixture('wggesucht_results.html')),
+        result_case('wggesucht.results.synthetic', wggesucht,
+                    synthetic_results('www.wg-gesucht.de')),
+        address_case('wggesucht.address.synthetic', wggesucht.extract_address,
+                     synthetic_expose('www.wg-gesucht.de')),
+    ]
+
+def best_time(run, repeat=5):
+    """The best time per call of several runs"""
+    timer = timeit.Timer(run)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+def reference_time():
+    """The time per call of the reference case, which only exercises the HTML
+       parser, to measure the speed of the machine"""
+    return best_time(lambda: BeautifulSoup(REFERENCE_PAGE, 'lxml'))
+
+def measure(case):
+    """Time a case, returning the best time per call of several runs and the
+       peak memory allocated during a single call"""
+    seconds = best_time(case.run)
+    tracemalloc.start()
+    case.run()
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return Result(case.name, seconds, None, case.exposes / seconds, peak_bytes)
+
+def measure_all(selected):
+    """Time the cases and the reference case. The reference is timed before
+       every case and its best time taken, so that a passing slowdown of the
+       machine does not skew the ratios of all cases"""
+    references = []
+    results = []
+    for case in selected:
+        references.append(reference_time())
+        results.append(measure(case))
+    reference = min(references, default=0.0)
+    return reference, [result._replace(relative=result.seconds / reference)
+                       for result in results]
+
+def compare(results, baseline, tolerance, memory_tolerance):
+    """Returns a description of every result that is slower than its baseline
+       by more than the tolerance, or allocates more by more than the memory
+       tolerance"""
+    regressions = []
+    for result in results:
+        if result.name not in baseline:
+            continue
+        base = baseline[result.name]
+        if result.relative > base['relative'] * (1 + tolerance):
+            regressions.append("%s: %.2f times the reference, baseline %.2f times" %
+                               (result.name, result.relative, base['relative']))
+        if result.peak_bytes > base['peak_bytes'] * (1 + memory_tolerance):
+            regressions.append("%s: %d KiB allocated, baseline %d KiB" %
+                               (result.name, result.peak_bytes / 1024,
+                                base['peak_bytes'] / 1024))
+    return regressions
+
+def report(results, baseline):
+    """Print a table of the results"""
+    print("%-38s %10s %12s %10s %9s" % ('case', 'ms/page', 'exposes/s', 'peak KiB', 'change'))
+    for result in results:
+        change = ''
+        if result.name in baseline:
+            change = '%+.0f%%' % ((result.relative / baseline[result.name]['relative'] - 1) * 100)
+        print("%-38s %10.3f %12.0f %10.0f %9s" % (result.name, result.seconds * 1000,
+                                                 result.exposes_per_second,
+                                                 result.peak_bytes / 1024, change))
+
+def main():
+    """Run the benchmarks and compare them with, or store them as, the baseline"""
+    parser = argparse.ArgumentParser(description="Benchmarks the crawlers' page parsing")
+    parser.add_argument('--save', action='store_true', help="Store the results as the baseline")
+    parser.add_argument('--baseline', default=BASELINE, help="Baseline file")
+    parser.add_argument('--tolerance', type=float, default=1.0,
+                        help="Allowed slowdown relative to the reference, as a fraction")
+    parser.add_argument('--memory-tolerance', type=float, default=0.5,
+                        help="Allowed growth in allocations, as a fraction")
+    parser.add_argument('--filter', default='', help="Only run cases containing this text")
+    args = parser.parse_args()
+
+    # the crawlers log about missing fields, which would only add noise
+    logging.disable(logging.CRITICAL)
+    reference, results = measure_all([case for case in cases() if args.filter in case.name])
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+    print("Reference: %.3f ms per page\n" % (reference * 1000))
+    report(results, baseline)
+
+    if args.save:
+        baseline.update({result.name: {'relative': result.relative,
+                                        'peak_bytes': result.peak_bytes}
+                         for result in results})
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+        print("Stored baseline in %s" % args.baseline)
+        return 0
+    regressions = compare(results, baseline, args.tolerance, args.memory_tolerance)
+    if regressions:
+        print("\nREGRESSIONS against %s:" % args.baseline)
+        for regression in regressions:
+            print("  " + regression)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
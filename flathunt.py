@@ -5,6 +5,7 @@
    console. To run as a webservice, look at main.py"""
 import sys
 import argparse
+import asyncio
 import os
 import logging
 import time
@@ -44,15 +45,30 @@ __log__ = logging.getLogger('flathunt')
 
 def launch_flat_hunt(config):
     """Starts the crawler / notification loop"""
-    id_watch = IdMaintainer('%s/processed_ids.db' % config.database_location())
+    id_watch = IdMaintainer('%s/processed_ids.db' % config.database_location(),
+                            config.get('database', dict()))
 
     hunter = Hunter(config, id_watch)
-    hunter.hunt_flats()
+    if config.get('concurrency', dict()).get('asyncio', False):
+        def hunt(urls=None):
+            return asyncio.run(hunter.hunt_flats_async(urls=urls))
+    else:
+        hunt = hunter.hunt_flats
+
+    if hunter.scheduler is not None:
+        # poll each URL at its own, adaptive interval
+        hunter.hunt_due(hunt)
+        while config.get('loop', dict()).get('active', False):
+            time.sleep(hunter.scheduler.seconds_until_next_run())
+            hunter.hunt_due(hunt)
+        return
+
+    hunt()
 
     while config.get('loop', dict()).get('active', False):
         # try:
         time.sleep(config.get('loop', dict()).get('sleeping_time', 60 * 10))
-        hunter.hunt_flats()
+        hunt()
         # except:
         #     sys.exit()
 
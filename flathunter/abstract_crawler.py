@@ -1,14 +1,39 @@
 """Interface for webcrawlers. Crawler implementations should subclass this"""
 import re
+import copy
+import json
+import asyncio
+import functools
 import logging
+from concurrent.futures import ThreadPoolExecutor
 import requests
 from bs4 import BeautifulSoup
 
+from flathunter.sessions import SessionPool
+from flathunter.async_sessions import AsyncSessionPool
+from flathunter.page_cache import PageCache
+from flathunter.detail_cache import DetailPageCache
+from flathunter.parse_pool import ParsePool
+
 class Crawler:
-    """Defines the Crawler interface"""
+    """Defines the Crawler interface. Every method that fetches pages has an
+       asyncio counterpart with an '_async' suffix"""
 
     __log__ = logging.getLogger('flathunt')
     URL_PATTERN = None
+    USER_AGENT = None
+    RESULT_STRAINER = None
+    STRUCTURED_DATA_PATTERN = None
+    DETAIL_CACHE_TTL = 6 * 60 * 60
+    # True if the search results lack details that get_expose_details adds,
+    # so that the hunter has to load them for every new expose
+    DEFERRED_DETAILS = False
+
+    def get_headers(self):
+        """Headers to send with every request to the portal"""
+        if self.USER_AGENT is None:
+            return None
+        return {'User-Agent': self.USER_AGENT}
 
     # pylint: disable=unused-argument
     def get_page(self, search_url, page_no=None):
@@ -17,10 +42,157 @@ class Crawler:
 
     def get_soup_from_url(self, url):
         """Creates a Soup object from the HTML at the provided URL"""
-        resp = requests.get(url)
+        resp = SessionPool.shared().get(url, headers=self.get_headers())
         if resp.status_code != 200:
             self.__log__.error("Got response (%i): %s", resp.status_code, resp.content)
-        return BeautifulSoup(resp.content, 'html.parser')
+        return self.parse_page(resp.content)
+
+    def fetch_page(self, url):
+        """Fetches a search result page, revalidating the copy cached by the
+           previous fetch of the same URL"""
+        headers = dict(self.get_headers() or {})
+        headers.update(PageCache.shared().request_headers(url))
+        resp = SessionPool.shared().get(url, headers=headers)
+        if resp.status_code not in (200, 304):
+            self.__log__.error("Got response (%i): %s", resp.status_code, resp.content)
+        return PageCache.shared().update(url, resp)
+
+    def fetch_detail_page(self, url):
+        """Returns the HTML of an expose page, from the detail page cache if
+           it was fetched recently enough"""
+        cache = DetailPageCache.shared()
+        content = cache.get(url, cache.ttl_for(self.get_name(), self.DETAIL_CACHE_TTL))
+        if content is None:
+            resp = SessionPool.shared().get(url, headers=self.get_headers())
+            if resp.status_code != 200:
+                self.__log__.error("Got response (%i): %s", resp.status_code, resp.content)
+                return resp.content
+            content = resp.content
+            cache.put(url, content)
+        return content
+
+    def get_detail_soup(self, url):
+        """Creates a Soup object from the HTML of an expose page"""
+        return self.parse_page(self.fetch_detail_page(url))
+
+    # pylint: disable=no-self-use
+    def parse_page(self, content):
+        """Creates a Soup object from the HTML of a page"""
+        return BeautifulSoup(content, 'html.parser')
+
+    def parse_results(self, content):
+        """Creates a Soup object from a search result page. If the crawler
+           defines a RESULT_STRAINER, only the matching elements are parsed"""
+        if self.RESULT_STRAINER is None:
+            return self.parse_page(content)
+        return BeautifulSoup(content, 'lxml', parse_only=self.RESULT_STRAINER)
+
+    def extract_content(self, content):
+        """Parses the HTML of a result page, returning the exposes on it and a
+           dict of other values read from the page. This may run in a parse
+           worker process, so it must not fetch anything or change the crawler"""
+        structured = self.extract_structured_content(content)
+        if structured is not None:
+            return structured
+        return self.extract_data(self.parse_results(content)), {}
+
+    def extract_structured_data(self, content):
+        """Decodes the JSON that the portal embeds in a result page, starting
+           right after the match of the crawler's STRUCTURED_DATA_PATTERN.
+           Returns None if the page has no such payload"""
+        if self.STRUCTURED_DATA_PATTERN is None:
+            return None
+        match = self.STRUCTURED_DATA_PATTERN.search(content)
+        if match is None:
+            return None
+        try:
+            payload, _ = json.JSONDecoder().raw_decode(
+                content[match.end():].decode('utf-8', errors='replace'))
+        except ValueError:
+            self.__log__.debug('Embedded result data is not valid JSON')
+            return None
+        return payload
+
+    def extract_structured_content(self, content):
+        """The exposes and other values of a result page read from its embedded
+           JSON, as extract_content returns them, or None if the page has to be
+           parsed instead, also when extract_structured returns None. Decoding
+           the JSON is much faster than walking the DOM, and does not depend on
+           the page's markup"""
+        payload = self.extract_structured_data(content)
+        if payload is None:
+            return None
+        try:
+            return self.extract_structured(payload)
+        except (KeyError, IndexError, TypeError, ValueError) as error:
+            self.__log__.debug('Unexpected embedded result data (%r), parsing the page', error)
+            return None
+
+    def extract_structured(self, payload):
+        """Builds the exposes and other values of a result page from its decoded
+           embedded JSON, or returns None to have the page parsed. Subclasses
+           that define a STRUCTURED_DATA_PATTERN implement this"""
+        return None
+
+    def extract_page(self, page):
+        """Parses a fetched page and extracts its exposes. Crawlers may keep
+           other values read from the page in page.meta"""
+        entries, meta = ParsePool.shared().run(self.extract_content, page.content)
+        page.meta.update(meta)
+        return entries
+
+    def extract_expose_page(self, expose, content):
+        """Parses the HTML of an expose page, adding its details to the expose.
+           Like extract_content, this may run in a parse worker process"""
+        return self.extract_expose_details(expose, self.parse_page(content))
+
+    def extract_expose_details(self, expose, soup):
+        """Adds the details found on the soup of an expose page to the expose.
+           Should be implemented in the subclass"""
+        return expose
+
+    def get_page_entries(self, page):
+        """Returns the exposes on a fetched page. Pages that are unchanged since
+           the last fetch are not parsed again"""
+        if page.entries is None:
+            page.entries = self.extract_page(page)
+        return copy.deepcopy(page.entries)
+
+    def iter_pages_entries(self, urls):
+        """Generator fetching and extracting several result pages concurrently,
+           yielding the exposes of each page in the order of the URLs. The
+           SessionPool limits how many of the requests run against the portal
+           at the same time"""
+        if not urls:
+            return
+        workers = min(len(urls), SessionPool.shared().settings['max_parallel_requests'])
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            yield from executor.map(lambda url: self.get_page_entries(self.fetch_page(url)),
+                                    urls)
+
+    def get_pages_entries(self, urls):
+        """Returns the exposes of each of the result pages, see iter_pages_entries"""
+        return list(self.iter_pages_entries(urls))
+
+    @staticmethod
+    def drop_seen(entries, seen):
+        """Returns the exposes whose ids are not in 'seen', adding their ids to it"""
+        new_entries = []
+        for expose in entries:
+            if expose['id'] not in seen:
+                seen.add(expose['id'])
+                new_entries.append(expose)
+        return new_entries
+
+    @staticmethod
+    def merge_pages(pages):
+        """Joins the exposes of several result pages, dropping exposes that
+           already appeared on an earlier page"""
+        entries = []
+        seen = set()
+        for page in pages:
+            entries.extend(Crawler.drop_seen(page, seen))
+        return entries
 
     # pylint: disable=no-self-use
     def extract_data(self, soup):
@@ -28,28 +200,48 @@ class Crawler:
         raise "Method not implemented"
 
     # pylint: disable=unused-argument
-    def get_results(self, search_url, max_pages=None):
-        """Loads the exposes from the site, starting at the provided URL"""
+    def iter_results(self, search_url, max_pages=None, id_watch=None):
+        """Generator loading the exposes from the site, starting at the provided
+           URL. Exposes are yielded as soon as their result page is parsed, so
+           they can be processed while further pages are still loading. Crawlers
+           that follow further result pages stop once they reach a page of
+           exposes already processed in 'id_watch', if one is provided"""
+        if type(self).get_results is not Crawler.get_results:
+            # overrides written before id_watch existed may not accept it
+            kwargs = {} if id_watch is None else {'id_watch': id_watch}
+            yield from self.get_results(search_url, max_pages, **kwargs)
+            return
         self.__log__.debug("Got search URL %s", search_url)
 
         # load first page
-        soup = self.get_page(search_url)
+        page = self.fetch_page(search_url)
 
         # get data from first page
-        entries = self.extract_data(soup)
+        entries = self.get_page_entries(page)
         self.__log__.debug('Number of found entries: %d', len(entries))
 
-        return entries
+        yield from entries
 
-    def crawl(self, url, max_pages=None):
-        """Load as many exposes as possible from the provided URL"""
-        if re.search(self.URL_PATTERN, url):
-            try:
-                return self.get_results(url, max_pages)
-            except requests.exceptions.ConnectionError:
-                self.__log__.warning("Connection to %s failed. Retrying.", url.split('/')[2])
-                return []
-        return []
+    def get_results(self, search_url, max_pages=None, id_watch=None):
+        """Loads all the exposes from the site, starting at the provided URL"""
+        return list(self.iter_results(search_url, max_pages, id_watch=id_watch))
+
+    def crawl(self, url, max_pages=None, id_watch=None):
+        """Generator loading as many exposes as possible from the provided URL,
+           yielding them page by page"""
+        if not re.search(self.URL_PATTERN, url):
+            return
+        try:
+            yield from self.iter_results(url, max_pages, id_watch=id_watch)
+        except requests.exceptions.RequestException as error:
+            self.__log__.warning("Crawling %s failed: %s", url.split('/')[2], error)
+
+    @staticmethod
+    def has_new_exposes(entries, id_watch):
+        """True if any of the exposes has not been processed yet. Paginating
+           crawlers stop at the first page without new exposes"""
+        return any(not id_watch.is_processed(expose['id'], expose.get('crawler'))
+                   for expose in entries)
 
     def get_name(self):
         """Returns the name of this crawler"""
@@ -58,3 +250,104 @@ class Crawler:
     def get_expose_details(self, expose):
         """Loads additional detalis for an expose. Should be implemented in the subclass"""
         return expose
+
+    def load_address(self, url):
+        """Loads the address of the expose at the URL. Should be implemented in the subclass"""
+        return url
+
+    # pylint: disable=unused-argument
+    async def get_page_async(self, search_url, page_no=None):
+        """Asynchronous version of get_page"""
+        return await self.get_soup_from_url_async(search_url)
+
+    async def extract_page_async(self, page):
+        """Asynchronous version of extract_page"""
+        entries, meta = await ParsePool.shared().run_async(self.extract_content, page.content)
+        page.meta.update(meta)
+        return entries
+
+    async def get_page_entries_async(self, page):
+        """Asynchronous version of get_page_entries"""
+        if page.entries is None:
+            page.entries = await self.extract_page_async(page)
+        return copy.deepcopy(page.entries)
+
+    async def get_pages_entries_async(self, urls):
+        """Asynchronous version of get_pages_entries"""
+        async def get_entries(url):
+            return await self.get_page_entries_async(await self.fetch_page_async(url))
+        return list(await asyncio.gather(*[get_entries(url) for url in urls]))
+
+    async def fetch_page_async(self, url):
+        """Asynchronous version of fetch_page"""
+        headers = dict(self.get_headers() or {})
+        headers.update(PageCache.shared().request_headers(url))
+        resp = await AsyncSessionPool.shared().get(url, headers=headers)
+        if resp.status_code not in (200, 304):
+            self.__log__.error("Got response (%i): %s", resp.status_code, resp.content)
+        return PageCache.shared().update(url, resp)
+
+    async def fetch_detail_page_async(self, url):
+        """Asynchronous version of fetch_detail_page"""
+        cache = DetailPageCache.shared()
+        content = cache.get(url, cache.ttl_for(self.get_name(), self.DETAIL_CACHE_TTL))
+        if content is None:
+            resp = await AsyncSessionPool.shared().get(url, headers=self.get_headers())
+            if resp.status_code != 200:
+                self.__log__.error("Got response (%i): %s", resp.status_code, resp.content)
+                return resp.content
+            content = resp.content
+            cache.put(url, content)
+        return content
+
+    async def get_detail_soup_async(self, url):
+        """Asynchronous version of get_detail_soup"""
+        return self.parse_page(await self.fetch_detail_page_async(url))
+
+    async def get_soup_from_url_async(self, url):
+        """Asynchronous version of get_soup_from_url"""
+        resp = await AsyncSessionPool.shared().get(url, headers=self.get_headers())
+        if resp.status_code != 200:
+            self.__log__.error("Got response (%i): %s", resp.status_code, resp.content)
+        return self.parse_page(resp.content)
+
+    # pylint: disable=unused-argument
+    async def get_results_async(self, search_url, max_pages=None, id_watch=None):
+        """Asynchronous version of get_results. Crawlers that only override the
+           synchronous version have it run in a worker thread"""
+        if type(self).get_results is not Crawler.get_results \
+                or type(self).iter_results is not Crawler.iter_results:
+            kwargs = {} if id_watch is None else {'id_watch': id_watch}
+            return await asyncio.get_running_loop().run_in_executor(
+                None, functools.partial(self.get_results, search_url, max_pages, **kwargs))
+        self.__log__.debug("Got search URL %s", search_url)
+        page = await self.fetch_page_async(search_url)
+        entries = await self.get_page_entries_async(page)
+        self.__log__.debug('Number of found entries: %d', len(entries))
+        return entries
+
+    async def crawl_async(self, url, max_pages=None, id_watch=None):
+        """Asynchronous version of crawl"""
+        import aiohttp # pylint: disable=import-outside-toplevel
+        if re.search(self.URL_PATTERN, url):
+            try:
+                return await self.get_results_async(url, max_pages, id_watch=id_watch)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                self.__log__.warning("Crawling %s failed: %s", url.split('/')[2], error)
+                return []
+        return []
+
+    async def get_expose_details_async(self, expose):
+        """Asynchronous version of get_expose_details. Crawlers without a native
+           implementation have the synchronous version run in a worker thread"""
+        if type(self).get_expose_details is Crawler.get_expose_details:
+            return expose
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.get_expose_details, expose)
+
+    async def load_address_async(self, url):
+        """Asynchronous version of load_address. Crawlers without a native
+           implementation have the synchronous version run in a worker thread"""
+        if type(self).load_address is Crawler.load_address:
+            return url
+        return await asyncio.get_running_loop().run_in_executor(None, self.load_address, url)
@@ -10,3 +10,8 @@ class Processor:
     def process_exposes(self, exposes):
         """Apply the processor to every expose in the sequence"""
         return map(self.process_expose, exposes)
+
+    async def process_expose_async(self, expose):
+        """Asynchronous version of process_expose. Returns None if the expose
+           should be dropped from the pipeline"""
+        return self.process_expose(expose)
@@ -0,0 +1,105 @@
+"""Connection-pooled HTTP client for the asyncio crawler API. Counterpart
+   to the SessionPool used by the synchronous crawlers"""
+import asyncio
+import logging
+import weakref
+from collections import namedtuple, Counter
+
+from flathunter.sessions import SessionPool, ACCEPT_ENCODING
+from flathunter.rate_limiter import RateLimiter, RETRY_STATUS_CODES
+from flathunter.standin import rewrite_url
+
+AsyncResponse = namedtuple('AsyncResponse', ['status_code', 'content', 'headers'])
+
+class AsyncSessionPool:
+    """Wraps a single aiohttp.ClientSession whose connector opens up to
+       'max_parallel_requests' connections per host. One pool exists per event loop"""
+
+    __log__ = logging.getLogger('flathunt')
+    __pools__ = weakref.WeakKeyDictionary()
+
+    def __init__(self, settings=None):
+        if settings is None:
+            settings = SessionPool.shared().settings
+        self.settings = settings
+        self.session = None
+        self.counts = Counter()
+
+    def create_session(self):
+        """Build the aiohttp session, tracing new and reused connections"""
+        import aiohttp # pylint: disable=import-outside-toplevel
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self.on_request_start)
+        trace_config.on_connection_create_end.append(self.on_connection_created)
+        trace_config.on_connection_reuseconn.append(self.on_connection_reused)
+        connector = aiohttp.TCPConnector(limit_per_host=self.settings['max_parallel_requests'])
+        headers = {'Accept-Encoding': ACCEPT_ENCODING if self.settings['compression'] \
+                                      else 'identity'}
+        return aiohttp.ClientSession(connector=connector, headers=headers,
+                                     timeout=aiohttp.ClientTimeout(total=self.settings['timeout']),
+                                     trace_configs=[trace_config])
+
+    # pylint: disable=unused-argument
+    async def on_request_start(self, session, context, params):
+        """Count requests"""
+        self.counts['requests'] += 1
+
+    # pylint: disable=unused-argument
+    async def on_connection_created(self, session, context, params):
+        """Count newly opened connections"""
+        self.counts['connections'] += 1
+
+    # pylint: disable=unused-argument
+    async def on_connection_reused(self, session, context, params):
+        """Count requests served over a kept-alive connection"""
+        self.counts['reused'] += 1
+
+    async def get(self, url, headers=None):
+        """Fetch the URL, returning the status code and the full response body.
+           Requests are paced and retried by the shared RateLimiter"""
+        import aiohttp # pylint: disable=import-outside-toplevel
+        if self.session is None:
+            self.session = self.create_session()
+        limiter = RateLimiter.shared()
+        target = rewrite_url(url, self.settings.get('standin_url'))
+        attempt = 0
+        while True:
+            wait = limiter.delay(url)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                async with self.session.get(target, headers=headers) as response:
+                    content = await response.read()
+                    result = AsyncResponse(response.status, content, response.headers)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as error:
+                delay = limiter.retry_delay(url, attempt)
+                if delay is None:
+                    raise error
+                self.__log__.warning("Request to %s failed: %s", url, error)
+            else:
+                limiter.record(url, result.status_code)
+                if result.status_code not in RETRY_STATUS_CODES:
+                    return result
+                delay = limiter.retry_delay(url, attempt, result.headers.get('Retry-After'))
+                if delay is None:
+                    return result
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def stats(self):
+        """Counts of requests made, connections opened and connections reused"""
+        return dict(self.counts)
+
+    async def close(self):
+        """Close the session and all of its connections"""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    @staticmethod
+    def shared():
+        """Get the pool for the running event loop"""
+        loop = asyncio.get_running_loop()
+        if loop not in AsyncSessionPool.__pools__:
+            AsyncSessionPool.__pools__[loop] = AsyncSessionPool()
+        return AsyncSessionPool.__pools__[loop]
@@ -1,6 +1,8 @@
 """Wrap configuration options as an object"""
 import os
+import re
 import logging
+from urllib.parse import urlparse
 import yaml
 
 from flathunter.crawl_ebaykleinanzeigen import CrawlEbayKleinanzeigen
@@ -17,6 +19,7 @@ class Config:
                      CrawlWgGesucht(),
                      CrawlEbayKleinanzeigen(),
                      CrawlImmowelt()]
+    __routes__ = {}
 
     def __init__(self, filename=None, string=None):
         if string is not None:
@@ -50,14 +53,58 @@ class Config:
     def set_searchers(searchers):
         """Update the active search plugins"""
         Config.__searchers__ = searchers
+        Config.__routes__ = Config.build_routes()
 
     @staticmethod
     def searchers():
         """Get the list of search plugins"""
         return Config.__searchers__
 
+    @staticmethod
+    def origin_of(pattern):
+        """The origin (scheme and host) that the URL pattern consists of, or
+           None if the pattern also matches on the path or is not a literal"""
+        pattern = getattr(pattern, 'pattern', pattern)
+        if re.search(r'[.^$*+?{}\[\]|()\\]', re.sub(r'\\.', '', pattern)):
+            return None
+        parsed = urlparse(re.sub(r'\\(.)', r'\1', pattern))
+        if parsed.path not in ('', '/'):
+            return None
+        return '%s://%s' % (parsed.scheme, parsed.netloc)
+
+    @staticmethod
+    def build_routes():
+        """Index the search plugins by the origin (scheme and host) their URL
+           pattern consists of. Searchers listed after one whose pattern is not
+           a plain origin are not indexed, as that searcher takes precedence"""
+        routes = {}
+        for searcher in Config.searchers():
+            if searcher.URL_PATTERN is None:
+                continue
+            origin = Config.origin_of(searcher.URL_PATTERN)
+            if origin is None:
+                break
+            if re.search(searcher.URL_PATTERN, origin) and origin not in routes:
+                routes[origin] = searcher
+        return routes
+
+    @staticmethod
+    def searcher_for_url(url):
+        """Get the search plugin responsible for the URL, or None. URLs on an
+           indexed origin are resolved with a single dictionary lookup, all
+           others are matched against the URL patterns"""
+        parsed = urlparse(url)
+        searcher = Config.__routes__.get('%s://%s' % (parsed.scheme, parsed.netloc))
+        if searcher is not None:
+            return searcher
+        return next((searcher for searcher in Config.searchers()
+                     if searcher.URL_PATTERN is not None
+                     and re.search(searcher.URL_PATTERN, url)), None)
+
     def get_filter(self):
         """Read the configured filter"""
         builder = Filter.builder()
         builder.read_config(self.config)
         return builder.build()
+
+Config.__routes__ = Config.build_routes()
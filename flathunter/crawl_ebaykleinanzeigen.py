@@ -2,9 +2,9 @@
 import logging
 import re
 import datetime
-import requests
-from bs4 import BeautifulSoup
+from bs4 import SoupStrainer
 from flathunter.abstract_crawler import Crawler
+from flathunter.parse_pool import ParsePool
 
 class CrawlEbayKleinanzeigen(Crawler):
     """Implementation of Crawler interface for Ebay Kleinanzeigen"""
@@ -12,6 +12,7 @@ class CrawlEbayKleinanzeigen(Crawler):
     __log__ = logging.getLogger('flathunt')
     USER_AGENT = 'Mozilla/5.0 (Windows NT 6.1; Win64; x64; rv:47.0) Gecko/20100101 Firefox/47.0'
     URL_PATTERN = re.compile(r'https://www\.ebay-kleinanzeigen\.de')
+    RESULT_STRAINER = SoupStrainer(id="srchrslt-adtable")
     MONTHS = {
         "Januar": "01",
         "Februar": "02",
@@ -30,15 +31,18 @@ class CrawlEbayKleinanzeigen(Crawler):
     def __init__(self):
         logging.getLogger("requests").setLevel(logging.WARNING)
 
-    def get_soup_from_url(self, url):
-        """Creates a Soup object from the HTML at the provided URL"""
-        resp = requests.get(url, headers={'User-Agent': self.USER_AGENT})
-        if resp.status_code != 200:
-            self.__log__.error("Got response (%i): %s", resp.status_code, resp.content)
-        return BeautifulSoup(resp.content, 'html.parser')
-
     def get_expose_details(self, expose):
-        soup = self.get_page(expose['url'])
+        """Loads additional details for an expose by processing the expose detail URL"""
+        content = self.fetch_detail_page(expose['url'])
+        return ParsePool.shared().run(self.extract_expose_page, expose, content)
+
+    async def get_expose_details_async(self, expose):
+        """Asynchronous version of get_expose_details"""
+        content = await self.fetch_detail_page_async(expose['url'])
+        return await ParsePool.shared().run_async(self.extract_expose_page, expose, content)
+
+    def extract_expose_details(self, expose, soup):
+        """Adds the details found on the expose page to the expose"""
         for detail in soup.find_all('li', {"class": "addetailslist--detail"}):
             if re.match(r'Verfügbar ab', detail.text):
                 date_string = re.match(r'(\w+) (\d{4})', detail.text)
@@ -54,8 +58,7 @@ class CrawlEbayKleinanzeigen(Crawler):
         entries = list()
         soup = soup.find(id="srchrslt-adtable")
         try:
-            title_elements = soup.find_all(lambda e: e.has_attr('class')
-                                           and 'ellipsis' in e['class'])
+            title_elements = soup.find_all(class_="ellipsis")
         except AttributeError:
             return entries
         expose_ids = soup.find_all("article", class_="aditem")
@@ -113,7 +116,15 @@ class CrawlEbayKleinanzeigen(Crawler):
 
     def load_address(self, url):
         """Extract address from expose itself"""
-        expose_soup = self.get_soup_from_url(url)
+        return self.extract_address(self.get_detail_soup(url))
+
+    async def load_address_async(self, url):
+        """Asynchronous version of load_address"""
+        return self.extract_address(await self.get_detail_soup_async(url))
+
+    @staticmethod
+    def extract_address(expose_soup):
+        """Reads the address from the soup of an expose page"""
         try:
             street_raw = expose_soup.find(id="street-address").text
         except AttributeError:
@@ -0,0 +1,125 @@
+"""Concurrent execution of the crawls for all configured search URLs"""
+import queue
+import logging
+import threading
+from collections import deque, Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+class CrawlResults:
+    """Iterator over the (url, expose) pairs of running crawls. 'ready' tells
+       whether the next pair can be taken without waiting for a crawler"""
+
+    def __init__(self, pairs, ready):
+        self.pairs = pairs
+        self.ready = ready
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.pairs)
+
+class CrawlExecutor:
+    """Runs (searcher, url) crawl jobs on a bounded pool of worker threads, with
+       at most 'per_host' crawls in flight against any one host. The exposes of
+       all crawls are interleaved into one stream as soon as the crawlers yield
+       them, so a slow portal does not hold back the results of the others, and
+       the first exposes can be processed before any crawl has finished"""
+
+    __log__ = logging.getLogger('flathunt')
+
+    def __init__(self, max_workers=4, per_host=2, buffer_size=200):
+        self.max_workers = max(max_workers, 1)
+        self.per_host = max(per_host, 1)
+        self.buffer_size = buffer_size
+
+    @staticmethod
+    def put(results, item, stopped):
+        """Hand an item to the consuming thread, waiting while the buffer is
+           full. Returns False if the consumer has stopped reading"""
+        while not stopped.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def crawl_url(self, searcher, url, max_pages, id_watch, results, stopped):
+        """Crawl a single URL in a worker thread, passing (url, expose) items on
+           to the results queue as the exposes are yielded. A failing crawl is
+           abandoned. The end of the crawl is marked by a (url, None) item"""
+        try:
+            for expose in searcher.crawl(url, max_pages, id_watch=id_watch):
+                if not self.put(results, (url, expose), stopped):
+                    return
+        # pylint: disable=broad-except
+        except Exception as error:
+            self.__log__.error("Crawling %s failed: %s", url, error)
+        self.put(results, (url, None), stopped)
+
+    def crawl(self, jobs, max_pages=None, id_watch=None):
+        """Run all the jobs, yielding exposes as soon as the crawlers find them"""
+        for _, expose in self.crawl_with_urls(jobs, max_pages, id_watch):
+            yield expose
+
+    def crawl_with_urls(self, jobs, max_pages=None, id_watch=None):
+        """Like crawl, but returns CrawlResults of (url, expose) pairs naming the
+           search URL each expose was found at"""
+        results = queue.Queue(maxsize=self.buffer_size)
+        arrived = deque()
+
+        def ready():
+            # take items only up to the first expose, so the queue still bounds
+            # how far the crawlers run ahead
+            while not any(expose is not None for (_, expose) in arrived):
+                try:
+                    arrived.append(results.get_nowait())
+                except queue.Empty:
+                    return False
+            return True
+
+        return CrawlResults(self.run_jobs(jobs, max_pages, id_watch, results, arrived), ready)
+
+    def run_jobs(self, jobs, max_pages, id_watch, results, arrived):
+        """Generator running the jobs and yielding their (url, expose) pairs.
+           Items already taken from the results queue by CrawlResults.ready
+           wait in 'arrived'"""
+        queues = {}
+        for searcher, url in jobs:
+            queues.setdefault(urlparse(url).netloc, deque()).append((searcher, url))
+        running = Counter()
+        stopped = threading.Event()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            def dispatch():
+                for host, host_queue in queues.items():
+                    while host_queue and running[host] < self.per_host \
+                                      and sum(running.values()) < self.max_workers:
+                        searcher, url = host_queue.popleft()
+                        executor.submit(self.crawl_url, searcher, url, max_pages, id_watch,
+                                        results, stopped)
+                        running[host] += 1
+
+            try:
+                dispatch()
+                while sum(running.values()) > 0:
+                    url, expose = arrived.popleft() if arrived else results.get()
+                    if expose is None:
+                        running[urlparse(url).netloc] -= 1
+                        dispatch()
+                    else:
+                        yield url, expose
+            finally:
+                stopped.set()
+
+    @staticmethod
+    def from_config(config):
+        """Create an executor from the 'concurrency' config section. Returns None
+           if the crawls should run sequentially"""
+        settings = config.get('concurrency', dict()) or dict()
+        workers = settings.get('workers', 1)
+        if workers <= 1:
+            return None
+        return CrawlExecutor(max_workers=workers, per_host=settings.get('per_host', 2))
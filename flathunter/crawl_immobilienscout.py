@@ -1,12 +1,12 @@
 """Expose crawler for ImmobilienScout"""
 import logging
+import math
 import re
 import datetime
 
-import ipdb
-
+from bs4 import SoupStrainer
 from flathunter.abstract_crawler import Crawler
-from flathunter.idmaintainer import IdMaintainer
+from flathunter.parse_pool import ParsePool
 
 class CrawlImmobilienscout(Crawler):
     """Implementation of Crawler interface for ImmobilienScout"""
@@ -14,77 +14,169 @@ class CrawlImmobilienscout(Crawler):
     __log__ = logging.getLogger('flathunt')
     URL_PATTERN = re.compile(r'https://www\.immobilienscout24\.de')
     RESULT_LIMIT = 50
+    RESULT_STRAINER = SoupStrainer(id="resultListItems")
+    RESULT_COUNT_PATTERN = re.compile(
+        rb'data-is24-qa="resultlist-resultCount"[^>]*>\s*([0-9.]+)\s*<')
+    STRUCTURED_DATA_PATTERN = re.compile(rb'resultListModel:\s*')
+    DETAIL_CACHE_TTL = 24 * 60 * 60
+    DEFERRED_DETAILS = True
 
     def __init__(self):
         logging.getLogger("requests").setLevel(logging.WARNING)
-        self.id_watch = IdMaintainer('processed_ids.db' )
 
-    def get_results(self, search_url, max_pages=None):
-        """Loads the exposes from the ImmoScout site, starting at the provided URL"""
+    def iter_results(self, search_url, max_pages=None, id_watch=None):
+        """Loads the exposes from the ImmoScout site, starting at the provided URL.
+           The first page tells the number of results; the remaining pages up to
+           the RESULT_LIMIT are then fetched concurrently. Exposes are yielded
+           page by page, in the order of the pages. With an 'id_watch', pages are
+           instead followed one by one for as long as they have exposes that were
+           not processed yet"""
         # convert to paged URL
         # if '/P-' in search_url:
         #     search_url = re.sub(r"/Suche/(.+?)/P-\d+", "/Suche/\1/P-{0}", search_url)
         # else:
         #     search_url = re.sub(r"/Suche/(.+?)/", r"/Suche/\1/P-{0}/", search_url)
-        if '&pagenumber' in search_url:
-            search_url = re.sub(r"&pagenumber=[0-9]", "&pagenumber={0}", search_url)
-        else:
-            search_url = search_url + '&pagenumber={0}'
+        search_url = self.get_paged_search_url(search_url)
         self.__log__.debug("Got search URL %s", search_url)
 
         # load first page to get number of entries
         page_no = 1
-        soup = self.get_page(search_url, page_no)
-        try:
-            no_of_results = int(
-                soup.find_all(lambda e: e.has_attr('data-is24-qa') and \
-                                        e['data-is24-qa'] == 'resultlist-resultCount')[0]\
-                    .text.replace('.', ''))
-        except IndexError:
-            self.__log__.debug('Index Error occurred')
-            no_of_results = 0
+        page = self.fetch_page(search_url.format(page_no))
 
         # get data from first page
-        entries = self.extract_data(soup)
-
-        # iterate over all remaining pages
-        while len(entries) < min(no_of_results, self.RESULT_LIMIT) and \
-                (max_pages is None or page_no < max_pages):
-            self.__log__.debug(
-                'Next Page, Number of entries : %d, no of results: %d',
-                len(entries), no_of_results)
-            page_no += 1
-            soup = self.get_page(search_url, page_no)
-            cur_entry = self.extract_data(soup)
-            if cur_entry is list():
-                break
-            entries.extend(cur_entry)
-            break
-        return entries
+        entries = self.get_page_entries(page)
+        no_of_results = page.meta['result_count']
+        seen = set()
+
+        if id_watch is not None:
+            # follow the result pages until reaching already processed exposes.
+            # Whether a page has new exposes is decided before it is yielded,
+            # as processing the exposes marks them as processed
+            no_of_entries = len(entries)
+            has_new = self.has_new_exposes(entries, id_watch)
+            yield from self.drop_seen(entries, seen)
+            while has_new and no_of_entries < no_of_results \
+                    and (max_pages is None or page_no < max_pages):
+                page_no += 1
+                entries = self.get_page_entries(self.fetch_page(search_url.format(page_no)))
+                if not entries:
+                    break
+                no_of_entries += len(entries)
+                has_new = self.has_new_exposes(entries, id_watch)
+                yield from self.drop_seen(entries, seen)
+            self.__log__.debug('Incremental crawl stopped after page %d', page_no)
+            return
+
+        yield from self.drop_seen(entries, seen)
+
+        # fetch all remaining pages at once
+        page_nos = self.get_remaining_pages(len(entries), no_of_results, max_pages)
+        self.__log__.debug('Fetching pages %s, no of results: %d', list(page_nos), no_of_results)
+        for page_entries in self.iter_pages_entries([search_url.format(page_no)
+                                                     for page_no in page_nos]):
+            yield from self.drop_seen(page_entries, seen)
+
+    async def get_results_async(self, search_url, max_pages=None, id_watch=None):
+        """Asynchronous version of get_results"""
+        search_url = self.get_paged_search_url(search_url)
+        self.__log__.debug("Got search URL %s", search_url)
+
+        page_no = 1
+        page = await self.fetch_page_async(search_url.format(page_no))
+        entries = await self.get_page_entries_async(page)
+        no_of_results = page.meta['result_count']
+        if id_watch is not None:
+            cur_entry = entries
+            while self.has_new_exposes(cur_entry, id_watch) and len(entries) < no_of_results \
+                    and (max_pages is None or page_no < max_pages):
+                page_no += 1
+                page = await self.fetch_page_async(search_url.format(page_no))
+                cur_entry = await self.get_page_entries_async(page)
+                if not cur_entry:
+                    break
+                entries.extend(cur_entry)
+            return self.merge_pages([entries])
+        page_nos = self.get_remaining_pages(len(entries), no_of_results, max_pages)
+        pages = await self.get_pages_entries_async([search_url.format(page_no)
+                                                    for page_no in page_nos])
+        return self.merge_pages([entries] + pages)
+
+    def extract_content(self, content):
+        """Parses the listings on a result page, and the total number of
+           results of the search. The result list model embedded in the page is
+           used if present, the HTML only otherwise"""
+        structured = self.extract_structured_content(content)
+        if structured is not None:
+            return structured
+        return self.extract_listings(self.parse_results(content)), \
+               {'result_count': self.read_result_count(content)}
+
+    def read_result_count(self, content):
+        """Reads the total number of results of a search from the HTML of the
+           result page, which lies outside the parsed result list"""
+        match = self.RESULT_COUNT_PATTERN.search(content)
+        if match is None:
+            self.__log__.debug('No result count found')
+            return 0
+        return int(match[1].replace(b'.', b''))
+
+    def get_remaining_pages(self, page_size, no_of_results, max_pages):
+        """The numbers of the pages after the first that hold the first
+           RESULT_LIMIT results, given the number of results on the first page"""
+        if page_size == 0:
+            return range(0)
+        last_page = math.ceil(min(no_of_results, self.RESULT_LIMIT) / page_size)
+        if max_pages is not None:
+            last_page = min(last_page, max_pages)
+        return range(2, last_page + 1)
+
+    @staticmethod
+    def get_paged_search_url(search_url):
+        """Turns the search URL into a format string taking the page number"""
+        if '&pagenumber' in search_url:
+            return re.sub(r"&pagenumber=[0-9]", "&pagenumber={0}", search_url)
+        return search_url + '&pagenumber={0}'
 
     def get_page(self, search_url, page_no=None):
         """Applies a page number to a formatted search URL and fetches the exposes at that page"""
         return self.get_soup_from_url(search_url.format(page_no))
 
+    async def get_page_async(self, search_url, page_no=None):
+        """Asynchronous version of get_page"""
+        return await self.get_soup_from_url_async(search_url.format(page_no))
+
     def get_expose_details(self, expose):
         """Loads additional details for an expose by processing the expose detail URL"""
-        soup = self.get_soup_from_url(expose['url'])
+        content = self.fetch_detail_page(expose['url'])
+        return ParsePool.shared().run(self.extract_expose_page, expose, content)
+
+    async def get_expose_details_async(self, expose):
+        """Asynchronous version of get_expose_details"""
+        content = await self.fetch_detail_page_async(expose['url'])
+        return await ParsePool.shared().run_async(self.extract_expose_page, expose, content)
+
+    def extract_expose_details(self, expose, soup):
+        """Adds the photos, total price and move-in date found on the expose
+           page to the expose"""
         date = soup.find('dd', {"class": "is24qa-bezugsfrei-ab"})
         expose['from'] = datetime.datetime.now().strftime("%2d.%2m.%Y")
         if date is not None:
             if not re.match(r'.*sofort.*', date.text):
                 expose['from'] = date.text.strip()
+        expose['photos'], expose['total_price'], expose['free_from'] = self.parse_details(soup)
         return expose
 
-    # pylint: disable=too-many-locals
-    # pylint: disable=too-many-branches
     def extract_data(self, soup):
-        """Extracts all exposes from a provided Soup object"""
+        """Extracts all exposes from a provided Soup object. The details that are
+           only found on each expose's own page are loaded by get_expose_details"""
+        return self.extract_listings(soup)
+
+    # pylint: disable=too-many-locals
+    def extract_listings(self, soup):
+        """Extracts the exposes listed on a result page"""
         entries = list()
 
-        title_elements = soup.find_all(
-            lambda e: e.name == 'a' and e.has_attr('class') and \
-                      'result-list-entry__brand-title-container' in e['class'])
+        title_elements = soup.find_all('a', class_='result-list-entry__brand-title-container')
         expose_ids = list()
         expose_urls = list()
         for link in title_elements:
@@ -96,32 +188,15 @@ class CrawlImmobilienscout(Crawler):
                 expose_urls.append(link.get('href'))
         self.__log__.debug(expose_ids)
 
-        attr_container_els = soup.find_all(lambda e: e.has_attr('data-is24-qa') and \
-                                                     e['data-is24-qa'] == "attributes")
-        address_fields = soup.find_all(lambda e: e.has_attr('class') and \
-                                                 'result-list-entry__address' in e['class'])
-        gallery_elements = soup.find_all(lambda e: e.has_attr('class') and \
-                                         'result-list-entry__gallery-container' in e['class'])
-        first = True
+        attr_container_els = soup.find_all(attrs={'data-is24-qa': 'attributes'})
+        address_fields = soup.find_all(class_='result-list-entry__address')
+        gallery_elements = soup.find_all(class_='result-list-entry__gallery-container')
         for idx, title_el in enumerate(title_elements):
-            # if first:
-            #     first = False
-            #     print(idx)
             attr_els = attr_container_els[idx].find_all('dd')
             try:
                 address = address_fields[idx].text.strip()
             except AttributeError:
                 address = "No address given"
-            # photos = []
-            # sp_images = gallery_elements[idx].find("div", {"class": "sp-image-container"})
-            # import ipdb; ipdb.set_trace()
-            # if sp_images is not None:
-            #     self.__log__.info("yay, images are not empty!")
-            #     it = sp_images.find("img")
-            #     img = it["src"]
-            #     self.__log__.info(img)
-            # else:
-            #     self.__log__.error("Not found")
 
             gallery_tag = gallery_elements[idx].find("div", {"class": "gallery-container"})
             if gallery_tag is not None:
@@ -132,19 +207,17 @@ class CrawlImmobilienscout(Crawler):
                     image = image_tag["data-lazy-src"]
             else:
                 image = None
-            image_urls, total_price, free_from = self.extract_details(expose_ids[idx],expose_urls[idx])
             details = {
                 'id': expose_ids[idx],
                 'url': expose_urls[idx],
                 'image': image,
-                'photos': image_urls,
                 'title': title_el.text.strip().replace('NEU', ''),
-                'free_from': free_from,
-                'total_price': total_price,
                 'address': address,
+                'photos': [],
+                'total_price': '-',
+                'free_from': '-',
                 'crawler': self.get_name()
             }
-            # ipdb.set_trace()
             if len(attr_els) > 2:
                 details['price'] = attr_els[0].text.strip().split(' ')[0].strip()
                 details['size'] = attr_els[1].text.strip().split(' ')[0].strip() + " qm"
@@ -154,43 +227,82 @@ class CrawlImmobilienscout(Crawler):
                 details['price'] = ''
                 details['size'] = ''
                 details['rooms'] = ''
-            # print entries
-            exist = False
-            for expose in entries:
-                if expose_id == expose["id"]:
-                    exist = True
-                    break
-            if not exist:
+            if not any(expose['id'] == details['id'] for expose in entries):
                 entries.append(details)
-            # else:
-            #     print("skipping")
-            
 
-        # self.__log__.info('extracted: %d', entries)
         return entries
 
-    def extract_details(self, id, url):
-        db_entry = self.id_watch.get_expose_by_id(id)
-        if db_entry is None:
-            self.__log__.info(f"searching {url}")
-            # ipdb.set_trace()
-            image_urls = []
-            soup = self.get_page(url)
-            image_tags = soup.find_all(lambda e: e.has_attr('class') and 'sp-image' in e['class'])
-            for t in image_tags:
-                try:
-                    image_url = t['data-src'].split("/ORIG")[0]
-                    image_urls.append(image_url)
-                except:
-                    self.__log__.debug("cant get the image url")
-            total_price_tag = soup.find(lambda e: e.has_attr('class') and 'is24qa-gesamtmiete' in e['class'])
-            total_price = "-"
-            if total_price_tag is not None:
-                total_price = total_price_tag.text.strip()
-            free_from = "-"
-            free_from_tag = soup.find(lambda e: e.has_attr('class') and 'is24qa-bezugsfrei-ab' in e['class'])
-            if free_from_tag is not None:
-                free_from = free_from_tag.text.strip()
-            return image_urls, total_price, free_from
-        else:
-            return db_entry["photos"], db_entry["total_price"], db_entry["free_from"]
\ No newline at end of file
+    def extract_structured(self, payload):
+        """Builds the exposes, and the total number of results, from the result
+           list model of the page"""
+        result_list = payload['searchResponseModel']['resultlist.resultlist']
+        entries = list()
+        for group in result_list.get('resultlistEntries', []):
+            listed = group.get('resultlistEntry', [])
+            # a single entry is not wrapped in a list
+            if isinstance(listed, dict):
+                listed = [listed]
+            for entry in listed:
+                details = self.structured_entry_to_expose(entry)
+                if not any(expose['id'] == details['id'] for expose in entries):
+                    entries.append(details)
+        return entries, {'result_count': int(result_list['paging']['numberOfHits'])}
+
+    def structured_entry_to_expose(self, entry):
+        """Builds an expose from an entry of the result list model, with the
+           values formatted as on the result page"""
+        real_estate = entry['resultlist.realEstate']
+        expose_id = int(entry['@id'])
+        address = real_estate.get('address', {})
+        description = address.get('description', {}).get('text')
+        if description is None:
+            street = ' '.join(part for part in [address.get('street'),
+                                                address.get('houseNumber')] if part)
+            description = ', '.join(part for part in [street, address.get('quarter'),
+                                                      address.get('city')] if part)
+        picture = real_estate.get('titlePicture') or {}
+        details = {
+            'id': expose_id,
+            'url': 'https://www.immobilienscout24.de/expose/' + str(expose_id),
+            'image': picture.get('@xlink.href'),
+            'title': real_estate.get('title', '').strip(),
+            'address': description or "No address given",
+            'photos': [],
+            'total_price': '-',
+            'free_from': '-',
+            'crawler': self.get_name()
+        }
+        try:
+            details['price'] = self.format_number(real_estate['price']['value'])
+            details['size'] = self.format_number(real_estate['livingSpace']) + " qm"
+            details['rooms'] = self.format_number(real_estate['numberOfRooms'])
+        except KeyError:
+            details['price'] = ''
+            details['size'] = ''
+            details['rooms'] = ''
+        return details
+
+    @staticmethod
+    def format_number(value):
+        """Formats a number as the result page shows it, e.g. 1.250 or 2,5"""
+        text = '{:,.2f}'.format(float(value)).rstrip('0').rstrip('.')
+        return text.replace(',', ' ').replace('.', ',').replace(' ', '.')
+
+    def parse_details(self, soup):
+        """Reads the photos, total price and move-in date from an expose page"""
+        image_urls = []
+        image_tags = soup.find_all(class_='sp-image')
+        for tag in image_tags:
+            try:
+                image_urls.append(tag['data-src'].split("/ORIG")[0])
+            except KeyError:
+                self.__log__.debug("cant get the image url")
+        total_price_tag = soup.find(class_='is24qa-gesamtmiete')
+        total_price = "-"
+        if total_price_tag is not None:
+            total_price = total_price_tag.text.strip()
+        free_from = "-"
+        free_from_tag = soup.find(class_='is24qa-bezugsfrei-ab')
+        if free_from_tag is not None:
+            free_from = free_from_tag.text.strip()
+        return image_urls, total_price, free_from
@@ -3,20 +3,32 @@ import logging
 import re
 import datetime
 
+from bs4 import SoupStrainer
 from flathunter.abstract_crawler import Crawler
+from flathunter.parse_pool import ParsePool
 
 class CrawlImmowelt(Crawler):
     """Implementation of Crawler interface for ImmoWelt"""
 
     __log__ = logging.getLogger('flathunt')
     URL_PATTERN = re.compile(r'https://www\.immowelt\.de')
+    RESULT_STRAINER = SoupStrainer(id="listItemWrapperFixed")
 
     def __init__(self):
         logging.getLogger("requests").setLevel(logging.WARNING)
 
     def get_expose_details(self, expose):
         """Loads additional details for an expose by processing the expose detail URL"""
-        soup = self.get_page(expose['url'])
+        content = self.fetch_detail_page(expose['url'])
+        return ParsePool.shared().run(self.extract_expose_page, expose, content)
+
+    async def get_expose_details_async(self, expose):
+        """Asynchronous version of get_expose_details"""
+        content = await self.fetch_detail_page_async(expose['url'])
+        return await ParsePool.shared().run_async(self.extract_expose_page, expose, content)
+
+    def extract_expose_details(self, expose, soup):
+        """Adds the details found on the expose page to the expose"""
         immo_div = soup.find("div", {"id": "divImmobilie"})
         if immo_div is not None:
             details = immo_div.find_all("div", {"class": "clear"})
@@ -2,8 +2,7 @@
 import logging
 import re
 
-import requests
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from flathunter.abstract_crawler import Crawler
 
 class CrawlWgGesucht(Crawler):
@@ -11,6 +10,8 @@ class CrawlWgGesucht(Crawler):
 
     __log__ = logging.getLogger('flathunt')
     URL_PATTERN = re.compile(r'https://www\.wg-gesucht\.de')
+    LISTING_ID = re.compile(r'^liste-')
+    RESULT_STRAINER = SoupStrainer(id=LISTING_ID)
 
     def __init__(self):
         logging.getLogger("requests").setLevel(logging.WARNING)
@@ -20,7 +21,7 @@ class CrawlWgGesucht(Crawler):
         """Extracts all exposes from a provided Soup object"""
         entries = list()
 
-        findings = soup.find_all(lambda e: e.has_attr('id') and e['id'].startswith('liste-'))
+        findings = soup.find_all(id=self.LISTING_ID)
         existing_findings = list(
             [e for e in findings if e.has_attr('class') and not 'display-none' in e['class']])
 
@@ -72,11 +73,18 @@ class CrawlWgGesucht(Crawler):
 
         return entries
 
-    @staticmethod
-    def load_address(url):
+    def load_address(self, url):
         """Extract address from expose itself"""
-        response = requests.get(url)
-        flat = BeautifulSoup(response.content, 'lxml')
+        return self.extract_address(self.fetch_detail_page(url))
+
+    async def load_address_async(self, url):
+        """Asynchronous version of load_address"""
+        return self.extract_address(await self.fetch_detail_page_async(url))
+
+    @staticmethod
+    def extract_address(content):
+        """Reads the address from the HTML of an expose page"""
+        flat = BeautifulSoup(content, 'lxml')
         address = ' '.join(flat.find('div', {"class": "col-sm-4 mb10"})\
                      .find("a", {"href": "#"}).text.strip().split())
         return address
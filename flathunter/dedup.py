@@ -0,0 +1,89 @@
+"""Deduplication of the exposes crawled in one hunt. When configured search
+   URLs overlap, e.g. the same district in different price bands, the same
+   expose is found at several of them. Only the first copy is passed on to
+   the processors; the others are counted, per pair of URLs, to show which
+   searches are redundant"""
+import logging
+from collections import Counter, deque
+
+class CrawlDeduplicator:
+    """Drops exposes already found earlier in the same hunt, keyed on the
+       crawler and the expose id, and remembers at which URLs each was found"""
+
+    __log__ = logging.getLogger('flathunt')
+
+    def __init__(self):
+        self.sources = {}
+        self.found = Counter()
+        self.overlap = Counter()
+        self.duplicates = 0
+        self.pairs = None
+        self.ahead = deque()
+
+    @staticmethod
+    def key(expose):
+        """Exposes of different portals may share an id"""
+        return (expose.get('crawler'), expose['id'])
+
+    def is_new(self, url, expose):
+        """Record that the expose was found at the URL. Returns False if it was
+           already found before, at this or another URL"""
+        key = self.key(expose)
+        urls = self.sources.get(key)
+        if urls is None:
+            self.sources[key] = [url]
+            self.found[url] += 1
+            return True
+        self.duplicates += 1
+        if url not in urls:
+            for other in urls:
+                self.overlap[tuple(sorted((other, url)))] += 1
+            urls.append(url)
+            self.found[url] += 1
+        return False
+
+    def deduplicate(self, exposes):
+        """Generator passing on the first copy of each expose of the (url, expose)
+           pairs"""
+        self.pairs = iter(exposes)
+        while True:
+            if self.ahead:
+                yield self.ahead.popleft()
+                continue
+            try:
+                url, expose = next(self.pairs)
+            except StopIteration:
+                return
+            if self.is_new(url, expose):
+                yield expose
+
+    def ready(self):
+        """True if the next expose can be passed on without waiting for the
+           crawlers. The pairs have to tell this with a 'ready' method of their
+           own; new exposes among the pairs they have ready are taken ahead"""
+        if not hasattr(self.pairs, 'ready'):
+            return bool(self.ahead)
+        while not self.ahead and self.pairs.ready():
+            url, expose = next(self.pairs)
+            if self.is_new(url, expose):
+                self.ahead.append(expose)
+        return bool(self.ahead)
+
+    def source_of(self, expose):
+        """The URL at which the expose was found first, if it was crawled"""
+        urls = self.sources.get(self.key(expose))
+        return None if urls is None else urls[0]
+
+    def overlaps(self):
+        """Number of shared exposes for every pair of URLs that share any"""
+        return dict(self.overlap)
+
+    def log_stats(self):
+        """Write the dropped duplicates, and the overlap of the URLs, to the log"""
+        if self.duplicates == 0:
+            return
+        self.__log__.info("Dropped %d duplicate exposes", self.duplicates)
+        for (url_a, url_b), shared in self.overlap.most_common():
+            smaller = min(self.found[url_a], self.found[url_b])
+            self.__log__.info("%d exposes (%d%% of the smaller search) found at both %s and %s",
+                              shared, 100 * shared / smaller, url_a, url_b)
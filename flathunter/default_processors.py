@@ -1,18 +1,29 @@
 """Built-in expose processor implementations. Used by the processor pipelines
    in flathunter and in the webservice"""
-import re
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
 from flathunter.abstract_processor import Processor
 
 class Filter(Processor):
     """Filter processor implementation. Applies a filter to the list of exposes"""
 
-    def __init__(self, config, filter_set):
+    def __init__(self, config, filter_set, ready=None):
         self.config = config
         self.filter = filter_set
+        self.ready = ready
 
     def process_exposes(self, exposes):
-        return self.filter.filter(exposes)
+        return self.filter.filter(exposes, self.ready)
+
+    async def process_expose_async(self, expose):
+        """Drop the expose unless it passes the filter"""
+        if self.filter.is_interesting_expose(expose):
+            return expose
+        return None
 
 class AddressResolver(Processor):
     """Processor to extract apartment addresses from expose links"""
@@ -25,24 +36,75 @@ class AddressResolver(Processor):
         """Fetches the expose from the expose URL and extracts the address"""
         if expose['address'].startswith('http'):
             url = expose['address']
-            for searcher in self.config.searchers():
-                if re.search(searcher.URL_PATTERN, url):
-                    expose['address'] = searcher.load_address(url)
-                    self.__log__.debug("Loaded address %s for url %s", expose['address'], url)
-                    break
+            searcher = self.config.searcher_for_url(url)
+            if searcher is not None:
+                expose['address'] = searcher.load_address(url)
+                self.__log__.debug("Loaded address %s for url %s", expose['address'], url)
+        return expose
+
+    async def process_expose_async(self, expose):
+        """Asynchronous version of process_expose"""
+        if expose['address'].startswith('http'):
+            url = expose['address']
+            searcher = self.config.searcher_for_url(url)
+            if searcher is not None:
+                expose['address'] = await searcher.load_address_async(url)
+                self.__log__.debug("Loaded address %s for url %s", expose['address'], url)
         return expose
 
 class CrawlExposeDetails(Processor):
-    """Processor to extract additional apartment details by parsing page at expose URL"""
+    """Processor to extract additional apartment details by parsing page at expose URL.
+       The pages of up to 'concurrency.detail_workers' exposes are fetched at once.
+       With 'deferred_only', only exposes of crawlers with DEFERRED_DETAILS are loaded"""
+    __log__ = logging.getLogger('flathunt')
 
-    def __init__(self, config):
+    def __init__(self, config, deferred_only=False):
         self.config = config
+        self.deferred_only = deferred_only
+        self.workers = (config.get('concurrency', dict()) or dict()).get('detail_workers', 4)
+
+    def searcher_for(self, expose):
+        """The searcher to load the details of the expose with, if any"""
+        searcher = self.config.searcher_for_url(expose['url'])
+        if searcher is None or (self.deferred_only and not searcher.DEFERRED_DETAILS):
+            return None
+        return searcher
 
     def process_expose(self, expose):
         """Fetches the page at exposes['url'] and extracts additional details from it"""
-        for searcher in self.config.searchers():
-            if re.search(searcher.URL_PATTERN, expose['url']):
+        searcher = self.searcher_for(expose)
+        if searcher is not None:
+            try:
                 expose = searcher.get_expose_details(expose)
+            except requests.exceptions.RequestException as error:
+                self.__log__.warning("Loading details of %s failed: %s", expose['url'], error)
+        return expose
+
+    def process_exposes(self, exposes):
+        """Fetch the details of the exposes concurrently, keeping their order"""
+        if self.workers <= 1:
+            return super().process_exposes(exposes)
+        return self.process_concurrently(exposes)
+
+    def process_concurrently(self, exposes):
+        """Generator running process_expose on a pool of worker threads. Only
+           as many exposes as there are workers are taken from the stream ahead
+           of the one being yielded, so exposes are passed on while the crawl
+           is still running"""
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pending = deque()
+            for expose in exposes:
+                pending.append(executor.submit(self.process_expose, expose))
+                if len(pending) >= self.workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    async def process_expose_async(self, expose):
+        """Asynchronous version of process_expose"""
+        searcher = self.searcher_for(expose)
+        if searcher is not None:
+            expose = await searcher.get_expose_details_async(expose)
         return expose
 
 class LambdaProcessor(Processor):
@@ -0,0 +1,133 @@
+"""On-disk cache for expose detail pages. Expose pages are fetched when
+   loading details and addresses, and again whenever an expose shows up in
+   a later crawl: the cache keeps the responses in an SQLite file, so that
+   they survive restarts, and expires them after a per-portal TTL"""
+import time
+import logging
+import threading
+import sqlite3 as lite
+from collections import Counter
+
+class DetailPageCache:
+    """Size-bounded store of detail page responses, keyed by URL. When the
+       total size exceeds 'max_size' bytes, the least recently used pages
+       are evicted. Without a path, nothing is cached"""
+
+    __log__ = logging.getLogger('flathunt')
+    __shared__ = None
+
+    def __init__(self, path=None, max_size=50 * 1024 * 1024, ttls=None):
+        self.path = path
+        self.max_size = max_size
+        self.ttls = ttls if ttls is not None else {}
+        self.threadlocal = threading.local()
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def get_connection(self):
+        """Connects to the SQLite database. Connections are thread-local"""
+        connection = getattr(self.threadlocal, 'connection', None)
+        if connection is None:
+            try:
+                connection = lite.connect(self.path)
+                cur = connection.cursor()
+                cur.execute('CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, \
+                                    content BLOB, size INTEGER, fetched REAL, accessed REAL)')
+                cur.execute('CREATE INDEX IF NOT EXISTS pages_accessed ON pages (accessed)')
+                connection.commit()
+            except lite.Error as error:
+                self.__log__.error("Error %s:", error.args[0])
+                raise error
+            self.threadlocal.connection = connection
+        return connection
+
+    def count(self, key, value=1):
+        """Increment one of the statistics counters"""
+        with self.lock:
+            self.counts[key] += value
+
+    def ttl_for(self, crawler_name, default):
+        """Number of seconds that pages loaded by the named crawler are kept"""
+        return self.ttls.get(crawler_name, default)
+
+    def get(self, url, ttl):
+        """Returns the cached content of the URL, or None if the page is not
+           cached or older than 'ttl' seconds"""
+        if self.path is None:
+            return None
+        connection = self.get_connection()
+        cur = connection.cursor()
+        cur.execute('SELECT content, fetched FROM pages WHERE url = ?', (url,))
+        row = cur.fetchone()
+        now = time.time()
+        if row is None:
+            self.count('misses')
+            return None
+        if now - row[1] > ttl:
+            self.count('expired')
+            cur.execute('DELETE FROM pages WHERE url = ?', (url,))
+            connection.commit()
+            return None
+        self.count('hits')
+        cur.execute('UPDATE pages SET accessed = ? WHERE url = ?', (now, url))
+        connection.commit()
+        return row[0]
+
+    def put(self, url, content):
+        """Stores the content of the URL, evicting least recently used pages
+           if the cache grows beyond its maximum size"""
+        if self.path is None:
+            return
+        now = time.time()
+        connection = self.get_connection()
+        cur = connection.cursor()
+        cur.execute('INSERT OR REPLACE INTO pages (url, content, size, fetched, accessed) \
+                     VALUES (?, ?, ?, ?, ?)', (url, content, len(content), now, now))
+        cur.execute('SELECT SUM(size) FROM pages')
+        excess = (cur.fetchone()[0] or 0) - self.max_size
+        if excess > 0:
+            evicted = []
+            for (evict_url, size) in cur.execute('SELECT url, size FROM pages \
+                                                  ORDER BY accessed').fetchall():
+                if excess <= 0:
+                    break
+                evicted.append((evict_url,))
+                excess -= size
+            cur.executemany('DELETE FROM pages WHERE url = ?', evicted)
+            self.count('evicted', len(evicted))
+        connection.commit()
+
+    def stats(self):
+        """Counts of cache hits, misses, expired and evicted pages"""
+        with self.lock:
+            return dict(self.counts)
+
+    def log_stats(self):
+        """Write the cache statistics to the log"""
+        if self.path is None:
+            return
+        stats = self.stats()
+        self.__log__.info("Detail pages: %d cached, %d not cached, %d expired, %d evicted",
+                          stats.get('hits', 0), stats.get('misses', 0),
+                          stats.get('expired', 0), stats.get('evicted', 0))
+
+    @staticmethod
+    def configure(settings, default_path=None):
+        """Replace the shared cache with one using the provided settings"""
+        if settings is None:
+            settings = {}
+        path = settings.get('path', default_path)
+        if not settings.get('enabled', True):
+            path = None
+        DetailPageCache.__shared__ = DetailPageCache(
+            path=path,
+            max_size=settings.get('max_size_mb', 50) * 1024 * 1024,
+            ttls=settings.get('ttl', {}))
+        return DetailPageCache.__shared__
+
+    @staticmethod
+    def shared():
+        """Get the cache shared by all crawlers"""
+        if DetailPageCache.__shared__ is None:
+            DetailPageCache.__shared__ = DetailPageCache()
+        return DetailPageCache.__shared__
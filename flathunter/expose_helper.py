@@ -0,0 +1,29 @@
+"""Parsing of the numbers in the text fields of exposes"""
+import re
+
+class ExposeHelper:
+    """Helper functions for extracting data from expose text"""
+
+    @staticmethod
+    def get_price(expose):
+        """Extracts the price from a price text"""
+        price_match = re.search(r'\d+([\.,]\d+)?', expose['price'])
+        if price_match is None:
+            return None
+        return float(price_match[0].replace(".", "").replace(",", "."))
+
+    @staticmethod
+    def get_size(expose):
+        """Extracts the size from a size text"""
+        size_match = re.search(r'\d+([\.,]\d+)?', expose['size'])
+        if size_match is None:
+            return None
+        return float(size_match[0].replace(",", "."))
+
+    @staticmethod
+    def get_rooms(expose):
+        """Extracts the number of rooms from a room text"""
+        rooms_match = re.search(r'\d+([\.,]\d+)?', expose['rooms'])
+        if rooms_match is None:
+            return None
+        return float(rooms_match[0].replace(",", "."))
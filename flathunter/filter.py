@@ -3,33 +3,7 @@ from functools import reduce
 import re
 
 from flathunter.idmaintainer import AlreadySeenFilter
-
-class ExposeHelper:
-    """Helper functions for extracting data from expose text"""
-
-    @staticmethod
-    def get_price(expose):
-        """Extracts the price from a price text"""
-        price_match = re.search(r'\d+([\.,]\d+)?', expose['price'])
-        if price_match is None:
-            return None
-        return float(price_match[0].replace(".", "").replace(",", "."))
-
-    @staticmethod
-    def get_size(expose):
-        """Extracts the size from a size text"""
-        size_match = re.search(r'\d+([\.,]\d+)?', expose['size'])
-        if size_match is None:
-            return None
-        return float(size_match[0].replace(",", "."))
-
-    @staticmethod
-    def get_rooms(expose):
-        """Extracts the number of rooms from a room text"""
-        rooms_match = re.search(r'\d+([\.,]\d+)?', expose['rooms'])
-        if rooms_match is None:
-            return None
-        return float(rooms_match[0].replace(",", "."))
+from flathunter.expose_helper import ExposeHelper
 
 class MaxPriceFilter:
     """Exclude exposes above a given price"""
@@ -44,6 +18,10 @@ class MaxPriceFilter:
             return True
         return price <= self.max_price
 
+    def to_sql(self):
+        """The filter as a condition on the price column of the exposes table"""
+        return '(price IS NULL OR price <= ?)', [self.max_price]
+
 class MinPriceFilter:
     """Exclude exposes below a given price"""
 
@@ -57,6 +35,10 @@ class MinPriceFilter:
             return True
         return price >= self.min_price
 
+    def to_sql(self):
+        """The filter as a condition on the price column of the exposes table"""
+        return '(price IS NULL OR price >= ?)', [self.min_price]
+
 class MaxSizeFilter:
     """Exclude exposes above a given size"""
 
@@ -70,6 +52,10 @@ class MaxSizeFilter:
             return True
         return size <= self.max_size
 
+    def to_sql(self):
+        """The filter as a condition on the size column of the exposes table"""
+        return '(size IS NULL OR size <= ?)', [self.max_size]
+
 class MinSizeFilter:
     """Exclude exposes below a given size"""
 
@@ -83,6 +69,10 @@ class MinSizeFilter:
             return True
         return size >= self.min_size
 
+    def to_sql(self):
+        """The filter as a condition on the size column of the exposes table"""
+        return '(size IS NULL OR size >= ?)', [self.min_size]
+
 class MaxRoomsFilter:
     """Exclude exposes above a given number of rooms"""
 
@@ -96,6 +86,10 @@ class MaxRoomsFilter:
             return True
         return rooms <= self.max_rooms
 
+    def to_sql(self):
+        """The filter as a condition on the rooms column of the exposes table"""
+        return '(rooms IS NULL OR rooms <= ?)', [self.max_rooms]
+
 class MinRoomsFilter:
     """Exclude exposes below a given number of rooms"""
 
@@ -109,6 +103,10 @@ class MinRoomsFilter:
             return True
         return rooms >= self.min_rooms
 
+    def to_sql(self):
+        """The filter as a condition on the rooms column of the exposes table"""
+        return '(rooms IS NULL OR rooms >= ?)', [self.min_rooms]
+
 class TitleFilter:
     """Exclude exposes whose titles match the provided terms"""
 
@@ -184,6 +182,8 @@ class FilterBuilder:
 class Filter:
     """Abstract filter object"""
 
+    BATCH_SIZE = 50
+
     def __init__(self, filters):
         self.filters = filters
 
@@ -192,9 +192,52 @@ class Filter:
         return reduce((lambda x, y: x and y),
                       map((lambda x: x.is_interesting(expose)), self.filters), True)
 
-    def filter(self, exposes):
-        """Apply all filters to every expose in the list"""
-        return filter(self.is_interesting_expose, exposes)
+    def to_sql(self):
+        """Splits the filters into a SQL condition on the typed columns of the
+           exposes table, with its parameters, and a Filter of the rest, which
+           can only be applied to the exposes themselves"""
+        conditions = []
+        params = []
+        rest = []
+        for expose_filter in self.filters:
+            if hasattr(expose_filter, 'to_sql'):
+                condition, condition_params = expose_filter.to_sql()
+                conditions.append(condition)
+                params.extend(condition_params)
+            else:
+                rest.append(expose_filter)
+        return ' AND '.join(conditions) or '1', params, Filter(rest)
+
+    def filter(self, exposes, ready=None):
+        """Apply all filters to every expose in the sequence. The exposes are
+           filtered in batches of up to BATCH_SIZE, so that filters that look
+           them up in the database can do so with one query per batch. A batch
+           never waits for exposes still being crawled: a list is filtered in
+           full batches, any other sequence only adds to the batch while the
+           'ready' callable tells that its next expose is available at once"""
+        materialized = isinstance(exposes, (list, tuple))
+        batch = []
+        for expose in exposes:
+            batch.append(expose)
+            if len(batch) == self.BATCH_SIZE \
+                    or not (materialized or (ready is not None and ready())):
+                yield from self.filter_batch(batch)
+                batch = []
+        yield from self.filter_batch(batch)
+
+    def filter_batch(self, exposes):
+        """Apply all filters to a batch of exposes. Filters with an
+           'is_interesting_batch' method get the whole batch at once"""
+        if not exposes:
+            return []
+        verdicts = []
+        for expose_filter in self.filters:
+            if hasattr(expose_filter, 'is_interesting_batch'):
+                verdicts.append(expose_filter.is_interesting_batch(exposes))
+            else:
+                verdicts.append([expose_filter.is_interesting(expose) for expose in exposes])
+        return [expose for (idx, expose) in enumerate(exposes)
+                if all(verdict[idx] for verdict in verdicts)]
 
     @staticmethod
     def builder():
@@ -1,11 +1,14 @@
 """Calculate Google-Maps distances between specific locations and the target flat"""
+import asyncio
+import json
 import logging
 import datetime
 import time
 import urllib
-import requests
 
 from flathunter.abstract_processor import Processor
+from flathunter.sessions import SessionPool
+from flathunter.async_sessions import AsyncSessionPool
 
 class GMapsDurationProcessor(Processor):
     """Implementation of Processor class to calculate travel durations"""
@@ -24,9 +27,19 @@ class GMapsDurationProcessor(Processor):
         expose['durations'] = self.get_formatted_durations(expose['address']).strip()
         return expose
 
-    def get_formatted_durations(self, address):
-        """Return a formatted list of GoogleMaps durations"""
-        out = ""
+    async def process_expose_async(self, expose):
+        """Asynchronous version of process_expose. All durations for the
+           expose are requested concurrently"""
+        routes = self.get_routes()
+        durations = await asyncio.gather(*[
+            self.get_gmaps_distance_async(expose['address'], dest, gm_id)
+            for (_, _, dest, gm_id) in routes])
+        expose['durations'] = self.format_durations(routes, durations).strip()
+        return expose
+
+    def get_routes(self):
+        """List the (name, title, destination, mode) of each configured duration"""
+        routes = []
         for duration in self.config.get('durations', list()):
             if 'destination' in duration and 'name' in duration:
                 dest = duration.get('destination')
@@ -34,13 +47,37 @@ class GMapsDurationProcessor(Processor):
                 for mode in duration.get('modes', list()):
                     if 'gm_id' in mode and 'title' in mode \
                                        and 'key' in self.config.get('google_maps_api', dict()):
-                        duration = self.get_gmaps_distance(address, dest, mode['gm_id'])
-                        out += "> %s (%s): %s\n" % (name, mode['title'], duration)
+                        routes.append((name, mode['title'], dest, mode['gm_id']))
+        return routes
 
+    @staticmethod
+    def format_durations(routes, durations):
+        """Format the durations calculated for each route"""
+        out = ""
+        for (name, title, _, _), duration in zip(routes, durations):
+            out += "> %s (%s): %s\n" % (name, title, duration)
         return out.strip()
 
+    def get_formatted_durations(self, address):
+        """Return a formatted list of GoogleMaps durations"""
+        routes = self.get_routes()
+        durations = [self.get_gmaps_distance(address, dest, gm_id)
+                     for (_, _, dest, gm_id) in routes]
+        return self.format_durations(routes, durations)
+
     def get_gmaps_distance(self, address, dest, mode):
         """Get the distance"""
+        url = self.get_gmaps_url(address, dest, mode)
+        return self.parse_gmaps_result(address, SessionPool.shared().get(url).json())
+
+    async def get_gmaps_distance_async(self, address, dest, mode):
+        """Asynchronous version of get_gmaps_distance"""
+        url = self.get_gmaps_url(address, dest, mode)
+        response = await AsyncSessionPool.shared().get(url)
+        return self.parse_gmaps_result(address, json.loads(response.content))
+
+    def get_gmaps_url(self, address, dest, mode):
+        """Build the Distance Matrix API URL for the route"""
         # get timestamp for next monday at 9:00:00 o'clock
         now = datetime.datetime.today().replace(hour=9, minute=0, second=0)
         next_monday = now + datetime.timedelta(days=(7 - now.weekday()))
@@ -62,10 +99,12 @@ class GMapsDurationProcessor(Processor):
             mode = 'driving'
             base_url = base_url.replace('&key={key}', '')
 
-        # retrieve the result
-        url = base_url.format(dest=dest, mode=mode, origin=address,
-                              key=gm_key, arrival=arrival_time)
-        result = requests.get(url).json()
+        # build the request URL
+        return base_url.format(dest=dest, mode=mode, origin=address,
+                               key=gm_key, arrival=arrival_time)
+
+    def parse_gmaps_result(self, address, result):
+        """Pick the fastest route from the Distance Matrix API response"""
         if result['status'] != 'OK':
             self.__log__.error("Failed retrieving distance to address %s: %s", address, result)
             return None
@@ -1,17 +1,25 @@
 """Storage back-end implementation using Google Cloud Firestore"""
 import logging
 import datetime
+from contextlib import nullcontext
 import pytz
 import firebase_admin
 from firebase_admin import credentials
 from firebase_admin import firestore
 
 from flathunter.config import Config
+from flathunter.idmaintainer import typed_columns
+from flathunter.rollups import expose_buckets, bucket_key, parse_bucket_key
+from flathunter.seen_set import SeenSet
 
 class GoogleCloudIdMaintainer:
     """Storage back-end - implementation of IdMaintainer API"""
     __log__ = logging.getLogger('flathunt')
 
+    # Firestore allows at most 500 writes per transaction
+    BATCH_SIZE = 500
+    seen_set = None
+
     def __init__(self):
         project_id = Config().get('google_cloud_project_id')
         if project_id is None:
@@ -21,23 +29,124 @@ class GoogleCloudIdMaintainer:
         })
         self.database = firestore.client()
 
-    def mark_processed(self, expose_id):
+    def configure_seen_set(self, settings):
+        """Keeps the processed ids in memory as well, if enabled in the settings,
+           so that most lookups need no request. Loading the set reads the whole
+           'processed' collection on every start of an instance, so it is off
+           by default"""
+        if settings is None:
+            settings = {}
+        self.seen_set = None
+        if settings.get('enabled', False):
+            self.seen_set = SeenSet(self.iter_processed, settings.get('exclusive', False))
+
+    # pylint: disable=no-self-use
+    def unit_of_work(self):
+        """Firestore writes every document on its own, so there is nothing to
+           group"""
+        return nullcontext(self)
+
+    def flush(self):
+        """Every write is already stored"""
+
+    def iter_processed(self):
+        """Generator over the (id, crawler) pairs of all processed exposes, in
+           the order of the ids. The documents are keyed on the id alone, so
+           they apply to every crawler"""
+        for doc in self.database.collection(u'processed').order_by(u'id').stream():
+            yield (doc.to_dict()[u'id'], None)
+
+    def log_stats(self):
+        """Write the statistics of the seen set to the log"""
+        if self.seen_set is not None:
+            self.seen_set.log_stats()
+
+    def mark_processed(self, expose_id, crawler=None):
         """Mark exposes as processed when we have processed them"""
         self.__log__.debug('mark_processed(%d)', expose_id)
-        self.database.collection(u'processed').document(str(expose_id)).set({u'id': expose_id})
+        self.database.collection(u'processed').document(str(expose_id))\
+            .set({u'id': expose_id, u'crawler': crawler})
+        if self.seen_set is not None:
+            self.seen_set.add_many([(expose_id, None)])
 
-    def is_processed(self, expose_id):
-        """Returns true if an expose has already been marked as processed"""
+    # pylint: disable=unused-argument
+    def is_processed(self, expose_id, crawler=None):
+        """Returns true if an expose has already been marked as processed. The
+           documents are keyed on the expose id alone, so the crawler is not
+           taken into account"""
+        if self.seen_set is not None:
+            return self.seen_set.is_processed(expose_id, crawler, self.lookup_processed)
+        return self.lookup_processed(expose_id, crawler)
+
+    def lookup_processed(self, expose_id, crawler=None):
+        """Reads whether an expose has been marked as processed"""
         self.__log__.debug('is_processed(%d)', expose_id)
         doc = self.database.collection(u'processed').document(str(expose_id))
         return doc.get().exists
 
+    def filter_unseen(self, keys):
+        """Returns those of the (id, crawler) pairs that have not been marked as
+           processed, reading all their documents in one request"""
+        if self.seen_set is not None:
+            return self.seen_set.filter_unseen(keys, self.query_unseen)
+        return self.query_unseen(keys)
+
+    def query_unseen(self, keys):
+        """Reads which of the (id, crawler) pairs have not been marked as
+           processed"""
+        keys = list(keys)
+        processed = set()
+        for start in range(0, len(keys), self.BATCH_SIZE):
+            references = [self.database.collection(u'processed').document(str(expose_id))
+                          for (expose_id, _) in keys[start:start + self.BATCH_SIZE]]
+            processed.update(doc.id for doc in self.database.get_all(references) if doc.exists)
+        return [(expose_id, crawler) for (expose_id, crawler) in keys
+                if str(expose_id) not in processed]
+
+    def mark_processed_many(self, keys):
+        """Mark the exposes with the (id, crawler) pairs as processed, in one
+           transaction per BATCH_SIZE exposes"""
+        keys = list(keys)
+        for start in range(0, len(keys), self.BATCH_SIZE):
+            firestore.transactional(self.write_processed)(self.database.transaction(),
+                                                          keys[start:start + self.BATCH_SIZE])
+        if self.seen_set is not None:
+            self.seen_set.add_many([(expose_id, None) for (expose_id, _) in keys])
+
+    def write_processed(self, transaction, keys):
+        """Adds the processed documents to the transaction"""
+        for (expose_id, crawler) in keys:
+            transaction.set(self.database.collection(u'processed').document(str(expose_id)),
+                            {u'id': expose_id, u'crawler': crawler})
+
     def save_expose(self, expose):
         """Writes an expose to the storage backend"""
         record = expose.copy()
         record.update({'created_at': pytz.utc.localize(datetime.datetime.now()),
                        'created_sort': (0 - datetime.datetime.now().timestamp())})
-        self.database.collection(u'exposes').document(str(expose[u'id'])).set(record)
+        firestore.transactional(self.write_expose)(self.database.transaction(), record)
+
+    def write_expose(self, transaction, record):
+        """Adds the expose to the transaction. A new expose is also counted in
+           the rollups of its day and crawler, kept in one 'stats' document with
+           a field per bucket"""
+        expose_ref = self.database.collection(u'exposes').document(str(record[u'id']))
+        day = datetime.date.today().isoformat()
+        stats_ref = self.database.collection(u'stats')\
+                        .document('%s_%s' % (day, record[u'crawler']))
+        snapshots = {doc.id: doc for doc in transaction.get_all([expose_ref, stats_ref])}
+        transaction.set(expose_ref, record)
+        if snapshots[expose_ref.id].exists:
+            return
+        price, size, _ = typed_columns(record)
+        keys = [bucket_key(metric, metric_bucket)
+                for (metric, metric_bucket) in expose_buckets(price, size)]
+        if snapshots[stats_ref.id].exists:
+            transaction.update(stats_ref, {key: firestore.Increment(1) for key in keys})
+        else:
+            stats = {key: 1 for key in keys}
+            stats.update({u'day': day, u'crawler': record[u'crawler']})
+            transaction.set(stats_ref, stats)
 
     def get_exposes_since(self, min_datetime):
         """Returns all exposes since the supplied datetime"""
@@ -50,6 +159,18 @@ class GoogleCloudIdMaintainer:
             res.append(doc.to_dict())
         return res
 
+    def get_stats_since(self, min_date):
+        """Returns the rollup rows (day, crawler, metric, bucket, count) of the
+           exposes first saved since the specified date"""
+        res = []
+        for doc in self.database.collection(u'stats')\
+                       .where(u'day', u'>=', min_date.isoformat()).stream():
+            stats = doc.to_dict()
+            day, crawler = stats.pop(u'day'), stats.pop(u'crawler')
+            res.extend((day, crawler) + parse_bucket_key(key) + (count,)
+                       for (key, count) in stats.items())
+        return res
+
     def get_recent_exposes(self, count, filter_set=None):
         """Returns recent exposes (no more than 'count'), conforming to
            the provided filter if supplied"""
@@ -63,6 +184,37 @@ class GoogleCloudIdMaintainer:
                     break
         return res
 
+    def save_fingerprint(self, expose, signature, buckets):
+        """Saves the similarity signature of an expose, filed under its buckets"""
+        self.database.collection(u'fingerprints')\
+            .document('%s-%s' % (expose[u'crawler'], expose[u'id'])).set({
+                u'id': expose[u'id'],
+                u'crawler': expose[u'crawler'],
+                u'created_at': pytz.utc.localize(datetime.datetime.now()),
+                u'signature': signature,
+                u'buckets': buckets
+            })
+
+    def get_fingerprint_candidates(self, buckets, min_datetime):
+        """Returns (id, crawler, signature) of the exposes saved since the
+           specified date that share any of the buckets"""
+        localized_datetime = min_datetime.replace(tzinfo=pytz.UTC)
+        res = []
+        for doc in self.database.collection(u'fingerprints')\
+                       .where(u'buckets', u'array_contains_any', buckets).stream():
+            fingerprint = doc.to_dict()
+            if fingerprint[u'created_at'] >= localized_datetime:
+                res.append((fingerprint[u'id'], fingerprint[u'crawler'],
+                            fingerprint[u'signature']))
+        return res
+
+    def delete_fingerprints_before(self, min_datetime):
+        """Deletes the signatures saved before the specified date"""
+        localized_datetime = min_datetime.replace(tzinfo=pytz.UTC)
+        for doc in self.database.collection(u'fingerprints')\
+                       .where(u'created_at', u'<', localized_datetime).stream():
+            doc.reference.delete()
+
     def get_settings_for_user(self, user_id):
         """Loads the user settings from the database"""
         doc = self.database.collection(u'users').document(str(user_id)).get()
@@ -1,10 +1,21 @@
 """Default Flathunter implementation for the command line"""
+import asyncio
 import logging
+from collections import Counter
 from itertools import chain
 
 from flathunter.config import Config
+from flathunter.crawl_executor import CrawlExecutor
+from flathunter.dedup import CrawlDeduplicator
 from flathunter.filter import Filter
 from flathunter.processor import ProcessorChain
+from flathunter.page_cache import PageCache
+from flathunter.detail_cache import DetailPageCache
+from flathunter.parse_pool import ParsePool
+from flathunter.sessions import SessionPool
+from flathunter.rate_limiter import RateLimiter
+from flathunter.scheduler import Scheduler
+from flathunter.async_sessions import AsyncSessionPool
 
 from telegram import TelegramError
 from telegram.ext import Updater, CallbackQueryHandler
@@ -18,46 +29,157 @@ class Hunter:
         if not isinstance(self.config, Config):
             raise Exception("Invalid config for hunter - should be a 'Config' object")
         self.id_watch = id_watch
+        self.id_watch.configure_seen_set(self.config.get('seen_set', dict()))
+        SessionPool.configure(self.config.get('http', dict()))
+        RateLimiter.configure(self.config.get('rate_limit', dict()))
+        PageCache.configure(self.config.get('page_cache', dict()))
+        DetailPageCache.configure(self.config.get('detail_cache', dict()),
+                                  '%s/detail_pages.db' % self.config.database_location())
+        ParsePool.configure(self.config.get('concurrency', dict()))
+        self.crawl_executor = CrawlExecutor.from_config(self.config)
+        self.incremental = self.config.get('pagination', dict()).get('incremental', False)
+        self.scheduler = Scheduler.from_config(self.config)
+        self.deduplicator = CrawlDeduplicator()
         self.bot_token = self.config.get('telegram', dict()).get('bot_token', '')
         self.telegram_updater = Updater(token=self.bot_token, use_context=True)
         self.telegram_updater.start_polling()
         self.telegram_updater.dispatcher.add_error_handler(self.error)
         self.handlers = []
 
-    def crawl_for_exposes(self, max_pages=None):
-        """Trigger a new crawl of the configured URLs"""
-        return chain(*[searcher.crawl(url, max_pages)
-                       for searcher in self.config.searchers()
-                       for url in self.config.get('urls', list())])
+    def crawl_jobs(self, urls=None):
+        """List the (searcher, url) pairs to crawl, for all configured URLs or
+           the given subset of them"""
+        jobs = []
+        for url in self.config.get('urls', list()):
+            if urls is not None and url not in urls:
+                continue
+            searcher = self.config.searcher_for_url(url)
+            if searcher is not None:
+                jobs.append((searcher, url))
+        return jobs
 
-    def hunt_flats(self, max_pages=None):
-        """Crawl, process and filter exposes"""
+    def crawl_id_watch(self):
+        """The store of processed IDs that incremental crawls stop at, if any"""
+        return self.id_watch if self.incremental else None
+
+    def crawl_for_exposes(self, max_pages=None, urls=None):
+        """Trigger a new crawl of the configured URLs, or of the given subset"""
+        jobs = self.crawl_jobs(urls)
+        id_watch = self.crawl_id_watch()
+        RateLimiter.shared().start_cycle()
+        self.deduplicator = CrawlDeduplicator()
+        if self.crawl_executor is not None:
+            exposes = self.crawl_executor.crawl_with_urls(jobs, max_pages, id_watch)
+        else:
+            exposes = ((url, expose) for (searcher, url) in jobs
+                       for expose in searcher.crawl(url, max_pages, id_watch=id_watch))
+        return self.deduplicator.deduplicate(exposes)
+
+    def crawl_ready(self):
+        """True if the running crawl has its next expose ready, so that the
+           filters may wait for it to complete their batch"""
+        return self.deduplicator.ready()
+
+    def new_exposes_by_url(self, exposes):
+        """Count the exposes by the search URL they were found at first"""
+        counts = Counter()
+        for expose in exposes:
+            url = self.deduplicator.source_of(expose)
+            if url is not None:
+                counts[url] += 1
+        return dict(counts)
+
+    def hunt_due(self, hunt=None):
+        """Hunt the URLs that are due according to the adaptive scheduler. Returns
+           the number of new exposes per URL, or None if the previous hunt is
+           still running. 'hunt' defaults to hunt_flats"""
+        if hunt is None:
+            hunt = self.hunt_flats
+        return self.scheduler.run_due(lambda urls: self.new_exposes_by_url(hunt(urls=urls)))
+
+    def build_processor_chain(self):
+        """Build the chain of processors that new exposes are run through"""
         filter_set = Filter.builder() \
                            .read_config(self.config) \
                            .filter_already_seen(self.id_watch) \
                            .build()
 
-        processor_chain = ProcessorChain.builder(self.config) \
-                                        .save_all_exposes(self.id_watch) \
-                                        .apply_filter(filter_set) \
-                                        .resolve_addresses() \
-                                        .calculate_durations() \
-                                        .send_telegram_messages(self.telegram_updater) \
-                                        .build()
+        # Crawlers whose search results lack details have them loaded for the
+        # exposes that pass the filters, saved again so that they are available
+        # from the database - at once, as the buttons of the Telegram messages
+        # load them from there
+        return ProcessorChain.builder(self.config) \
+                             .save_all_exposes(self.id_watch) \
+                             .apply_filter(filter_set, ready=self.crawl_ready) \
+                             .filter_duplicates(self.id_watch) \
+                             .crawl_expose_details(deferred_only=True) \
+                             .save_all_exposes(self.id_watch, flush=True) \
+                             .resolve_addresses() \
+                             .calculate_durations() \
+                             .send_telegram_messages(self.telegram_updater) \
+                             .build()
+
+    def hunt_flats(self, max_pages=None, urls=None):
+        """Crawl, process and filter exposes, from all configured URLs or the
+           given subset of them"""
+        processor_chain = self.build_processor_chain()
 
         result = []
         # We need to iterate over this list to force the evaluation of the pipeline
-        for expose in processor_chain.process(self.crawl_for_exposes(max_pages)):
+        with self.id_watch.unit_of_work():
+            for expose in processor_chain.process(self.crawl_for_exposes(max_pages, urls)):
+                self.__log__.info('New offer: %s', expose['title'])
+                result.append(expose)
+        self.deduplicator.log_stats()
+        self.id_watch.log_stats()
+        SessionPool.shared().log_stats()
+        RateLimiter.shared().log_stats()
+        PageCache.shared().log_stats()
+        DetailPageCache.shared().log_stats()
+
+        self.update_telegram_handlers(processor_chain)
+        return result
+
+    async def hunt_flats_async(self, max_pages=None, urls=None):
+        """Asynchronous version of hunt_flats. Crawling, fetching expose details
+           and sending notifications all share the running event loop, and the
+           exposes of each URL are processed as soon as its crawl completes"""
+        processor_chain = self.build_processor_chain()
+        pool = AsyncSessionPool.shared()
+        id_watch = self.crawl_id_watch()
+        RateLimiter.shared().start_cycle()
+        self.deduplicator = CrawlDeduplicator()
+
+        async def crawl_and_process(searcher, url):
+            exposes = await searcher.crawl_async(url, max_pages, id_watch=id_watch)
+            return await processor_chain.process_async(
+                [expose for expose in exposes if self.deduplicator.is_new(url, expose)])
+
+        try:
+            with self.id_watch.unit_of_work():
+                result = list(chain(*await asyncio.gather(
+                    *[crawl_and_process(searcher, url)
+                      for (searcher, url) in self.crawl_jobs(urls)])))
+        finally:
+            await pool.close()
+        for expose in result:
             self.__log__.info('New offer: %s', expose['title'])
-            result.append(expose)
+        self.deduplicator.log_stats()
+        self.id_watch.log_stats()
+        self.__log__.info("HTTP connections: %s", pool.stats())
+        RateLimiter.shared().log_stats()
 
+        self.update_telegram_handlers(processor_chain)
+        return result
+
+    def update_telegram_handlers(self, processor_chain):
+        """Register the Telegram handler of the latest chain, dropping the old one"""
         cur_handler = processor_chain.get_telegram_handler()
         if cur_handler is not None:
             self.handlers.append(cur_handler)
             self.__log__.info("cleaned telegram handlers")
             if len(self.handlers) > 1:
                 self.telegram_updater.dispatcher.remove_handler(self.handlers[0])
-        return result
 
     def error(self, update, context):
         """
@@ -1,11 +1,16 @@
 """SQLite implementation of IDMaintainer interface"""
 import threading
 import sqlite3 as lite
+from contextlib import contextmanager
 import datetime
 import json
 import logging
+from collections import Counter
 
 from flathunter.abstract_processor import Processor
+from flathunter.expose_helper import ExposeHelper
+from flathunter.rollups import expose_buckets
+from flathunter.seen_set import SeenSet
 
 __author__ = "Nody"
 __version__ = "0.1"
@@ -13,16 +18,105 @@ __maintainer__ = "Nody"
 __email__ = "harrymcfly@protonmail.com"
 __status__ = "Prodction"
 
+def typed_columns(expose):
+    """The price, size and number of rooms of an expose as numbers, for the
+       typed columns of the exposes table"""
+    def read(getter):
+        try:
+            return getter(expose)
+        except (KeyError, TypeError):
+            return None
+    return (read(ExposeHelper.get_price), read(ExposeHelper.get_size),
+            read(ExposeHelper.get_rooms))
+
+def backfill_typed_columns(connection):
+    """Fills the typed columns of the exposes saved before they existed"""
+    updates = []
+    for (rowid, details) in connection.execute('SELECT rowid, details FROM exposes'):
+        try:
+            updates.append(typed_columns(json.loads(details)) + (rowid,))
+        except ValueError:
+            continue
+    connection.executemany('UPDATE exposes SET price = ?, size = ?, rooms = ? WHERE rowid = ?',
+                           updates)
+
+def backfill_rollups(connection):
+    """Counts the exposes saved before the rollups were kept"""
+    counts = Counter()
+    for (created, crawler, price, size) in \
+            connection.execute('SELECT created, crawler, price, size FROM exposes'):
+        for (metric, bucket) in expose_buckets(price, size):
+            counts[(str(created)[:10], crawler, metric, bucket)] += 1
+    connection.executemany('INSERT INTO stats_buckets VALUES (?, ?, ?, ?, ?)',
+                           [key + (count,) for (key, count) in counts.items()])
+
+# The schema changes of the database, in order. Each is a list of statements,
+# or functions taking the connection, applied in one transaction; the number
+# of applied migrations is the database's schema version. Only ever append to
+# this list
+MIGRATIONS = [
+    # 1: the tables as created before the schema was versioned
+    [
+        'CREATE TABLE IF NOT EXISTS processed (ID INTEGER)',
+        'CREATE TABLE IF NOT EXISTS executions (timestamp timestamp)',
+        'CREATE TABLE IF NOT EXISTS exposes (id INTEGER, created TIMESTAMP, \
+                crawler STRING, details BLOB, PRIMARY KEY (id, crawler))',
+        'CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, settings BLOB)',
+        'CREATE TABLE IF NOT EXISTS fingerprints (id INTEGER, crawler STRING, \
+                created TIMESTAMP, signature TEXT, PRIMARY KEY (id, crawler))',
+        'CREATE TABLE IF NOT EXISTS fingerprint_buckets (bucket TEXT, id INTEGER, \
+                crawler STRING)',
+        'CREATE INDEX IF NOT EXISTS fingerprint_buckets_bucket ON fingerprint_buckets (bucket)'
+    ],
+    # 2: key processed ids by crawler, and index the time columns that are
+    # sorted and searched on
+    [
+        'CREATE TABLE processed_by_crawler (id INTEGER, crawler STRING NOT NULL DEFAULT \'\', \
+                PRIMARY KEY (id, crawler)) WITHOUT ROWID',
+        'INSERT OR IGNORE INTO processed_by_crawler (id) \
+                SELECT id FROM processed WHERE id IS NOT NULL',
+        'DROP TABLE processed',
+        'ALTER TABLE processed_by_crawler RENAME TO processed',
+        'CREATE INDEX IF NOT EXISTS exposes_created ON exposes (created)',
+        'CREATE INDEX IF NOT EXISTS executions_timestamp ON executions (timestamp)'
+    ],
+    # 3: typed columns for the values the filters compare, so that SQL can
+    # filter the saved exposes without decoding their JSON. The index on
+    # created includes them, so rows that do not match are skipped before
+    # they are read
+    [
+        'ALTER TABLE exposes ADD COLUMN price REAL',
+        'ALTER TABLE exposes ADD COLUMN size REAL',
+        'ALTER TABLE exposes ADD COLUMN rooms REAL',
+        backfill_typed_columns,
+        'DROP INDEX IF EXISTS exposes_created',
+        'CREATE INDEX exposes_created ON exposes (created, price, size, rooms)',
+        'CREATE INDEX exposes_price ON exposes (price)',
+        'CREATE INDEX exposes_size ON exposes (size)',
+        'CREATE INDEX exposes_rooms ON exposes (rooms)'
+    ],
+    # 4: daily rollups of the saved exposes for the statistics page
+    [
+        'CREATE TABLE stats_buckets (day TEXT, crawler STRING, metric TEXT, bucket REAL, \
+                count INTEGER, PRIMARY KEY (day, crawler, metric, bucket)) WITHOUT ROWID',
+        backfill_rollups
+    ]
+]
+
 class SaveAllExposesProcessor(Processor):
-    """Processor that saves all exposes to the database"""
+    """Processor that saves all exposes to the database. With 'flush', each
+       save is committed at once, even within a unit of work"""
 
-    def __init__(self, config, id_watch):
+    def __init__(self, config, id_watch, flush=False):
         self.config = config
         self.id_watch = id_watch
+        self.flush = flush
 
     def process_expose(self, expose):
         """Save a single expose"""
         self.id_watch.save_expose(expose)
+        if self.flush:
+            self.id_watch.flush()
         return expose
 
 class AlreadySeenFilter:
@@ -33,62 +127,264 @@ class AlreadySeenFilter:
 
     def is_interesting(self, expose):
         """Returns true if an expose should be kept in the pipeline"""
-        if not self.id_watch.is_processed(expose['id']):
-            self.id_watch.mark_processed(expose['id'])
+        if not self.id_watch.is_processed(expose['id'], expose.get('crawler')):
+            self.id_watch.mark_processed(expose['id'], expose.get('crawler'))
             return True
         return False
 
+    def is_interesting_batch(self, exposes):
+        """Returns for each expose whether it should be kept in the pipeline.
+           With a back-end that supports it, the whole batch is looked up and
+           marked as processed at once"""
+        if not hasattr(self.id_watch, 'filter_unseen'):
+            return [self.is_interesting(expose) for expose in exposes]
+        keys = [(expose['id'], expose.get('crawler')) for expose in exposes]
+        unseen = set(self.id_watch.filter_unseen(keys))
+        verdicts = []
+        for key in keys:
+            # an expose listed twice in the batch is only new the first time
+            verdicts.append(key in unseen)
+            unseen.discard(key)
+        new_keys = [key for (key, verdict) in zip(keys, verdicts) if verdict]
+        if new_keys:
+            self.id_watch.mark_processed_many(new_keys)
+        return verdicts
+
 class IdMaintainer:
     """SQLite back-end for the database"""
     __log__ = logging.getLogger('flathunt')
 
-    def __init__(self, db_name):
+    # stays below SQLite's default limit of 999 parameters per query
+    QUERY_BATCH_SIZE = 500
+
+    JOURNAL_MODES = ['delete', 'truncate', 'persist', 'memory', 'wal', 'off']
+    SYNCHRONOUS_LEVELS = ['off', 'normal', 'full', 'extra']
+    DEFAULT_SETTINGS = {
+        'journal_mode': 'wal',
+        'synchronous': 'normal',
+        'batch_size': 500
+    }
+
+    def __init__(self, db_name, settings=None):
         self.db_name = db_name
         self.threadlocal = threading.local()
+        self.seen_set = None
+        self.settings = dict(self.DEFAULT_SETTINGS)
+        if settings is not None:
+            self.settings.update(settings)
+        if str(self.settings['journal_mode']).lower() not in self.JOURNAL_MODES:
+            raise ValueError("Unknown journal_mode %s" % self.settings['journal_mode'])
+        if str(self.settings['synchronous']).lower() not in self.SYNCHRONOUS_LEVELS:
+            raise ValueError("Unknown synchronous level %s" % self.settings['synchronous'])
 
     def get_connection(self):
-        """Connects to the SQLite database. Connections are thread-local"""
+        """Connects to the SQLite database, bringing its schema up to date.
+           Connections are thread-local"""
         connection = getattr(self.threadlocal, 'connection', None)
         if connection is None:
             try:
-                self.threadlocal.connection = lite.connect(self.db_name)
-                connection = self.threadlocal.connection
-                cur = self.threadlocal.connection.cursor()
-                cur.execute('CREATE TABLE IF NOT EXISTS processed (ID INTEGER)')
-                cur.execute('CREATE TABLE IF NOT EXISTS executions (timestamp timestamp)')
-                cur.execute('CREATE TABLE IF NOT EXISTS exposes (id INTEGER, created TIMESTAMP, \
-                                    crawler STRING, details BLOB, PRIMARY KEY (id, crawler))')
-                cur.execute('CREATE TABLE IF NOT EXISTS users \
-                                    (id INTEGER PRIMARY KEY, settings BLOB)')
-                self.threadlocal.connection.commit()
+                connection = lite.connect(self.db_name)
+                # in WAL mode, readers such as the web views do not wait for the
+                # hunter's writes; 'normal' sync only fsyncs at checkpoints there
+                connection.execute('PRAGMA journal_mode = %s' % self.settings['journal_mode'])
+                connection.execute('PRAGMA synchronous = %s' % self.settings['synchronous'])
+                self.migrate(connection)
+                self.threadlocal.connection = connection
             except lite.Error as error:
                 self.__log__.error("Error %s:", error.args[0])
                 raise error
         return connection
 
-    def is_processed(self, expose_id):
-        """Returns true if an expose has already been processed"""
+    def migrate(self, connection):
+        """Applies the MIGRATIONS that the database is missing. The schema
+           version is kept in SQLite's user_version; databases created before
+           it was kept have version 0, and their tables already exist"""
+        # an up-to-date database needs no write lock, which a hunt may hold
+        if connection.execute('PRAGMA user_version').fetchone()[0] == len(MIGRATIONS):
+            return
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            version = connection.execute('PRAGMA user_version').fetchone()[0]
+            for number in range(version + 1, len(MIGRATIONS) + 1):
+                self.__log__.info("Upgrading database %s to schema version %d",
+                                  self.db_name, number)
+                for statement in MIGRATIONS[number - 1]:
+                    if callable(statement):
+                        statement(connection)
+                    else:
+                        connection.execute(statement)
+                connection.execute('PRAGMA user_version = %d' % number)
+            connection.commit()
+        except lite.Error:
+            connection.rollback()
+            raise
+
+    @contextmanager
+    def unit_of_work(self):
+        """Groups the writes of the calling thread within the block into
+           transactions of up to 'batch_size' writes, instead of committing each
+           one. The writes are held back until their batch is full, the thread
+           reads from the database, or the block is left, and then run in one
+           transaction. The database is therefore never locked in between, e.g.
+           while the hunt fetches pages, and other processes can still write"""
+        depth = getattr(self.threadlocal, 'unit_of_work', 0)
+        self.threadlocal.unit_of_work = depth + 1
+        try:
+            yield self
+        finally:
+            self.threadlocal.unit_of_work = depth
+            if depth == 0:
+                self.flush()
+
+    def write(self, operation):
+        """Runs the operation, a function taking a cursor, in a transaction of
+           its own, or queues it if a unit of work is open"""
+        if getattr(self.threadlocal, 'unit_of_work', 0) == 0:
+            self.run_writes([operation])
+            return
+        pending = self.pending_writes()
+        pending.append(operation)
+        if len(pending) >= self.settings['batch_size']:
+            self.flush()
+
+    def pending_writes(self):
+        """The writes queued by the calling thread"""
+        if getattr(self.threadlocal, 'pending_writes', None) is None:
+            self.threadlocal.pending_writes = []
+        return self.threadlocal.pending_writes
+
+    def run_writes(self, operations):
+        """Runs the write operations in one transaction"""
+        connection = self.get_connection()
+        try:
+            cur = connection.cursor()
+            for operation in operations:
+                operation(cur)
+            connection.commit()
+        except lite.Error:
+            connection.rollback()
+            raise
+
+    def flush(self):
+        """Runs the writes queued by the calling thread"""
+        pending = self.pending_writes()
+        if pending:
+            self.threadlocal.pending_writes = []
+            self.run_writes(pending)
+
+    def cursor(self):
+        """A cursor to read from the database with, after running the writes
+           the calling thread has queued, so that it reads its own writes"""
+        self.flush()
+        return self.get_connection().cursor()
+
+    def configure_seen_set(self, settings):
+        """Keeps the processed ids in memory as well, unless disabled in the
+           settings, so that most lookups need no query"""
+        if settings is None:
+            settings = {}
+        self.seen_set = None
+        if settings.get('enabled', True):
+            self.seen_set = SeenSet(self.iter_processed, settings.get('exclusive', False))
+
+    def iter_processed(self):
+        """Generator over the (id, crawler) pairs of all processed exposes, in
+           the order of the ids"""
+        cur = self.cursor()
+        cur.execute('SELECT id, crawler FROM processed ORDER BY id')
+        yield from cur
+
+    def log_stats(self):
+        """Write the statistics of the seen set to the log"""
+        if self.seen_set is not None:
+            self.seen_set.log_stats()
+
+    def is_processed(self, expose_id, crawler=None):
+        """Returns true if an expose has already been processed. Without a
+           crawler, an expose of any crawler with that id counts"""
+        if self.seen_set is not None:
+            return self.seen_set.is_processed(expose_id, crawler, self.lookup_processed)
+        return self.lookup_processed(expose_id, crawler)
+
+    def lookup_processed(self, expose_id, crawler=None):
+        """Looks up in the database whether an expose has been processed"""
         self.__log__.debug('is_processed(%d)', expose_id)
-        cur = self.get_connection().cursor()
-        cur.execute('SELECT id FROM processed WHERE id = ?', (expose_id,))
+        cur = self.cursor()
+        if crawler is None:
+            cur.execute('SELECT id FROM processed WHERE id = ? LIMIT 1', (expose_id,))
+        else:
+            # ids marked before the crawler was recorded apply to all crawlers
+            cur.execute('SELECT id FROM processed WHERE id = ? AND crawler IN (?, \'\')',
+                        (expose_id, crawler))
         row = cur.fetchone()
         return row is not None
 
-    def mark_processed(self, expose_id):
+    def mark_processed(self, expose_id, crawler=None):
         """Mark an expose as processed in the database"""
         self.__log__.debug('mark_processed(%d)', expose_id)
-        cur = self.get_connection().cursor()
-        cur.execute('INSERT INTO processed VALUES(?)', (expose_id,))
-        self.get_connection().commit()
+        self.write(lambda cur: cur.execute('INSERT OR IGNORE INTO processed VALUES(?, ?)',
+                                           (expose_id, crawler or '')))
+        if self.seen_set is not None:
+            self.seen_set.add_many([(expose_id, crawler)])
+
+    def filter_unseen(self, keys):
+        """Returns those of the (id, crawler) pairs that have not been processed
+           yet, looking them up in as few queries as possible"""
+        if self.seen_set is not None:
+            return self.seen_set.filter_unseen(keys, self.query_unseen)
+        return self.query_unseen(keys)
+
+    def query_unseen(self, keys):
+        """Looks up in the database which of the (id, crawler) pairs have not
+           been processed yet"""
+        keys = list(keys)
+        processed = {}
+        cur = self.cursor()
+        for start in range(0, len(keys), self.QUERY_BATCH_SIZE):
+            ids = list({expose_id for (expose_id, _) in keys[start:start + self.QUERY_BATCH_SIZE]})
+            cur.execute('SELECT id, crawler FROM processed WHERE id IN (%s)'
+                        % ', '.join('?' * len(ids)), ids)
+            for (expose_id, crawler) in cur.fetchall():
+                processed.setdefault(expose_id, set()).add(crawler)
+        return [(expose_id, crawler) for (expose_id, crawler) in keys
+                if not self.seen_by(processed.get(expose_id), crawler)]
+
+    @staticmethod
+    def seen_by(crawlers, crawler):
+        """Whether an id processed for the given crawlers counts as processed for
+           the crawler, as in is_processed"""
+        if not crawlers:
+            return False
+        return crawler is None or crawler in crawlers or '' in crawlers
+
+    def mark_processed_many(self, keys):
+        """Mark the exposes with the (id, crawler) pairs as processed, in one
+           transaction"""
+        rows = [(expose_id, crawler or '') for (expose_id, crawler) in keys]
+        self.write(lambda cur: cur.executemany('INSERT OR IGNORE INTO processed VALUES(?, ?)',
+                                               rows))
+        if self.seen_set is not None:
+            self.seen_set.add_many(keys)
 
     def save_expose(self, expose):
         """Saves an expose to a database"""
-        cur = self.get_connection().cursor()
-        cur.execute('INSERT OR REPLACE INTO exposes(id, created, crawler, details) \
-                     VALUES (?, ?, ?, ?)',
-                    (int(expose['id']), datetime.datetime.now(),
-                     expose['crawler'], json.dumps(expose)))
-        self.get_connection().commit()
+        now = datetime.datetime.now()
+        price, size, rooms = typed_columns(expose)
+        key = (int(expose['id']), expose['crawler'])
+        row = (key[0], now, key[1], json.dumps(expose), price, size, rooms)
+        buckets = [(now.date().isoformat(), key[1], metric, bucket)
+                   for (metric, bucket) in expose_buckets(price, size)]
+        def insert(cur):
+            cur.execute('SELECT 1 FROM exposes WHERE id = ? AND crawler = ?', key)
+            is_new = cur.fetchone() is None
+            cur.execute('INSERT OR REPLACE INTO exposes(id, created, crawler, details, \
+                         price, size, rooms) VALUES (?, ?, ?, ?, ?, ?, ?)', row)
+            if is_new:
+                # exposes are saved again on every crawl, but only counted once
+                cur.executemany('INSERT INTO stats_buckets VALUES (?, ?, ?, ?, 1) \
+                                 ON CONFLICT (day, crawler, metric, bucket) \
+                                 DO UPDATE SET count = count + 1', buckets)
+        self.write(insert)
 
     
     @staticmethod
@@ -98,7 +394,7 @@ class IdMaintainer:
             return obj
 
     def get_expose_by_id(self, id):
-        cur = self.get_connection().cursor()
+        cur = self.cursor()
         cur.execute('SELECT details FROM exposes \
                      WHERE id == ?', (id,))
         # import ipdb; ipdb.set_trace()
@@ -115,36 +411,76 @@ class IdMaintainer:
         #     obj = json.loads(row[2])
         #     obj['created_at'] = row[0]
         #     return obj
-        cur = self.get_connection().cursor()
+        cur = self.cursor()
         cur.execute('SELECT created, crawler, details FROM exposes \
                      WHERE created >= ? ORDER BY created DESC', (min_datetime,))
         return list(map(self.row_to_expose, cur.fetchall()))        
 
+    def get_stats_since(self, min_date):
+        """Returns the rollup rows (day, crawler, metric, bucket, count) of the
+           exposes first saved since the specified date"""
+        cur = self.cursor()
+        cur.execute('SELECT day, crawler, metric, bucket, count FROM stats_buckets \
+                     WHERE day >= ?', (min_date.isoformat(),))
+        return cur.fetchall()
+
     def get_recent_exposes(self, count, filter_set=None):
-        """Returns up to 'count' recent exposes, filtered by the provided filter"""
-        cur = self.get_connection().cursor()
-        cur.execute('SELECT details FROM exposes ORDER BY created DESC')
+        """Returns up to 'count' recent exposes, filtered by the provided filter.
+           The filters on price, size and rooms are applied by the query; only
+           the others need the exposes to be decoded"""
+        condition, params, rest = '1', [], None
+        if filter_set is not None:
+            condition, params, rest = filter_set.to_sql()
+        cur = self.cursor()
+        cur.execute('SELECT details FROM exposes WHERE %s ORDER BY created DESC' % condition,
+                    params)
         res = []
-        next_batch = []
-        while len(res) < count:
-            if len(next_batch) == 0:
-                next_batch = cur.fetchmany()
-                if len(next_batch) == 0:
-                    break
-            expose = json.loads(next_batch.pop()[0])
-            if filter_set is None or filter_set.is_interesting_expose(expose):
+        for (details,) in cur:
+            if len(res) >= count:
+                break
+            expose = json.loads(details)
+            if rest is None or rest.is_interesting_expose(expose):
                 res.append(expose)
         return res
 
+    def save_fingerprint(self, expose, signature, buckets):
+        """Saves the similarity signature of an expose, filed under its buckets"""
+        key = (int(expose['id']), expose['crawler'])
+        row = key + (datetime.datetime.now(), json.dumps(signature))
+        def insert(cur):
+            cur.execute('INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?)', row)
+            cur.execute('DELETE FROM fingerprint_buckets WHERE id = ? AND crawler = ?', key)
+            cur.executemany('INSERT INTO fingerprint_buckets VALUES (?, ?, ?)',
+                            [(bucket,) + key for bucket in buckets])
+        self.write(insert)
+
+    def get_fingerprint_candidates(self, buckets, min_datetime):
+        """Returns (id, crawler, signature) of the exposes saved since the
+           specified date that share any of the buckets"""
+        cur = self.cursor()
+        cur.execute('SELECT DISTINCT f.id, f.crawler, f.signature FROM fingerprint_buckets b \
+                     JOIN fingerprints f ON f.id = b.id AND f.crawler = b.crawler \
+                     WHERE b.bucket IN (%s) AND f.created >= ?' % ', '.join('?' * len(buckets)),
+                    list(buckets) + [min_datetime])
+        return [(row[0], row[1], json.loads(row[2])) for row in cur.fetchall()]
+
+    def delete_fingerprints_before(self, min_datetime):
+        """Deletes the signatures saved before the specified date"""
+        def delete(cur):
+            cur.execute('DELETE FROM fingerprint_buckets WHERE (id, crawler) IN \
+                         (SELECT id, crawler FROM fingerprints WHERE created < ?)',
+                        (min_datetime,))
+            cur.execute('DELETE FROM fingerprints WHERE created < ?', (min_datetime,))
+        self.write(delete)
+
     def save_settings_for_user(self, user_id, settings):
         """Saves the user settings to the database"""
-        cur = self.get_connection().cursor()
-        cur.execute('INSERT OR REPLACE INTO users VALUES (?, ?)', (user_id, json.dumps(settings)))
-        self.get_connection().commit()
+        row = (user_id, json.dumps(settings))
+        self.write(lambda cur: cur.execute('INSERT OR REPLACE INTO users VALUES (?, ?)', row))
 
     def get_settings_for_user(self, user_id):
         """Loads the settings for a user from the database"""
-        cur = self.get_connection().cursor()
+        cur = self.cursor()
         cur.execute('SELECT settings FROM users WHERE id = ?', (user_id,))
         row = cur.fetchone()
         if row is None:
@@ -153,7 +489,7 @@ class IdMaintainer:
 
     def get_user_settings(self):
         """Loads all users' settings from the database"""
-        cur = self.get_connection().cursor()
+        cur = self.cursor()
         cur.execute('SELECT id, settings FROM users')
         res = []
         for row in cur.fetchall():
@@ -162,7 +498,7 @@ class IdMaintainer:
 
     def get_last_run_time(self):
         """Returns the time of the last hunt"""
-        cur = self.get_connection().cursor()
+        cur = self.cursor()
         cur.execute("SELECT * FROM executions ORDER BY timestamp DESC LIMIT 1")
         row = cur.fetchone()
         if row is None:
@@ -171,8 +507,6 @@ class IdMaintainer:
 
     def update_last_run_time(self):
         """Saves the time of the most recent hunt to the database"""
-        cur = self.get_connection().cursor()
         result = datetime.datetime.now()
-        cur.execute('INSERT INTO executions VALUES(?);', (result,))
-        self.get_connection().commit()
+        self.write(lambda cur: cur.execute('INSERT INTO executions VALUES(?);', (result,)))
         return result
@@ -0,0 +1,105 @@
+"""Conditional-GET cache for search result pages. Search pages are fetched
+   again on every hunt, but mostly have not changed since the last one: the
+   cache revalidates them with the ETag / Last-Modified validators of the
+   previous response, and keeps the exposes extracted from each page so
+   that unchanged pages do not have to be parsed again"""
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, Counter
+
+class CachedPage:
+    """A fetched page, with its validators and the exposes extracted from it"""
+
+    def __init__(self, url, response):
+        self.url = url
+        self.content = response.content
+        self.digest = hashlib.sha1(response.content).hexdigest()
+        self.etag = response.headers.get('ETag')
+        self.last_modified = response.headers.get('Last-Modified')
+        self.entries = None
+        self.meta = {}
+
+    def update_validators(self, response):
+        """Take over the validators of a newer response for the same content"""
+        self.etag = response.headers.get('ETag', self.etag)
+        self.last_modified = response.headers.get('Last-Modified', self.last_modified)
+
+class PageCache:
+    """LRU cache of the most recently fetched search pages, keyed by URL"""
+
+    __log__ = logging.getLogger('flathunt')
+    __shared__ = None
+
+    def __init__(self, max_pages=200, enabled=True):
+        self.max_pages = max_pages
+        self.enabled = enabled
+        self.pages = OrderedDict()
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def request_headers(self, url):
+        """Validators to send when fetching the URL"""
+        headers = {}
+        if not self.enabled:
+            return headers
+        with self.lock:
+            page = self.pages.get(url)
+        if page is not None:
+            if page.etag is not None:
+                headers['If-None-Match'] = page.etag
+            if page.last_modified is not None:
+                headers['If-Modified-Since'] = page.last_modified
+        return headers
+
+    def update(self, url, response):
+        """Returns the page for the response. If the server answered '304 Not
+           Modified', or sent the same content as last time, this is the cached
+           page, including the exposes already extracted from it"""
+        with self.lock:
+            cached = self.pages.get(url)
+            if cached is not None and response.status_code == 304:
+                self.counts['not_modified'] += 1
+                self.pages.move_to_end(url)
+                return cached
+            page = CachedPage(url, response)
+            if response.status_code != 200 or not self.enabled:
+                return page
+            if cached is not None and cached.digest == page.digest:
+                self.counts['unchanged'] += 1
+                cached.update_validators(response)
+                self.pages.move_to_end(url)
+                return cached
+            self.counts['changed'] += 1
+            self.pages[url] = page
+            self.pages.move_to_end(url)
+            while len(self.pages) > self.max_pages:
+                self.pages.popitem(last=False)
+            return page
+
+    def stats(self):
+        """Counts of pages that were not modified, unchanged, or changed"""
+        return dict(self.counts)
+
+    def log_stats(self):
+        """Write the cache statistics to the log"""
+        stats = self.stats()
+        self.__log__.info("Search pages: %d not modified, %d unchanged, %d changed",
+                          stats.get('not_modified', 0), stats.get('unchanged', 0),
+                          stats.get('changed', 0))
+
+    @staticmethod
+    def configure(settings):
+        """Replace the shared cache with one using the provided settings"""
+        if settings is None:
+            settings = {}
+        PageCache.__shared__ = PageCache(max_pages=settings.get('max_pages', 200),
+                                         enabled=settings.get('enabled', True))
+        return PageCache.__shared__
+
+    @staticmethod
+    def shared():
+        """Get the cache shared by all crawlers"""
+        if PageCache.__shared__ is None:
+            PageCache.__shared__ = PageCache()
+        return PageCache.__shared__
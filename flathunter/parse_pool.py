@@ -0,0 +1,110 @@
+"""Process pool for parsing fetched pages. Parsing HTML is pure-Python CPU
+   work, so parses run in crawler threads are serialized by the GIL. When
+   configured with more than one worker, the ParsePool runs the crawlers'
+   extraction methods in worker processes instead, passing the page bytes
+   in and getting plain expose dicts back"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pickle import PicklingError
+
+def call_in_worker(func, args):
+    """Runs in the worker process. Exceptions raised by the parse function are
+       returned, so they can be told apart from failures to transfer the call"""
+    try:
+        return True, func(*args)
+    # pylint: disable=broad-except
+    except Exception as error:
+        return False, error
+
+class ParsePool:
+    """Runs parse functions in a pool of worker processes, or in the calling
+       thread if no workers are configured or the pool fails"""
+
+    __log__ = logging.getLogger('flathunt')
+    __shared__ = None
+
+    def __init__(self, workers=0):
+        self.workers = workers
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def get_executor(self):
+        """Returns the process pool, starting it on first use. Returns None
+           if parsing should happen in-process"""
+        if self.workers <= 1:
+            return None
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self.executor
+
+    def disable(self, error):
+        """Fall back to parsing in-process after the pool failed"""
+        self.__log__.warning("Parsing in worker processes failed, parsing in-process: %s", error)
+        with self.lock:
+            self.workers = 0
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
+                self.executor = None
+
+    def run(self, func, *args):
+        """Call func(*args) in a worker process and return its result. The
+           function and arguments have to be picklable - usually a bound method
+           of a crawler, and page content"""
+        executor = self.get_executor()
+        if executor is not None:
+            try:
+                outcome = executor.submit(call_in_worker, func, args).result()
+            except (BrokenProcessPool, PicklingError, AttributeError, TypeError) as error:
+                self.disable(error)
+            else:
+                return self.unwrap(outcome)
+        return func(*args)
+
+    async def run_async(self, func, *args):
+        """Asynchronous version of run"""
+        executor = self.get_executor()
+        if executor is not None:
+            try:
+                outcome = await asyncio.wrap_future(executor.submit(call_in_worker, func, args))
+            except (BrokenProcessPool, PicklingError, AttributeError, TypeError) as error:
+                self.disable(error)
+            else:
+                return self.unwrap(outcome)
+        return func(*args)
+
+    @staticmethod
+    def unwrap(outcome):
+        """Returns the result of a call_in_worker, re-raising the exception
+           of a failed parse"""
+        succeeded, value = outcome
+        if not succeeded:
+            raise value
+        return value
+
+    def close(self):
+        """Shut down the worker processes"""
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+
+    @staticmethod
+    def configure(settings):
+        """Replace the shared pool with one using the 'parse_workers' setting"""
+        if settings is None:
+            settings = {}
+        if ParsePool.__shared__ is not None:
+            ParsePool.__shared__.close()
+        ParsePool.__shared__ = ParsePool(workers=settings.get('parse_workers', 0))
+        return ParsePool.__shared__
+
+    @staticmethod
+    def shared():
+        """Get the pool shared by all crawlers"""
+        if ParsePool.__shared__ is None:
+            ParsePool.__shared__ = ParsePool()
+        return ParsePool.__shared__
@@ -1,4 +1,5 @@
 """Utility classes for building chains for processors"""
+import asyncio
 from functools import reduce
 
 from flathunter.default_processors import AddressResolver
@@ -8,6 +9,7 @@ from flathunter.default_processors import CrawlExposeDetails
 from flathunter.sender_telegram import SenderTelegram
 from flathunter.gmaps_duration_processor import GMapsDurationProcessor
 from flathunter.idmaintainer import SaveAllExposesProcessor
+from flathunter.similarity import DuplicateFilterProcessor
 
 class ProcessorChainBuilder:
     """Builder pattern for building chains of processors"""
@@ -34,9 +36,10 @@ class ProcessorChainBuilder:
             self.processors.append(GMapsDurationProcessor(self.config))
         return self
 
-    def crawl_expose_details(self):
-        """Add processor to crawl expose details"""
-        self.processors.append(CrawlExposeDetails(self.config))
+    def crawl_expose_details(self, deferred_only=False):
+        """Add processor to crawl expose details, optionally only for the
+           crawlers that defer them from the search results"""
+        self.processors.append(CrawlExposeDetails(self.config, deferred_only))
         return self
 
     def map(self, func):
@@ -44,14 +47,25 @@ class ProcessorChainBuilder:
         self.processors.append(LambdaProcessor(self.config, func))
         return self
 
-    def apply_filter(self, filter_set):
-        """Add processor that applies a filter to expose sequence"""
-        self.processors.append(Filter(self.config, filter_set))
+    def apply_filter(self, filter_set, ready=None):
+        """Add processor that applies a filter to expose sequence. 'ready' tells
+           whether the next expose of the sequence is available without waiting,
+           see Filter.filter"""
+        self.processors.append(Filter(self.config, filter_set, ready))
         return self
 
-    def save_all_exposes(self, id_watch):
-        """Add processor that saves all exposes to disk"""
-        self.processors.append(SaveAllExposesProcessor(self.config, id_watch))
+    def filter_duplicates(self, id_watch):
+        """Add processor that drops listings of a flat already found on another
+           portal, if enabled"""
+        settings = self.config.get('duplicates', dict()) or dict()
+        if settings.get('enabled', False):
+            self.processors.append(DuplicateFilterProcessor(self.config, id_watch))
+        return self
+
+    def save_all_exposes(self, id_watch, flush=False):
+        """Add processor that saves all exposes to disk. With 'flush', they are
+           committed at once, even within a unit of work"""
+        self.processors.append(SaveAllExposesProcessor(self.config, id_watch, flush))
         return self
 
     def build(self):
@@ -69,6 +83,22 @@ class ProcessorChain:
         return reduce((lambda exposes, processor: processor.process_exposes(exposes)),
                       self.processors, exposes)
 
+    async def process_expose_async(self, expose):
+        """Run a single expose through the chain. Returns None if the expose
+           was dropped by one of the processors"""
+        for processor in self.processors:
+            expose = await processor.process_expose_async(expose)
+            if expose is None:
+                return None
+        return expose
+
+    async def process_async(self, exposes):
+        """Process the exposes concurrently on the running event loop, returning
+           those which made it through the whole chain"""
+        results = await asyncio.gather(*[self.process_expose_async(expose)
+                                         for expose in exposes])
+        return [expose for expose in results if expose is not None]
+
     def get_telegram_handler(self):
         for p in self.processors:
             if isinstance(p, SenderTelegram):
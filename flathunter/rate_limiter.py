@@ -0,0 +1,170 @@
+"""Per-host rate limiting and retries for all requests to the portals. Each
+   host gets a token bucket whose rate is halved whenever the host answers
+   with a throttling response, and slowly raised again while requests
+   succeed. Failed requests are retried with jittered exponential backoff,
+   drawing on a retry budget that is shared by all requests of a hunt"""
+import time
+import random
+import logging
+import threading
+from collections import Counter
+from urllib.parse import urlparse
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+THROTTLE_STATUS_CODES = (429, 503)
+
+class TokenBucket:
+    """Token bucket allowing bursts of 'capacity' requests, refilled at 'rate'
+       requests per second"""
+
+    def __init__(self, rate, capacity, min_rate, max_rate):
+        self.rate = rate
+        self.capacity = capacity
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self, now):
+        """Add the tokens accumulated since the last update"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """Take a token, returning the number of seconds to wait before it is
+           available. Tokens may be reserved ahead, so concurrent callers are
+           spaced out instead of all waking up at the same time"""
+        with self.lock:
+            self.refill(time.monotonic())
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.rate
+
+    def slow_down(self):
+        """Halve the rate after a throttling response"""
+        with self.lock:
+            self.refill(time.monotonic())
+            self.rate = max(self.min_rate, self.rate / 2)
+            return self.rate
+
+    def speed_up(self):
+        """Raise the rate a little after a successful response"""
+        with self.lock:
+            self.refill(time.monotonic())
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+            return self.rate
+
+class RateLimiter:
+    """Keeps a token bucket per host and decides whether and when failed
+       requests are retried"""
+
+    __log__ = logging.getLogger('flathunt')
+    __shared__ = None
+
+    DEFAULT_SETTINGS = {
+        'rate': 2.0,
+        'burst': 5,
+        'min_rate': 0.1,
+        'retries': 3,
+        'backoff': 1.0,
+        'max_backoff': 30.0,
+        'retry_budget': 20
+    }
+
+    def __init__(self, settings=None):
+        self.settings = dict(self.DEFAULT_SETTINGS)
+        if settings is not None:
+            self.settings.update(settings)
+        self.buckets = {}
+        self.retry_budget = self.settings['retry_budget']
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def bucket_for(self, url):
+        """Returns the token bucket for the host of the provided URL"""
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.settings['rate'], self.settings['burst'],
+                                                 self.settings['min_rate'], self.settings['rate'])
+            return self.buckets[host]
+
+    def delay(self, url):
+        """Reserve a request to the URL's host, returning the seconds to wait"""
+        wait = self.bucket_for(url).reserve()
+        if wait > 0:
+            with self.lock:
+                self.counts['delayed'] += 1
+        return wait
+
+    def acquire(self, url):
+        """Block until a request to the URL's host may be sent"""
+        wait = self.delay(url)
+        if wait > 0:
+            time.sleep(wait)
+
+    def record(self, url, status_code):
+        """Adapt the host's rate to the status code of a response"""
+        bucket = self.bucket_for(url)
+        if status_code in THROTTLE_STATUS_CODES:
+            rate = bucket.slow_down()
+            with self.lock:
+                self.counts['throttled'] += 1
+            self.__log__.warning("Throttled by %s (%d), slowing down to %.2f requests/s",
+                                 urlparse(url).netloc, status_code, rate)
+        elif status_code < 400:
+            bucket.speed_up()
+
+    def retry_delay(self, url, attempt, retry_after=None):
+        """Returns the number of seconds to wait before retrying a failed
+           request, or None if the request should not be retried because the
+           retries for this request or the retry budget of the hunt are used up"""
+        if attempt >= self.settings['retries']:
+            return None
+        with self.lock:
+            if self.retry_budget <= 0:
+                self.counts['budget_exhausted'] += 1
+                return None
+            self.retry_budget -= 1
+            self.counts['retries'] += 1
+        delay = random.uniform(0, min(self.settings['max_backoff'],
+                                      self.settings['backoff'] * 2 ** attempt))
+        try:
+            delay = max(delay, min(float(retry_after), self.settings['max_backoff']))
+        except (TypeError, ValueError):
+            pass
+        self.__log__.debug("Retrying %s in %.1fs", url, delay)
+        return delay
+
+    def start_cycle(self):
+        """Renew the retry budget at the start of a hunt"""
+        with self.lock:
+            self.retry_budget = self.settings['retry_budget']
+
+    def stats(self):
+        """Counts of delayed, throttled and retried requests"""
+        with self.lock:
+            return dict(self.counts)
+
+    def log_stats(self):
+        """Write the rate limiting statistics to the log"""
+        stats = self.stats()
+        self.__log__.info("Rate limiting: %d requests delayed, %d throttled, %d retried, "
+                          "%d not retried for lack of budget",
+                          stats.get('delayed', 0), stats.get('throttled', 0),
+                          stats.get('retries', 0), stats.get('budget_exhausted', 0))
+
+    @staticmethod
+    def configure(settings):
+        """Replace the shared limiter with one using the provided settings"""
+        RateLimiter.__shared__ = RateLimiter(settings)
+        return RateLimiter.__shared__
+
+    @staticmethod
+    def shared():
+        """Get the limiter shared by all requests"""
+        if RateLimiter.__shared__ is None:
+            RateLimiter.__shared__ = RateLimiter()
+        return RateLimiter.__shared__
@@ -0,0 +1,113 @@
+"""Pre-aggregated statistics of the saved exposes. Every expose is counted,
+   when it is first saved, in histograms of its price, size and price per
+   square metre, kept per day and crawler. The statistics page reads these
+   rollups instead of the exposes, so its cost depends on the number of days
+   shown, not on the number of exposes saved. Quantiles are estimated from
+   the histograms, to within a bucket"""
+import datetime
+from collections import Counter, defaultdict
+
+BUCKET_WIDTHS = {
+    'count': 1,
+    'price': 100,
+    'size': 10,
+    'price_per_sqm': 0.5
+}
+
+# prices and sizes outside these ranges are typos or not monthly rents, and
+# would distort the price per square metre
+PLAUSIBLE_PRICE = (100, 4000)
+PLAUSIBLE_SIZE = (10, 300)
+
+WEEKDAYS = ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat']
+
+def bucket(metric, value):
+    """The lower bound of the histogram bucket of the value"""
+    width = BUCKET_WIDTHS[metric]
+    return (value // width) * width
+
+def expose_buckets(price, size):
+    """The (metric, bucket) pairs that an expose with the given price and size,
+       either of which may be None, is counted in"""
+    res = [('count', 0)]
+    if price is not None:
+        res.append(('price', bucket('price', price)))
+    if size is not None:
+        res.append(('size', bucket('size', size)))
+    if price is not None and size is not None \
+            and PLAUSIBLE_PRICE[0] < price < PLAUSIBLE_PRICE[1] \
+            and PLAUSIBLE_SIZE[0] < size < PLAUSIBLE_SIZE[1]:
+        res.append(('price_per_sqm', bucket('price_per_sqm', price / size)))
+    return res
+
+def bucket_key(metric, metric_bucket):
+    """A name for the bucket of the metric, made of the metric and the number
+       of the bucket, for back-ends that store the buckets as named fields"""
+    return '%s_%d' % (metric, round(metric_bucket / BUCKET_WIDTHS[metric]))
+
+def parse_bucket_key(key):
+    """The (metric, bucket) pair that bucket_key named"""
+    metric, number = key.rsplit('_', 1)
+    return metric, int(number) * BUCKET_WIDTHS[metric]
+
+class Rollup:
+    """Histograms of the metrics, merged over any number of rollup rows"""
+
+    def __init__(self):
+        self.histograms = defaultdict(Counter)
+
+    def add(self, metric, metric_bucket, count):
+        """Count 'count' exposes in the bucket of the metric"""
+        self.histograms[metric][metric_bucket] += count
+
+    @property
+    def count(self):
+        """Number of exposes counted"""
+        return self.histograms['count'][0]
+
+    def quantile(self, metric, fraction):
+        """Estimates the value below which the fraction of the counted values of
+           the metric lies, interpolating within the buckets"""
+        histogram = self.histograms[metric]
+        total = sum(histogram.values())
+        if total == 0:
+            return None
+        target = fraction * total
+        seen = 0
+        for metric_bucket in sorted(histogram):
+            count = histogram[metric_bucket]
+            if seen + count >= target:
+                return metric_bucket + BUCKET_WIDTHS[metric] * (target - seen) / count
+            seen += count
+        return max(histogram) + BUCKET_WIDTHS[metric]
+
+    def box(self, metric):
+        """Quantiles of the metric for a box plot, or None if there are none"""
+        if not self.histograms[metric]:
+            return None
+        return {name: round(self.quantile(metric, fraction), 2) for (name, fraction) in
+                [('lowerfence', 0.05), ('q1', 0.25), ('median', 0.5), ('q3', 0.75),
+                 ('upperfence', 0.95)]}
+
+def summarize(rows, today=None):
+    """Statistics for the statistics page from rollup rows: the price per
+       square metre by week, counting back from today, and the number of
+       exposes by day of the week and by crawler"""
+    today = datetime.date.today() if today is None else today
+    weeks = defaultdict(Rollup)
+    weekdays = [0] * 7
+    crawlers = Counter()
+    for (day, crawler, metric, metric_bucket, count) in rows:
+        date = datetime.date.fromisoformat(day)
+        weeks[(today - date).days // 7].add(metric, metric_bucket, count)
+        if metric == 'count':
+            weekdays[(date.weekday() + 1) % 7] += count
+            crawlers[crawler] += count
+    return {
+        'weeks': [{'start': (today - datetime.timedelta(days=7 * week + 6)).isoformat(),
+                   'count': weeks[week].count,
+                   'price_per_sqm': weeks[week].box('price_per_sqm')}
+                  for week in sorted(weeks)],
+        'weekdays': dict(zip(WEEKDAYS, weekdays)),
+        'crawlers': dict(crawlers)
+    }
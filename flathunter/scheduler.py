@@ -0,0 +1,150 @@
+"""Adaptive polling of the configured search URLs. Instead of crawling every
+   URL after one fixed sleep, each URL gets its own polling interval: it is
+   shortened when a crawl of the URL finds new exposes, and lengthened while
+   the search stays quiet, within the configured bounds. A random jitter keeps
+   the requests from following a fixed rhythm"""
+import time
+import random
+import logging
+import threading
+
+class UrlSchedule:
+    """Polling state of a single search URL"""
+
+    def __init__(self, url, interval, next_run):
+        self.url = url
+        self.interval = interval
+        self.next_run = next_run
+        self.runs = 0
+        self.new_exposes = 0
+        self.productive_runs = 0
+        self.churn = 0.0
+
+    def stats(self):
+        """Current state, for the logs and the statistics page"""
+        return {
+            'interval': round(self.interval),
+            'next_run': self.next_run,
+            'runs': self.runs,
+            'productive_runs': self.productive_runs,
+            'new_exposes': self.new_exposes,
+            'churn': round(self.churn, 2)
+        }
+
+class Scheduler:
+    """Decides which URLs are due for crawling, and adapts the interval of each
+       URL to how often it produces new exposes"""
+
+    __log__ = logging.getLogger('flathunt')
+
+    DEFAULT_SETTINGS = {
+        'sleeping_time': 600,
+        'min_sleeping_time': 120,
+        'max_sleeping_time': 3600,
+        'jitter': 0.1,
+        'speed_up': 0.5,
+        'slow_down': 1.5,
+        'smoothing': 0.3
+    }
+
+    def __init__(self, urls, settings=None, clock=time.time):
+        self.settings = dict(self.DEFAULT_SETTINGS)
+        if settings is not None:
+            self.settings.update(settings)
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.skipped_runs = 0
+        now = self.clock()
+        self.schedules = {url: UrlSchedule(url, self.bounded(self.settings['sleeping_time']), now)
+                          for url in urls}
+
+    def bounded(self, interval):
+        """Clamp an interval to the configured minimum and maximum"""
+        return min(self.settings['max_sleeping_time'],
+                   max(self.settings['min_sleeping_time'], interval))
+
+    def jittered(self, interval):
+        """Spread an interval randomly by the configured jitter fraction"""
+        jitter = self.settings['jitter']
+        return interval * random.uniform(1 - jitter, 1 + jitter)
+
+    def due_urls(self, now=None):
+        """The URLs whose next crawl is due"""
+        now = self.clock() if now is None else now
+        return [url for url, schedule in self.schedules.items() if schedule.next_run <= now]
+
+    def seconds_until_next_run(self, now=None):
+        """Seconds to wait until the next URL is due. Without any URLs, this is
+           the configured sleeping time"""
+        if not self.schedules:
+            return self.settings['sleeping_time']
+        now = self.clock() if now is None else now
+        next_run = min(schedule.next_run for schedule in self.schedules.values())
+        return max(0, next_run - now)
+
+    def record(self, url, new_exposes, now=None):
+        """Adapt the interval of a URL to the number of new exposes its latest
+           crawl found, and schedule its next crawl"""
+        now = self.clock() if now is None else now
+        schedule = self.schedules[url]
+        schedule.runs += 1
+        schedule.new_exposes += new_exposes
+        smoothing = self.settings['smoothing']
+        schedule.churn = smoothing * (1 if new_exposes > 0 else 0) \
+                         + (1 - smoothing) * schedule.churn
+        previous = schedule.interval
+        if new_exposes > 0:
+            schedule.productive_runs += 1
+            schedule.interval = self.bounded(previous * self.settings['speed_up'])
+        else:
+            schedule.interval = self.bounded(previous * self.settings['slow_down'])
+        delay = self.jittered(schedule.interval)
+        schedule.next_run = now + delay
+        self.__log__.info("%d new exposes at %s, polling every %ds (was %ds), next in %ds",
+                          new_exposes, url, schedule.interval, previous, delay)
+
+    def run_due(self, hunt, now=None):
+        """Run hunt(urls) for the URLs that are due. hunt has to return the number
+           of new exposes found at each URL, as a dict. If a previous run is still
+           in progress, nothing is run and None is returned"""
+        if not self.lock.acquire(blocking=False):
+            self.skipped_runs += 1
+            self.__log__.warning("Previous hunt still running, skipping this one")
+            return None
+        try:
+            urls = self.due_urls(now)
+            if not urls:
+                self.__log__.debug("No URLs due for crawling")
+                return {}
+            self.__log__.info("Crawling %d of %d URLs", len(urls), len(self.schedules))
+            try:
+                new_exposes = hunt(urls)
+            except Exception:
+                # back off from the failing URLs instead of retrying at once
+                for url in urls:
+                    self.record(url, 0)
+                raise
+            for url in urls:
+                self.record(url, new_exposes.get(url, 0))
+            self.__log__.info("Next crawl in %ds", self.seconds_until_next_run())
+            return new_exposes
+        finally:
+            self.lock.release()
+
+    def stats(self):
+        """Scheduling state of every URL, and the number of skipped runs"""
+        return {
+            'urls': {url: schedule.stats() for url, schedule in self.schedules.items()},
+            'skipped_runs': self.skipped_runs
+        }
+
+    @staticmethod
+    def from_config(config):
+        """Create a scheduler from the 'loop' config section. Returns None unless
+           adaptive polling is enabled"""
+        settings = config.get('loop', dict()) or dict()
+        if not settings.get('adaptive', False):
+            return None
+        return Scheduler(config.get('urls', list()),
+                         {key: value for key, value in settings.items()
+                          if key in Scheduler.DEFAULT_SETTINGS})
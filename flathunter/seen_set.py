@@ -0,0 +1,169 @@
+"""Memory-resident set of the processed expose ids, in front of the storage
+   back-end. Nearly every crawled expose has been processed before, and the
+   set answers those lookups without a database query. The ids are kept in a
+   sorted array of 64-bit integers, packed with a code for the crawler, which
+   takes 8 bytes per id and is searched by bisection; ids marked since the set
+   was loaded are collected in a dict and merged into the array in bulk.
+
+   The set is exact, so an id it holds has certainly been processed. An id it
+   does not hold may still have been processed by another process sharing the
+   storage, e.g. a second instance of the web service, so such lookups fall
+   back to the back-end - unless the set is configured as 'exclusive'"""
+import sys
+import heapq
+import logging
+import threading
+from array import array
+from bisect import bisect_left
+
+CRAWLER_BITS = 8
+
+class SeenSet:
+    """Processed (id, crawler) pairs, loaded from the back-end on first use.
+       As in the back-ends, an id processed without a crawler counts as
+       processed for every crawler. The loader should yield the pairs in
+       ascending order of the id, so that they can be read straight into the
+       array"""
+
+    __log__ = logging.getLogger('flathunt')
+
+    MERGE_THRESHOLD = 4096
+
+    def __init__(self, loader, exclusive=False):
+        self.loader = loader
+        self.exclusive = exclusive
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.keys = array('q')
+        self.pending = {}
+        self.codes = {'': 0}
+        self.hits = 0
+        self.misses = 0
+        self.fallbacks = 0
+        self.stale = 0
+
+    def code(self, crawler):
+        """Small integer standing for a crawler name"""
+        crawler = crawler or ''
+        code = self.codes.get(crawler)
+        if code is None:
+            code = len(self.codes)
+            if code >= 1 << CRAWLER_BITS:
+                raise ValueError("Too many crawlers for the seen set")
+            self.codes[crawler] = code
+        return code
+
+    def load(self):
+        """Reads all processed ids from the back-end, if not done yet. Must be
+           called with the lock held"""
+        if self.loaded:
+            return
+        keys = array('q')
+        ordered = True
+        for (expose_id, crawler) in self.loader():
+            key = int(expose_id) << CRAWLER_BITS | self.code(crawler)
+            # keys of the same id may come in any order, see codes_of
+            ordered = ordered and (not keys or key >> CRAWLER_BITS >= keys[-1] >> CRAWLER_BITS)
+            keys.append(key)
+        if not ordered:
+            self.__log__.warning("Processed ids were not loaded in order, sorting them")
+            keys = array('q', sorted(keys))
+        self.keys = keys
+        self.loaded = True
+        self.__log__.debug("Loaded %d processed ids into the seen set", len(self.keys))
+
+    def codes_of(self, expose_id):
+        """The codes of the crawlers for which the id was processed"""
+        expose_id = int(expose_id)
+        res = set(self.pending.get(expose_id, ()))
+        idx = bisect_left(self.keys, expose_id << CRAWLER_BITS)
+        while idx < len(self.keys) and self.keys[idx] >> CRAWLER_BITS == expose_id:
+            res.add(self.keys[idx] & ((1 << CRAWLER_BITS) - 1))
+            idx += 1
+        return res
+
+    def lookup(self, expose_id, crawler=None):
+        """True if the expose has been processed, False if it certainly has not,
+           and None if only the back-end can tell"""
+        with self.lock:
+            self.load()
+            codes = self.codes_of(expose_id)
+            if codes and (crawler is None or 0 in codes or self.code(crawler) in codes):
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False if self.exclusive else None
+
+    def add_many(self, keys):
+        """Record that the (id, crawler) pairs have been processed"""
+        with self.lock:
+            self.load()
+            for (expose_id, crawler) in keys:
+                self.pending.setdefault(int(expose_id), set()).add(self.code(crawler))
+            if len(self.pending) >= self.MERGE_THRESHOLD:
+                self.merge()
+
+    def merge(self):
+        """Merges the pending ids into the sorted array. Must be called with the
+           lock held"""
+        new_keys = sorted(expose_id << CRAWLER_BITS | code
+                          for (expose_id, codes) in self.pending.items() for code in codes)
+        # merged straight into a new array, without a list of the whole history
+        self.keys = array('q', heapq.merge(self.keys, new_keys))
+        self.pending = {}
+
+    def is_processed(self, expose_id, crawler, fallback):
+        """Answers is_processed from the set where it can, and asks the
+           fallback(expose_id, crawler) of the back-end otherwise"""
+        known = self.lookup(expose_id, crawler)
+        if known is not None:
+            return known
+        processed = fallback(expose_id, crawler)
+        with self.lock:
+            self.fallbacks += 1
+            self.stale += 1 if processed else 0
+        if processed:
+            self.add_many([(expose_id, crawler)])
+        return processed
+
+    def filter_unseen(self, keys, fallback):
+        """Answers filter_unseen from the set where it can, passing only the
+           pairs it does not know to the fallback(keys) of the back-end"""
+        keys = list(keys)
+        known = [self.lookup(*key) for key in keys]
+        unknown = [key for (key, processed) in zip(keys, known) if processed is None]
+        unseen = set()
+        if unknown:
+            unseen = set(fallback(unknown))
+            processed = [key for key in unknown if key not in unseen]
+            with self.lock:
+                self.fallbacks += len(unknown)
+                self.stale += len(processed)
+            self.add_many(processed)
+        return [key for (key, processed) in zip(keys, known)
+                if processed is False or (processed is None and key in unseen)]
+
+    def stats(self):
+        """Size and memory use of the set, and how often it answered lookups.
+           The set has no false positives; 'stale' counts the ids it missed
+           because another process had marked them"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'ids': len(self.keys) + sum(len(codes) for codes in self.pending.values()),
+                'bytes': self.keys.itemsize * len(self.keys) + sys.getsizeof(self.pending),
+                'lookups': lookups,
+                'hits': self.hits,
+                'misses': self.misses,
+                'fallbacks': self.fallbacks,
+                'stale': self.stale
+            }
+
+    def log_stats(self):
+        """Write the statistics of the set to the log"""
+        stats = self.stats()
+        self.__log__.info("Seen set: %d ids in %d KiB, %d of %d lookups answered from memory, "
+                          "%d from the database (%d processed elsewhere)",
+                          stats['ids'], stats['bytes'] / 1024,
+                          stats['lookups'] - stats['fallbacks'], stats['lookups'],
+                          stats['fallbacks'], stats['stale'])
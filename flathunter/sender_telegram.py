@@ -1,4 +1,5 @@
 """Functions and classes related to sending Telegram messages"""
+import asyncio
 import urllib.request
 import urllib.parse
 import urllib.error
@@ -32,7 +33,8 @@ class SenderTelegram(Processor):
         else:
             self.receiver_ids = receivers
 
-        self.id_watch = IdMaintainer('%s/processed_ids.db' % config.database_location())
+        self.id_watch = IdMaintainer('%s/processed_ids.db' % config.database_location(),
+                                     config.get('database', dict()))
 
         self.updater = telegram_updater# Updater(token=self.bot_token, use_context=True)
         # self.updater.start_polling()
@@ -93,6 +95,11 @@ class SenderTelegram(Processor):
         self.send_msg(message, expose)
         return expose
 
+    async def process_expose_async(self, expose):
+        """Send the message from a worker thread, so that the Telegram API call
+           does not block the event loop"""
+        return await asyncio.get_running_loop().run_in_executor(None, self.process_expose, expose)
+
     def send_msg(self, message, expose=None):
         """Send messages to each of the receivers in receiver_ids"""
         if self.receiver_ids is None:
@@ -0,0 +1,152 @@
+"""Shared, connection-pooled HTTP sessions. All crawlers and processors fetch
+   through the SessionPool, so that repeated requests to the same portal reuse
+   kept-alive TCP/TLS connections instead of doing a new handshake each time"""
+import time
+import logging
+import threading
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from flathunter.rate_limiter import RateLimiter, RETRY_STATUS_CODES
+from flathunter.standin import rewrite_url
+
+try:
+    import brotli # pylint: disable=unused-import
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+class SessionPool:
+    """Keeps one keep-alive requests.Session per host"""
+
+    __log__ = logging.getLogger('flathunt')
+    __shared__ = None
+
+    DEFAULT_SETTINGS = {
+        'pool_connections': 4,
+        'pool_maxsize': 10,
+        'timeout': 30,
+        'compression': True,
+        'max_parallel_requests': 4,
+        'standin_url': None
+    }
+
+    def __init__(self, settings=None):
+        self.settings = dict(self.DEFAULT_SETTINGS)
+        if settings is not None:
+            self.settings.update(settings)
+        self.sessions = {}
+        self.request_counts = {}
+        self.host_limits = {}
+        self.lock = threading.Lock()
+
+    def create_session(self):
+        """Build a new session with the configured pool sizes and default headers"""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.settings['pool_connections'],
+                              pool_maxsize=self.settings['pool_maxsize'])
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if self.settings['compression']:
+            session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+        else:
+            session.headers['Accept-Encoding'] = 'identity'
+        return session
+
+    def session_for(self, url):
+        """Returns the session for the host of the provided URL"""
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.sessions:
+                self.sessions[host] = self.create_session()
+                self.request_counts[host] = 0
+            self.request_counts[host] += 1
+            return self.sessions[host]
+
+    def host_limit(self, url):
+        """Returns the semaphore bounding the number of parallel requests to
+           the host of the provided URL"""
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.host_limits:
+                self.host_limits[host] = threading.BoundedSemaphore(
+                    self.settings['max_parallel_requests'])
+            return self.host_limits[host]
+
+    def get(self, url, **kwargs):
+        """Issue a GET request through the pooled session for the URL's host. At
+           most 'max_parallel_requests' requests to one host run at the same time,
+           at the rate allowed by the RateLimiter, which also decides whether
+           failed requests are retried. With 'standin_url' set, the request is
+           sent to the local portal stand-in instead"""
+        kwargs.setdefault('timeout', self.settings['timeout'])
+        limiter = RateLimiter.shared()
+        target = rewrite_url(url, self.settings['standin_url'])
+        attempt = 0
+        while True:
+            limiter.acquire(url)
+            session = self.session_for(url)
+            try:
+                with self.host_limit(url):
+                    resp = session.get(target, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as error:
+                delay = limiter.retry_delay(url, attempt)
+                if delay is None:
+                    raise error
+                self.__log__.warning("Request to %s failed: %s", url, error)
+            else:
+                limiter.record(url, resp.status_code)
+                if resp.status_code not in RETRY_STATUS_CODES:
+                    return resp
+                delay = limiter.retry_delay(url, attempt, resp.headers.get('Retry-After'))
+                if delay is None:
+                    return resp
+            time.sleep(delay)
+            attempt += 1
+
+    def stats(self):
+        """Per-host counts of requests made, connections opened and connections reused"""
+        res = {}
+        with self.lock:
+            for host, session in self.sessions.items():
+                connections = 0
+                for adapter in set(session.adapters.values()):
+                    pools = adapter.poolmanager.pools
+                    for key in pools.keys():
+                        connections += getattr(pools[key], 'num_connections', 0)
+                requests_made = self.request_counts[host]
+                res[host] = {'requests': requests_made,
+                             'connections': connections,
+                             'reused': max(requests_made - connections, 0)}
+        return res
+
+    def log_stats(self):
+        """Write the connection reuse statistics to the log"""
+        for host, stats in self.stats().items():
+            self.__log__.info("%s: %d requests over %d connections (%d reused)",
+                              host, stats['requests'], stats['connections'], stats['reused'])
+
+    def close(self):
+        """Close all pooled sessions and their connections"""
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions = {}
+            self.request_counts = {}
+
+    @staticmethod
+    def configure(settings):
+        """Replace the shared pool with one using the provided settings"""
+        if SessionPool.__shared__ is not None:
+            SessionPool.__shared__.close()
+        SessionPool.__shared__ = SessionPool(settings)
+        return SessionPool.__shared__
+
+    @staticmethod
+    def shared():
+        """Get the pool shared by all crawlers and processors"""
+        if SessionPool.__shared__ is None:
+            SessionPool.__shared__ = SessionPool()
+        return SessionPool.__shared__
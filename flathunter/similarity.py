@@ -0,0 +1,148 @@
+"""Detection of the same flat listed on several portals. Every expose gets a
+   MinHash signature over its features - normalized address words, size,
+   rooms, price and pairs of title words - and is filed under one
+   locality-sensitive hashing bucket per band of the signature. Exposes that
+   look alike are likely to share a bucket, so a new expose only has to be
+   compared with the few recent exposes in its buckets"""
+import re
+import json
+import zlib
+import random
+import logging
+import datetime
+
+from flathunter.abstract_processor import Processor
+from flathunter.expose_helper import ExposeHelper
+
+NUM_HASHES = 32
+BANDS = 8
+ROWS = NUM_HASHES // BANDS
+PRIME = (1 << 61) - 1
+
+_rand = random.Random(4711)
+COEFFICIENTS = [(_rand.randrange(1, PRIME), _rand.randrange(0, PRIME))
+                for _ in range(NUM_HASHES)]
+
+UMLAUTS = [('ä', 'ae'), ('ö', 'oe'), ('ü', 'ue'), ('ß', 'ss')]
+
+def normalize(text):
+    """Lower-case the text, spell out umlauts and drop all punctuation"""
+    text = text.lower()
+    for umlaut, replacement in UMLAUTS:
+        text = text.replace(umlaut, replacement)
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', text).split())
+
+def number(read, expose):
+    """A number read from the expose by one of the ExposeHelper methods"""
+    try:
+        return read(expose)
+    except (KeyError, TypeError):
+        return None
+
+def features(expose):
+    """The set of features of an expose that the signature is computed over"""
+    res = set()
+    words = normalize(expose.get('title', '')).split()
+    res.update('title:%s %s' % pair for pair in zip(words, words[1:]))
+    address = expose.get('address') or ''
+    if not address.startswith('http'):
+        res.update('address:' + word for word in normalize(address).split())
+    price = number(ExposeHelper.get_price, expose)
+    if price is not None:
+        res.add('price:%d' % round(price / 50))
+    size = number(ExposeHelper.get_size, expose)
+    if size is not None:
+        res.add('size:%d' % round(size))
+    rooms = number(ExposeHelper.get_rooms, expose)
+    if rooms is not None:
+        res.add('rooms:%g' % rooms)
+    return res
+
+def signature(expose):
+    """The MinHash signature of the expose, or None if it has no features"""
+    hashes = [zlib.crc32(feature.encode('utf-8')) for feature in features(expose)]
+    if not hashes:
+        return None
+    return [min((a * value + b) % PRIME for value in hashes) for (a, b) in COEFFICIENTS]
+
+def buckets(sig):
+    """The LSH bucket of each band of the signature"""
+    return ['%d:%08x' % (band, zlib.crc32(json.dumps(sig[band * ROWS:(band + 1) * ROWS])
+                                          .encode('utf-8')))
+            for band in range(BANDS)]
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of the features behind two signatures"""
+    return sum(1 for (a, b) in zip(sig_a, sig_b) if a == b) / NUM_HASHES
+
+class DuplicateIndex:
+    """Similarity index over the fingerprints of recent exposes, kept in the
+       database by the id_watch"""
+
+    __log__ = logging.getLogger('flathunt')
+
+    def __init__(self, id_watch, threshold=0.6, max_age_days=14):
+        self.id_watch = id_watch
+        self.threshold = threshold
+        self.max_age = datetime.timedelta(days=max_age_days)
+
+    def find_duplicate(self, expose, sig, expose_buckets):
+        """Returns (id, crawler, similarity) of the most similar recent expose
+           of another portal, if any is similar enough"""
+        best = None
+        since = datetime.datetime.now() - self.max_age
+        for (expose_id, crawler, other) in \
+                self.id_watch.get_fingerprint_candidates(expose_buckets, since):
+            if crawler == expose['crawler']:
+                continue
+            score = similarity(sig, other)
+            if score >= self.threshold and (best is None or score > best[2]):
+                best = (expose_id, crawler, score)
+        return best
+
+    def add(self, expose, sig, expose_buckets):
+        """File the fingerprint of the expose"""
+        self.id_watch.save_fingerprint(expose, sig, expose_buckets)
+
+    def prune(self):
+        """Drop the fingerprints that are too old to be matched"""
+        self.id_watch.delete_fingerprints_before(datetime.datetime.now() - self.max_age)
+
+class DuplicateFilterProcessor(Processor):
+    """Drops exposes that are near-duplicates of a recent expose from another
+       portal, so that the same flat is not enriched and notified twice"""
+
+    __log__ = logging.getLogger('flathunt')
+
+    def __init__(self, config, id_watch):
+        self.config = config
+        settings = config.get('duplicates', dict()) or dict()
+        self.index = DuplicateIndex(id_watch, settings.get('threshold', 0.6),
+                                    settings.get('max_age_days', 14))
+        self.index.prune()
+        self.suppressed = 0
+
+    def is_unique(self, expose):
+        """Files the expose in the index. Returns False if it duplicates an
+           expose filed before"""
+        sig = signature(expose)
+        if sig is None:
+            return True
+        expose_buckets = buckets(sig)
+        duplicate = self.index.find_duplicate(expose, sig, expose_buckets)
+        self.index.add(expose, sig, expose_buckets)
+        if duplicate is None:
+            return True
+        self.suppressed += 1
+        self.__log__.info("Expose %s from %s duplicates %s from %s (similarity %.2f)",
+                          expose['id'], expose['crawler'], *duplicate)
+        return False
+
+    def process_exposes(self, exposes):
+        return filter(self.is_unique, exposes)
+
+    async def process_expose_async(self, expose):
+        """Drop the expose if it is a duplicate"""
+        if self.is_unique(expose):
+            return expose
+        return None
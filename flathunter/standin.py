@@ -0,0 +1,461 @@
+"""Local stand-in for the property portals, for load testing and benchmarking
+   the crawlers without network access. The StandinServer serves synthetic
+   result and expose pages for ImmoScout, Immowelt, WG-Gesucht and eBay
+   Kleinanzeigen, built from templates modeled on the pages the crawlers
+   parse. With the 'standin_url' setting of the 'http' config section, the
+   SessionPool sends every request to the stand-in instead of the portal,
+   with the portal's host as the first path segment, so the crawlers run
+   against it unchanged.
+
+   Run it on its own with: python -m flathunter.standin --port 8080"""
+import re
+import json
+import time
+import zlib
+import random
+import logging
+import argparse
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+def rewrite_url(url, standin_url):
+    """The URL at which the stand-in serves the page of a portal URL. Returns
+       the URL unchanged if no stand-in is configured"""
+    if not standin_url:
+        return url
+    parsed = urlparse(url)
+    target = '%s/%s%s' % (standin_url.rstrip('/'), parsed.netloc, parsed.path or '/')
+    if parsed.query:
+        target += '?' + parsed.query
+    return target
+
+MAX_LISTINGS = 1000
+
+STREETS = ['Invalidenstraße', 'Oranienstraße', 'Kastanienallee', 'Sonnenallee',
+           'Bergmannstraße', 'Schönhauser Allee', 'Karl-Marx-Straße', 'Danziger Straße']
+DISTRICTS = ['Mitte', 'Kreuzberg', 'Prenzlauer Berg', 'Neukölln', 'Friedrichshain',
+             'Schöneberg', 'Wedding', 'Moabit']
+TITLES = ['Helle Wohnung mit Balkon', 'Altbau mit Dielen', 'Ruhige Wohnung im Hinterhaus',
+          'Sonnige Wohnung am Park', 'Erstbezug nach Sanierung', 'Dachgeschoss mit Ausblick']
+
+class Listing:
+    """A synthetic expose, with details derived from its id so that every
+       request for it returns the same page"""
+
+    def __init__(self, expose_id):
+        rand = random.Random(expose_id)
+        self.id = expose_id
+        self.title = rand.choice(TITLES)
+        self.rooms = rand.randint(1, 5)
+        self.size = rand.randint(25, 140)
+        self.price = self.size * rand.randint(10, 20)
+        self.street = '%s %d' % (rand.choice(STREETS), rand.randint(1, 120))
+        self.district = rand.choice(DISTRICTS)
+        self.from_date = '%02d.%02d.2021' % (rand.randint(1, 28), rand.randint(1, 12))
+
+    @staticmethod
+    def euro(amount):
+        """Format an amount as the portals do"""
+        return '{:,} &euro;'.format(amount).replace(',', '.')
+
+class Portal:
+    """Generates the pages of one portal. Subclasses provide the templates"""
+
+    HOST = None
+    ID_BASE = 0
+    DETAIL_PATH = None
+
+    def listing_ids(self, path, page_no, settings):
+        """The expose ids on a page of the search at 'path'. Different searches
+           have different listings, of which there are at most MAX_LISTINGS"""
+        first = (page_no - 1) * settings['page_size']
+        last = min(first + settings['page_size'], settings['listings'], MAX_LISTINGS)
+        search = (zlib.crc32(path.encode('utf-8')) % 100000) * 1000
+        return [self.ID_BASE + search + position for position in range(first, last)]
+
+    # pylint: disable=unused-argument,no-self-use
+    def page_no(self, query):
+        """The number of the requested result page"""
+        return 1
+
+    def render(self, path, query, settings):
+        """Returns the HTML of the page at path"""
+        match = self.DETAIL_PATH.search(path)
+        if match is not None:
+            return self.expose_page(Listing(int(match[1])))
+        listings = [Listing(expose_id) for expose_id in
+                    self.listing_ids(path, self.page_no(query), settings)]
+        return self.result_page(listings, settings)
+
+    def result_page(self, listings, settings):
+        """HTML of a search result page. Implemented by the subclasses"""
+        raise NotImplementedError
+
+    def expose_page(self, listing):
+        """HTML of an expose page. Implemented by the subclasses"""
+        raise NotImplementedError
+
+class ImmobilienscoutPortal(Portal):
+    """Pages of www.immobilienscout24.de, paginated with 'pagenumber'"""
+
+    HOST = 'www.immobilienscout24.de'
+    ID_BASE = 120000000
+    DETAIL_PATH = re.compile(r'^/expose/(\d+)$')
+
+    def page_no(self, query):
+        return int(query.get('pagenumber', ['1'])[0])
+
+    def result_page(self, listings, settings):
+        items = ''.join("""
+  <li class="result-list__listing">
+    <div class="result-list-entry__gallery-container">
+      <div class="gallery-container"><img data-lazy-src="https://pictures.immobilienscout24.de/listings/%(id)d.jpg"></div>
+    </div>
+    <a class="result-list-entry__brand-title-container" href="/expose/%(id)d">
+      <h5 class="result-list-entry__brand-title">%(title)s</h5>
+    </a>
+    <div class="result-list-entry__address">%(street)s, %(district)s, Berlin</div>
+    <dl data-is24-qa="attributes">
+      <dt>Kaltmiete</dt><dd>%(price)s</dd>
+      <dt>Wohnfl&auml;che</dt><dd>%(size)d m&sup2;</dd>
+      <dt>Zimmer</dt><dd>%(rooms)d Zi.</dd>
+    </dl>
+  </li>""" % dict(vars(listing), price=Listing.euro(listing.price)) for listing in listings)
+        return """<!DOCTYPE html>
+<html lang="de">
+<head><title>Wohnung mieten in Berlin</title></head>
+<body>
+<div id="resultListHeader">
+  <h1><span data-is24-qa="resultlist-resultCount">%s</span> Wohnungen zur Miete in Berlin</h1>
+</div>
+<ul id="resultListItems" class="result-list__listing">%s
+</ul>%s
+</body>
+</html>""" % ('{:,}'.format(settings['listings']).replace(',', '.'), items,
+       self.result_list_model(listings, settings))
+
+    @staticmethod
+    def result_list_model(listings, settings):
+        """The script with the result list as JSON, which the portal embeds next
+           to the HTML, unless the 'structured_data' setting is off"""
+        if not settings.get('structured_data', True):
+            return ''
+        model = {'searchResponseModel': {'resultlist.resultlist': {
+            'paging': {'numberOfHits': settings['listings']},
+            'resultlistEntries': [{'resultlistEntry': [{
+                '@id': str(listing.id),
+                'resultlist.realEstate': {
+                    'title': listing.title,
+                    'address': {'description': {
+                        'text': '%s, %s, Berlin' % (listing.street, listing.district)}},
+                    'price': {'value': listing.price, 'currency': 'EUR'},
+                    'livingSpace': listing.size,
+                    'numberOfRooms': listing.rooms,
+                    'titlePicture': {'@xlink.href': 'https://pictures.immobilienscout24.de'
+                                                    '/listings/%d.jpg' % listing.id}
+                }} for listing in listings]}]}}}
+        return """
+<script>
+  IS24.resultList = {
+    resultListModel: %s
+  };
+</script>""" % json.dumps(model)
+
+    def expose_page(self, listing):
+        return """<!DOCTYPE html>
+<html lang="de">
+<body>
+<div class="sp-slides">
+  <img class="sp-image" data-src="https://pictures.immobilienscout24.de/listings/%(id)d-1.jpg/ORIG/resize/1106x830">
+  <img class="sp-image" data-src="https://pictures.immobilienscout24.de/listings/%(id)d-2.jpg/ORIG/resize/1106x830">
+</div>
+<dl><dt>Gesamtmiete</dt><dd class="is24qa-gesamtmiete grid-item three-fifths">%(total)s</dd></dl>
+<dl><dt>Bezugsfrei ab</dt><dd class="is24qa-bezugsfrei-ab grid-item three-fifths">%(from_date)s</dd></dl>
+</body>
+</html>""" % dict(vars(listing), total=Listing.euro(listing.price + 200))
+
+class ImmoweltPortal(Portal):
+    """Pages of www.immowelt.de"""
+
+    HOST = 'www.immowelt.de'
+    ID_BASE = 2000000
+    DETAIL_PATH = re.compile(r'^/expose/(\d+)$')
+
+    def result_page(self, listings, settings):
+        items = ''.join("""
+  <div class="listitem_wrap" data-estateid="%(id)d">
+    <a href="/expose/%(id)d">
+      <picture><img src="https://media-pics1.immowelt.org/%(id)d.jpg" alt=""></picture>
+      <h2>%(title)s</h2>
+    </a>
+    <div class="listlocation"><span class="icon-map-marker"></span>
+      Berlin (%(district)s)
+    </div>
+    <div class="hardfacts">
+      <div class="hardfact"><strong>%(price)s</strong><div>Kaltmiete</div></div>
+      <div class="hardfact">%(size)d m&sup2; <div>Wohnfl&auml;che (ca.)</div></div>
+      <div class="hardfact">%(rooms)d <div>Zimmer</div></div>
+    </div>
+  </div>""" % dict(vars(listing), price=Listing.euro(listing.price)) for listing in listings)
+        return """<!DOCTYPE html>
+<html lang="de">
+<head><title>Wohnungen mieten in Berlin</title></head>
+<body>
+<header><nav><a href="/">Start</a><h2>Suche speichern</h2></nav></header>
+<div id="listItemWrapperFixed">%s
+</div>
+<footer><h2>Immobilien in Berlin</h2></footer>
+</body>
+</html>""" % items
+
+    def expose_page(self, listing):
+        return """<!DOCTYPE html>
+<html lang="de">
+<body>
+<div id="divImmobilie">
+  <div class="clear">
+    <div class="iw_left">Die Wohnung</div>
+    <div class="iw_right"><p>%(title)s in %(district)s. Bezug: %(from_date)s</p></div>
+  </div>
+</div>
+</body>
+</html>""" % vars(listing)
+
+class EbayKleinanzeigenPortal(Portal):
+    """Pages of www.ebay-kleinanzeigen.de"""
+
+    HOST = 'www.ebay-kleinanzeigen.de'
+    ID_BASE = 1400000000
+    DETAIL_PATH = re.compile(r'^/s-anzeige/[^/]+/(\d+)-')
+
+    def result_page(self, listings, settings):
+        items = ''.join("""
+  <li class="ad-listitem lazyload-item">
+    <article class="aditem" data-adid="%(id)d">
+      <div class="aditem-image">
+        <div class="imagebox srpimagebox" data-imgsrc="https://i.ebayimg.com/00/s/%(id)d.JPG"></div>
+      </div>
+      <div class="aditem-main">
+        <h2 class="text-module-begin">
+          <a class="ellipsis" href="/s-anzeige/wohnung/%(id)d-203-3375">%(title)s</a>
+        </h2>
+        <p class="text-module-end">
+          <span class="simpletag tag-small">%(size)d m&sup2;</span>
+          <span class="simpletag tag-small">%(rooms)d Zimmer</span>
+        </p>
+      </div>
+      <div class="aditem-details">
+        <strong>%(price)s</strong><br>
+        10437 %(district)s
+      </div>
+    </article>
+  </li>""" % dict(vars(listing), price=Listing.euro(listing.price)) for listing in listings)
+        return """<!DOCTYPE html>
+<html lang="de">
+<head><title>Wohnung mieten in Berlin</title></head>
+<body>
+<div class="site-header"><a class="ellipsis" href="/s-meine-anzeigen">Meine Anzeigen</a></div>
+<ul id="srchrslt-adtable" class="itemlist ad-list">%s
+</ul>
+<div class="site-footer"><a class="ellipsis" href="/impressum">Impressum</a></div>
+</body>
+</html>""" % items
+
+    def expose_page(self, listing):
+        return """<!DOCTYPE html>
+<html lang="de">
+<body>
+<h1 id="viewad-title">%(title)s</h1>
+<span id="viewad-locality">10437 Berlin - %(district)s</span>
+<span id="street-address">%(street)s</span>
+<ul class="addetailslist">
+  <li class="addetailslist--detail">Zimmer<span>%(rooms)d</span></li>
+  <li class="addetailslist--detail">Verf&uuml;gbar ab<span>%(from_date)s</span></li>
+</ul>
+</body>
+</html>""" % vars(listing)
+
+class WgGesuchtPortal(Portal):
+    """Pages of www.wg-gesucht.de"""
+
+    HOST = 'www.wg-gesucht.de'
+    ID_BASE = 7000000
+    DETAIL_PATH = re.compile(r'\.(\d{7,})\.html$')
+
+    def result_page(self, listings, settings):
+        items = ''.join("""
+  <div class="wgg_card offer_list_item" id="liste-details-ad-%(id)d">
+    <div class="card_image"><a href="wohnungen-in-Berlin-%(slug)s.%(id)d.html" style="background-image: url(https://img.wg-gesucht.de/media/up/%(id)d.sized.jpg);"></a></div>
+    <div class="row">
+      <h3 class="truncate_title"><a href="wohnungen-in-Berlin-%(slug)s.%(id)d.html">%(title)s</a></h3>
+      <div class="col-xs-11"><span>%(rooms)d Zimmer Wohnung | Berlin %(district)s | %(street)s</span></div>
+    </div>
+    <div class="row middle">
+      <div class="col-xs-3"><b>%(price)d &euro;</b></div>
+      <div class="col-xs-5 text-center">%(from_date)s</div>
+      <div class="col-xs-3 text-right"><b>%(size)d m&sup2;</b></div>
+    </div>
+  </div>""" % dict(vars(listing), slug=listing.district.replace(' ', '-'))
+                        for listing in listings)
+        return """<!DOCTYPE html>
+<html lang="de">
+<head><title>Wohnungen in Berlin</title></head>
+<body>
+<div id="main_column">%s
+</div>
+</body>
+</html>""" % items
+
+    def expose_page(self, listing):
+        return """<!DOCTYPE html>
+<html lang="de">
+<body>
+<div class="row">
+  <div class="col-sm-4 mb10">
+    <a href="#" onclick="return false;">
+      %(street)s
+      10115 Berlin %(district)s
+    </a>
+  </div>
+</div>
+</body>
+</html>""" % vars(listing)
+
+PORTALS = {portal.HOST: portal for portal in [ImmobilienscoutPortal(), ImmoweltPortal(),
+                                               EbayKleinanzeigenPortal(), WgGesuchtPortal()]}
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """Serves the pages of the portal named by the first path segment"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        """Render the requested page, after the configured latency, or fail
+           at the configured error rate"""
+        standin = self.server.standin
+        parsed = urlparse(self.path)
+        host, _, path = parsed.path.lstrip('/').partition('/')
+        portal = PORTALS.get(host)
+        latency = standin.settings['latency']
+        if latency > 0:
+            time.sleep(latency)
+        if portal is None:
+            self.respond(404, b'Unknown portal')
+        elif standin.fail():
+            standin.count(host, 'errors')
+            self.respond(503, b'Service unavailable')
+        else:
+            standin.count(host, 'pages')
+            page = portal.render('/' + path, parse_qs(parsed.query), standin.settings)
+            self.respond(200, page.encode('utf-8'))
+
+    def respond(self, status, body):
+        """Send a complete response, keeping the connection alive"""
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        """Requests are counted, not logged"""
+
+class StandinServer:
+    """Local HTTP server standing in for the portals. 'listings' is the number
+       of results of every search, served 'page_size' at a time; each response
+       is delayed by 'latency' seconds, and fails with a 503 at 'error_rate'.
+       Without 'structured_data', pages carry no embedded JSON"""
+
+    __log__ = logging.getLogger('flathunt')
+
+    DEFAULT_SETTINGS = {
+        'listings': 60,
+        'page_size': 20,
+        'latency': 0.0,
+        'error_rate': 0.0,
+        'structured_data': True,
+        'seed': 1
+    }
+
+    def __init__(self, settings=None, host='127.0.0.1', port=0):
+        self.settings = dict(self.DEFAULT_SETTINGS)
+        if settings is not None:
+            self.settings.update(settings)
+        self.random = random.Random(self.settings['seed'])
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), StandinHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.standin = self
+        self.thread = None
+
+    @property
+    def url(self):
+        """Base URL of the server, for the 'standin_url' setting"""
+        host, port = self.httpd.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    def fail(self):
+        """Decide whether to fail the current request"""
+        with self.lock:
+            return self.random.random() < self.settings['error_rate']
+
+    def count(self, host, key):
+        """Count a served page or error"""
+        with self.lock:
+            self.counts[(host, key)] += 1
+
+    def stats(self):
+        """Numbers of pages and errors served, per portal"""
+        with self.lock:
+            res = {}
+            for (host, key), value in self.counts.items():
+                res.setdefault(host, {'pages': 0, 'errors': 0})[key] = value
+            return res
+
+    def start(self):
+        """Serve in a background thread"""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Shut the server down"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+def main():
+    """Run the stand-in until interrupted"""
+    parser = argparse.ArgumentParser(description="Serves synthetic portal pages for "
+                                     "crawling without network access")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--listings', type=int, default=StandinServer.DEFAULT_SETTINGS['listings'])
+    parser.add_argument('--page-size', type=int,
+                        default=StandinServer.DEFAULT_SETTINGS['page_size'])
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="Seconds to wait before each response")
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help="Fraction of requests answered with 503")
+    args = parser.parse_args()
+    server = StandinServer({'listings': args.listings, 'page_size': args.page_size,
+                            'latency': args.latency, 'error_rate': args.error_rate},
+                           port=args.port)
+    print("Serving portal pages at %s - set 'standin_url' in the 'http' config section"
+          % server.url)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -4,16 +4,13 @@ import json
 from flask import render_template
 
 from flathunter.web import app
-from flathunter.web.util import sanitize_float
+from flathunter.rollups import summarize
 
 @app.route('/stats')
 def stats_view():
-    """Render the statistics template"""
+    """Render the statistics template, from the rollups of the last four weeks"""
     hunter = app.config["HUNTER"]
-    exposes = json.dumps(
-        list(
-            map(lambda e: {'price': sanitize_float(e['price']),
-                           'size': sanitize_float(e['size']),
-                           'created_at': str(e['created_at'])},
-                hunter.get_exposes_since(datetime.datetime.now() - datetime.timedelta(days=28)))))
-    return render_template("statistics.html", title="Statistics", exposes=exposes)
+    today = datetime.date.today()
+    statistics = summarize(hunter.get_stats_since(today - datetime.timedelta(days=27)), today)
+    return render_template("statistics.html", title="Statistics",
+                           statistics=json.dumps(statistics))
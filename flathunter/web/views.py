@@ -119,9 +119,15 @@ def resources():
 def hunt():
     """Trigger the hunt"""
     hunter = app.config["HUNTER"]
-    hunter.hunt_flats()
+    if hunter.scheduler is None:
+        hunter.hunt_flats()
+        schedule = None
+    else:
+        hunter.hunt_due()
+        schedule = hunter.scheduler.stats()
     return jsonify(status="Success",
                    completedAt=str(hunter.get_last_run_time()),
+                   schedule=schedule,
                    body=render_template("exposes.html", exposes=hunter.get_recent_exposes())), \
            status.HTTP_201_CREATED
 
@@ -4,6 +4,10 @@ import logging
 from flathunter.hunter import Hunter
 from flathunter.filter import Filter
 from flathunter.processor import ProcessorChain
+from flathunter.page_cache import PageCache
+from flathunter.detail_cache import DetailPageCache
+from flathunter.sessions import SessionPool
+from flathunter.rate_limiter import RateLimiter
 
 class WebHunter(Hunter):
     """Flathunter implementation for website. Designed to hunt all exposes from
@@ -12,14 +16,19 @@ class WebHunter(Hunter):
 
     __log__ = logging.getLogger('flathunt')
 
-    def hunt_flats(self, max_pages=1):
-        """Crawl all URLs, and send notifications to users of new flats"""
+    def hunt_flats(self, max_pages=None, urls=None):
+        """Crawl all URLs, or the given subset of them, and send notifications to
+           users of new flats. Unless crawling incrementally, only the first page
+           of results is loaded"""
+        if max_pages is None and not self.incremental:
+            max_pages = 1
         filter_set = Filter.builder() \
                        .filter_already_seen(self.id_watch) \
                        .build()
 
         processor_chain = ProcessorChain.builder(self.config) \
-                                        .apply_filter(filter_set) \
+                                        .apply_filter(filter_set, ready=self.crawl_ready) \
+                                        .filter_duplicates(self.id_watch) \
                                         .crawl_expose_details() \
                                         .save_all_exposes(self.id_watch) \
                                         .resolve_addresses() \
@@ -27,8 +36,10 @@ class WebHunter(Hunter):
                                         .build()
 
         new_exposes = []
-        for expose in processor_chain.process(self.crawl_for_exposes(max_pages=max_pages)):
-            new_exposes.append(expose)
+        with self.id_watch.unit_of_work():
+            for expose in processor_chain.process(self.crawl_for_exposes(max_pages=max_pages,
+                                                                         urls=urls)):
+                new_exposes.append(expose)
 
         for (user_id, settings) in self.id_watch.get_user_settings():
             if 'mute_notifications' in settings:
@@ -41,6 +52,12 @@ class WebHunter(Hunter):
             for message in processor_chain.process(new_exposes):
                 self.__log__.debug("Sent expose %d to user %d", message['id'], user_id)
 
+        self.deduplicator.log_stats()
+        self.id_watch.log_stats()
+        SessionPool.shared().log_stats()
+        RateLimiter.shared().log_stats()
+        PageCache.shared().log_stats()
+        DetailPageCache.shared().log_stats()
         self.id_watch.update_last_run_time()
         return list(new_exposes)
 
@@ -56,6 +73,10 @@ class WebHunter(Hunter):
         """Return exposes since the provided datetime"""
         return self.id_watch.get_exposes_since(min_datetime)
 
+    def get_stats_since(self, min_date):
+        """Return the statistics rollups since the provided date"""
+        return self.id_watch.get_stats_since(min_date)
+
     def set_filters_for_user(self, user_id, filters):
         """Set the filters for a given user"""
         settings = self.id_watch.get_settings_for_user(user_id)
@@ -0,0 +1,96 @@
+import asyncio
+import threading
+import pytest
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from flathunter.async_sessions import AsyncSessionPool
+from flathunter.config import Config
+from flathunter.crawl_immowelt import CrawlImmowelt
+from flathunter.filter import Filter
+from flathunter.processor import ProcessorChain
+from dummy_crawler import DummyCrawler
+
+IMMOWELT_PAGE = b"""<html><body><div id="listItemWrapperFixed">
+<div class="listitem_wrap" data-estateid="1234">
+  <a href="/expose/1234"><h2>Helle Wohnung</h2></a>
+  <div class="listlocation"><span>Lage</span>Berlin (Mitte)</div>
+  <div class="hardfact"><strong>900 EUR</strong></div>
+  <div class="hardfact">70 m<div>Wohnflaeche</div></div>
+  <div class="hardfact">3<div>Zimmer</div></div>
+</div>
+</div></body></html>"""
+
+class PageHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(IMMOWELT_PAGE)))
+        self.end_headers()
+        self.wfile.write(IMMOWELT_PAGE)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def server():
+    httpd = HTTPServer(('127.0.0.1', 0), PageHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:%d' % httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_get_results_async(server):
+    async def crawl():
+        try:
+            return await CrawlImmowelt().get_results_async(server + '/liste/berlin')
+        finally:
+            await AsyncSessionPool.shared().close()
+    entries = asyncio.run(crawl())
+    assert len(entries) == 1
+    assert entries[0]['id'] == 1234
+    assert entries[0]['url'] == 'https://www.immowelt.de/expose/1234'
+    assert entries[0]['price'] == '900 EUR'
+
+def test_async_connections_are_reused(server):
+    async def fetch():
+        pool = AsyncSessionPool.shared()
+        for page in range(3):
+            await pool.get('%s/page/%d' % (server, page))
+        await pool.close()
+        return pool.stats()
+    stats = asyncio.run(fetch())
+    assert stats['requests'] == 3
+    assert stats['connections'] == 1
+    assert stats['reused'] == 2
+
+def test_dont_crawl_other_urls_async():
+    assert asyncio.run(CrawlImmowelt().crawl_async("https://www.example.com")) == []
+
+def test_process_async():
+    config = Config(string="urls: []")
+    crawler = DummyCrawler(addresses_as_links=True)
+    config.set_searchers([crawler])
+    exposes = crawler.get_results("https://www.example.com/search")
+    chain = ProcessorChain.builder(config) \
+                          .apply_filter(Filter.builder().max_size_filter(80).build()) \
+                          .resolve_addresses() \
+                          .build()
+    processed = asyncio.run(chain.process_async(exposes))
+    assert len(processed) > 0
+    assert len(processed) == len(list(Filter.builder().max_size_filter(80).build().filter(exposes)))
+    for expose in processed:
+        assert not expose['address'].startswith('http')
+
+def test_synchronous_crawlers_run_in_worker_thread():
+    exposes = asyncio.run(DummyCrawler().crawl_async("https://www.example.com/search"))
+    assert len(exposes) > 0
+
+def test_get_results_overrides_without_id_watch():
+    class LegacyCrawler(DummyCrawler):
+        def get_results(self, search_url, max_pages=None):
+            return [{'id': 1}]
+    crawler = LegacyCrawler()
+    assert list(crawler.crawl("https://www.example.com/search")) == [{'id': 1}]
+    assert asyncio.run(crawler.crawl_async("https://www.example.com/search")) == [{'id': 1}]
@@ -2,7 +2,11 @@ import unittest
 import tempfile
 import os.path
 import os
+import re
 from flathunter.config import Config 
+from flathunter.crawl_immowelt import CrawlImmowelt
+from flathunter.crawl_wggesucht import CrawlWgGesucht
+from dummy_crawler import DummyCrawler
 
 class ConfigTest(unittest.TestCase):
 
@@ -85,3 +89,38 @@ filters:
        config = Config(string=self.FILTERS_CONFIG)
        self.assertIsNotNone(config)
        self.assertEqual(config.database_location(), os.path.abspath(os.path.dirname(os.path.abspath(__file__)) + "/.."))
+
+    def test_routes_urls_to_searchers(self):
+       immowelt = CrawlImmowelt()
+       wggesucht = CrawlWgGesucht()
+       config = Config(string=self.DUMMY_CONFIG)
+       config.set_searchers([immowelt, wggesucht])
+       self.assertIs(config.searcher_for_url(config.get('urls')[0]), immowelt)
+       self.assertIs(config.searcher_for_url("https://www.wg-gesucht.de/wohnungen-in-Berlin.html"), wggesucht)
+       self.assertIsNone(config.searcher_for_url("https://www.example.com/expose/1"))
+
+    def test_routes_are_indexed_by_origin(self):
+       config = Config(string=self.DUMMY_CONFIG)
+       config.set_searchers([CrawlImmowelt(), DummyCrawler()])
+       self.assertIn("https://www.immowelt.de", config.build_routes())
+       self.assertIn("https://www.example.com", config.build_routes())
+
+    def test_routes_are_reset_with_searchers(self):
+       config = Config(string=self.DUMMY_CONFIG)
+       config.set_searchers([CrawlImmowelt()])
+       self.assertIsNotNone(config.searcher_for_url(config.get('urls')[0]))
+       config.set_searchers([DummyCrawler()])
+       self.assertIsNone(config.searcher_for_url(config.get('urls')[0]))
+
+    def test_routes_respect_patterns_on_the_path(self):
+       class ExposeCrawler(DummyCrawler):
+           URL_PATTERN = re.compile(r'https://www\.example\.com/expose/')
+       exposes = ExposeCrawler()
+       dummy = DummyCrawler()
+       config = Config(string=self.DUMMY_CONFIG)
+       config.set_searchers([exposes, dummy])
+       self.assertNotIn("https://www.example.com", config.build_routes())
+       self.assertIs(config.searcher_for_url("https://www.example.com/"), dummy)
+       self.assertIs(config.searcher_for_url("https://www.example.com/expose/1"), exposes)
+       config.set_searchers([dummy, exposes])
+       self.assertIs(config.searcher_for_url("https://www.example.com/expose/1"), dummy)
@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import Counter
+
+from flathunter.config import Config
+from flathunter.crawl_executor import CrawlExecutor
+from test_util import count
+
+class SlowCrawler:
+
+    def __init__(self, delays):
+        self.delays = delays
+        self.lock = threading.Lock()
+        self.running = Counter()
+        self.max_running = Counter()
+
+    def crawl(self, url, max_pages=None, id_watch=None):
+        host = url.split('/')[2]
+        with self.lock:
+            self.running[host] += 1
+            self.max_running[host] = max(self.max_running[host], self.running[host])
+        time.sleep(self.delays.get(url, 0.01))
+        with self.lock:
+            self.running[host] -= 1
+        return [{'id': url, 'crawler': 'SlowCrawler'}]
+
+def test_results_are_yielded_as_crawls_complete():
+    crawler = SlowCrawler({'https://slow.example.com/1': 0.5})
+    jobs = [(crawler, 'https://slow.example.com/1'),
+            (crawler, 'https://fast.example.com/1'),
+            (crawler, 'https://other.example.com/1')]
+    exposes = list(CrawlExecutor(max_workers=3).crawl(jobs))
+    assert [expose['id'] for expose in exposes][-1] == 'https://slow.example.com/1'
+    assert count(exposes) == 3
+
+def test_concurrent_crawls_take_as_long_as_the_slowest():
+    crawler = SlowCrawler({})
+    jobs = [(crawler, 'https://host%d.example.com/search' % i) for i in range(8)]
+    crawler.delays = {url: 0.2 for (_, url) in jobs}
+    start = time.time()
+    exposes = list(CrawlExecutor(max_workers=8).crawl(jobs))
+    assert count(exposes) == 8
+    assert time.time() - start < 1.0
+
+def test_per_host_limit_is_respected():
+    crawler = SlowCrawler({})
+    jobs = [(crawler, 'https://www.example.com/search/%d' % i) for i in range(6)]
+    exposes = list(CrawlExecutor(max_workers=6, per_host=2).crawl(jobs))
+    assert count(exposes) == 6
+    assert crawler.max_running['www.example.com'] <= 2
+
+def test_failing_crawls_are_skipped():
+    class BrokenCrawler:
+        def crawl(self, url, max_pages=None, id_watch=None):
+            raise ValueError("Broken markup")
+    jobs = [(BrokenCrawler(), 'https://www.example.com/broken'),
+            (SlowCrawler({}), 'https://www.example.com/ok')]
+    assert count(CrawlExecutor().crawl(jobs)) == 1
+
+def test_sequential_by_default():
+    assert CrawlExecutor.from_config(Config(string="urls: []")) is None
+    executor = CrawlExecutor.from_config(Config(string="concurrency:\n  workers: 4\n  per_host: 1"))
+    assert executor.max_workers == 4
+    assert executor.per_host == 1
+
+class StreamingCrawler:
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def crawl(self, url, max_pages=None, id_watch=None):
+        yield {'id': url + '/1', 'crawler': 'StreamingCrawler'}
+        self.release.wait(timeout=5)
+        yield {'id': url + '/2', 'crawler': 'StreamingCrawler'}
+
+def test_exposes_are_yielded_before_crawls_complete():
+    crawler = StreamingCrawler()
+    jobs = [(crawler, 'https://www.example.com/%d' % i) for i in range(2)]
+    exposes = CrawlExecutor(max_workers=2).crawl(jobs)
+    first = [next(exposes)['id'], next(exposes)['id']]
+    assert sorted(first) == ['https://www.example.com/0/1', 'https://www.example.com/1/1']
+    crawler.release.set()
+    assert count(exposes) == 2
+
+def test_stream_can_be_abandoned():
+    crawler = StreamingCrawler()
+    executor = CrawlExecutor(max_workers=2, buffer_size=1)
+    exposes = executor.crawl([(crawler, 'https://www.example.com/%d' % i) for i in range(4)])
+    next(exposes)
+    crawler.release.set()
+    start = time.time()
+    exposes.close()
+    assert time.time() - start < 1.0
@@ -1,6 +1,14 @@
+import re
+import threading
 import pytest
+import requests_mock
 
+from flathunter.abstract_crawler import Crawler
 from flathunter.crawl_immobilienscout import CrawlImmobilienscout
+from flathunter.detail_cache import DetailPageCache
+from flathunter.idmaintainer import IdMaintainer
+from flathunter.page_cache import PageCache
+from flathunter.standin import PORTALS, Listing
 
 TEST_URL = 'https://www.immobilienscout24.de/Suche/de/berlin/berlin/wohnung-mieten?numberofrooms=2.0-&price=-1500.0&livingspace=70.0-&sorting=2&pagenumber=1'
 
@@ -29,3 +37,123 @@ def test_process_expose_fetches_details(crawler):
     for expose in updated_entries:
         for attr in [ 'title', 'price', 'size', 'rooms', 'address', 'from' ]:
             assert expose[attr] is not None
+
+LISTING = """<li class="result-list__listing">
+  <div class="result-list-entry__gallery-container"></div>
+  <a class="result-list-entry__brand-title-container" href="/expose/%d"><h5>Wohnung</h5></a>
+  <div class="result-list-entry__address">Berlin</div>
+  <dl data-is24-qa="attributes"><dd>900 EUR</dd><dd>70 m2</dd><dd>3 Zi.</dd></dl>
+</li>"""
+
+def result_page(result_count, *expose_ids):
+    return """<html><body><span data-is24-qa="resultlist-resultCount">%d</span>
+              <ul id="resultListItems">%s</ul></body></html>""" % \
+           (result_count, "".join(LISTING % expose_id for expose_id in expose_ids))
+
+@pytest.fixture
+def search():
+    PageCache.configure({})
+    DetailPageCache.configure({'enabled': False})
+    pages = {1: [1000001, 1000002], 2: [1000003, 1000004], 3: [1000005, 1000006]}
+    with requests_mock.Mocker() as m:
+        m.get(re.compile(r'https://www\.immobilienscout24\.de/expose/'), text='<html></html>')
+        for page_no, expose_ids in pages.items():
+            m.get(TEST_URL.replace('pagenumber=1', 'pagenumber=%d' % page_no),
+                  text=result_page(6, *expose_ids))
+        yield m
+
+def fetched_pages(m):
+    return [int(request.qs['pagenumber'][0]) for request in m.request_history
+            if 'pagenumber' in request.qs]
+
+def test_incremental_crawl_follows_new_exposes(crawler, search):
+    entries = crawler.get_results(TEST_URL, id_watch=IdMaintainer(":memory:"))
+    assert len(entries) == 6
+    assert fetched_pages(search) == [1, 2, 3]
+
+def test_incremental_crawl_stops_at_processed_exposes(crawler, search):
+    id_watch = IdMaintainer(":memory:")
+    for expose_id in [1000002, 1000003, 1000004]:
+        id_watch.mark_processed(expose_id)
+    entries = crawler.get_results(TEST_URL, id_watch=id_watch)
+    assert [expose['id'] for expose in entries] == [1000001, 1000002, 1000003, 1000004]
+    assert fetched_pages(search) == [1, 2]
+
+def test_incremental_crawl_of_processed_first_page(crawler, search):
+    id_watch = IdMaintainer(":memory:")
+    for expose_id in [1000001, 1000002]:
+        id_watch.mark_processed(expose_id)
+    assert len(crawler.get_results(TEST_URL, id_watch=id_watch)) == 2
+    assert fetched_pages(search) == [1]
+
+def test_incremental_crawl_respects_max_pages(crawler, search):
+    crawler.get_results(TEST_URL, max_pages=2, id_watch=IdMaintainer(":memory:"))
+    assert fetched_pages(search) == [1, 2]
+
+def test_remaining_pages_are_fetched_concurrently(crawler, search):
+    barrier = threading.Barrier(2, timeout=5)
+    fetch_page = crawler.fetch_page
+    def fetch_pages_together(url):
+        if 'pagenumber=1' not in url:
+            barrier.wait()
+        return fetch_page(url)
+    crawler.fetch_page = fetch_pages_together
+    search.get(TEST_URL.replace('pagenumber=1', 'pagenumber=2'),
+               text=result_page(6, 1000003, 1000002))
+    entries = crawler.get_results(TEST_URL)
+    assert [expose['id'] for expose in entries] == [1000001, 1000002, 1000003, 1000005, 1000006]
+    assert sorted(fetched_pages(search)) == [1, 2, 3]
+
+def test_remaining_pages_respect_limits(crawler, search):
+    crawler.get_results(TEST_URL, max_pages=2)
+    assert sorted(fetched_pages(search)) == [1, 2]
+    assert list(crawler.get_remaining_pages(20, 1234, None)) == [2, 3]
+    assert list(crawler.get_remaining_pages(0, 1234, None)) == []
+
+def test_exposes_are_yielded_page_by_page(crawler, search):
+    exposes = crawler.crawl(TEST_URL, id_watch=IdMaintainer(":memory:"))
+    assert next(exposes)['id'] == 1000001
+    assert fetched_pages(search) == [1]
+    assert [expose['id'] for expose in exposes][-1] == 1000006
+    assert fetched_pages(search) == [1, 2, 3]
+
+def test_incremental_crawl_continues_while_exposes_are_processed(crawler, search):
+    id_watch = IdMaintainer(":memory:")
+    for expose in crawler.crawl(TEST_URL, id_watch=id_watch):
+        id_watch.mark_processed(expose['id'])
+    assert fetched_pages(search) == [1, 2, 3]
+
+def standin_results(structured_data):
+    portal = PORTALS['www.immobilienscout24.de']
+    settings = {'listings': 45, 'page_size': 20, 'structured_data': structured_data}
+    listings = [Listing(expose_id) for expose_id in portal.listing_ids('/Suche', 1, settings)]
+    return portal.result_page(listings, settings).encode('utf-8')
+
+def test_embedded_result_list_gives_the_same_exposes_as_the_html(crawler):
+    structured = crawler.extract_structured_content(standin_results(True))
+    assert structured is not None
+    assert crawler.extract_structured_content(standin_results(False)) is None
+    assert structured == crawler.extract_content(standin_results(False))
+    entries, meta = structured
+    assert len(entries) == 20
+    assert meta == {'result_count': 45}
+
+def test_malformed_result_list_falls_back_to_the_html(crawler):
+    page = result_page(6, 1000001, 1000002).replace(
+        '</body>', '<script>IS24.resultList = { resultListModel: {"other": 1} };</script></body>')
+    entries, meta = crawler.extract_content(page.encode('utf-8'))
+    assert [expose['id'] for expose in entries] == [1000001, 1000002]
+    assert meta == {'result_count': 6}
+
+def test_crawlers_without_structured_extraction_parse_the_html():
+    class PatternOnlyCrawler(CrawlImmobilienscout):
+        extract_structured = Crawler.extract_structured
+    crawler = PatternOnlyCrawler()
+    assert crawler.extract_structured_content(standin_results(True)) is None
+    entries, _ = crawler.extract_content(standin_results(True))
+    assert len(entries) == 20
+
+def test_numbers_are_formatted_as_on_the_page(crawler):
+    assert crawler.format_number(1250) == '1.250'
+    assert crawler.format_number(2.5) == '2,5'
+    assert crawler.format_number(78.25) == '78,25'
@@ -0,0 +1,89 @@
+import threading
+
+from flathunter.config import Config
+from flathunter.crawl_executor import CrawlExecutor
+from flathunter.dedup import CrawlDeduplicator
+from flathunter.filter import Filter
+from flathunter.hunter import Hunter
+from flathunter.idmaintainer import IdMaintainer
+from dummy_crawler import DummyCrawler
+
+CHEAP = 'https://www.example.com/search?price=-1000'
+MEDIUM = 'https://www.example.com/search?price=800-1500'
+ALL = 'https://www.example.com/search'
+
+def expose(expose_id, crawler='CrawlImmowelt'):
+    return {'id': expose_id, 'crawler': crawler}
+
+def test_only_first_copies_are_passed_on():
+    deduplicator = CrawlDeduplicator()
+    exposes = list(deduplicator.deduplicate([(CHEAP, expose(1)), (CHEAP, expose(2)),
+                                             (MEDIUM, expose(2)), (MEDIUM, expose(3)),
+                                             (MEDIUM, expose(2))]))
+    assert [e['id'] for e in exposes] == [1, 2, 3]
+    assert deduplicator.duplicates == 2
+    assert deduplicator.source_of(expose(3)) == MEDIUM
+    assert deduplicator.source_of(expose(4)) is None
+
+def test_exposes_of_different_portals_are_kept_apart():
+    deduplicator = CrawlDeduplicator()
+    exposes = list(deduplicator.deduplicate([(CHEAP, expose(1)),
+                                             (CHEAP, expose(1, 'CrawlWgGesucht'))]))
+    assert len(exposes) == 2
+
+def test_overlap_is_counted_per_url_pair():
+    deduplicator = CrawlDeduplicator()
+    list(deduplicator.deduplicate([(CHEAP, expose(1)), (CHEAP, expose(2)),
+                                   (MEDIUM, expose(2)), (MEDIUM, expose(3)),
+                                   (ALL, expose(1)), (ALL, expose(2)), (ALL, expose(3))]))
+    assert deduplicator.overlaps() == {
+        tuple(sorted((CHEAP, MEDIUM))): 1,
+        tuple(sorted((ALL, CHEAP))): 2,
+        tuple(sorted((ALL, MEDIUM))): 2,
+    }
+
+class PagedCrawler:
+
+    def __init__(self):
+        self.first_page_passed = threading.Event()
+
+    def crawl(self, url, max_pages=None, id_watch=None):
+        yield expose(1)
+        yield expose(2)
+        yield expose(1)
+        # the second page only loads once the first one has been processed
+        if self.first_page_passed.wait(timeout=2):
+            yield expose(3)
+
+def test_filtering_does_not_wait_for_the_next_page():
+    crawler = PagedCrawler()
+    deduplicator = CrawlDeduplicator()
+    exposes = deduplicator.deduplicate(
+        CrawlExecutor(max_workers=2).crawl_with_urls([(crawler, CHEAP)]))
+    filter_set = Filter.builder().filter_already_seen(IdMaintainer(":memory:")).build()
+    passed = []
+    for new_expose in filter_set.filter(exposes, ready=deduplicator.ready):
+        passed.append(new_expose['id'])
+        if len(passed) == 2:
+            crawler.first_page_passed.set()
+    assert passed == [1, 2, 3]
+
+class OverlappingCrawler(DummyCrawler):
+
+    def get_results(self, search_url, max_pages=None, id_watch=None):
+        expose_ids = [1, 2, 3] if search_url == CHEAP else [2, 3, 4, 5]
+        return [dict(expose(expose_id, self.get_name()), url=search_url, title='Flat',
+                     address='Berlin') for expose_id in expose_ids]
+
+def test_hunter_crawls_overlapping_urls_once():
+    config = Config(string="""
+urls:
+  - %s
+  - %s
+""" % (CHEAP, MEDIUM))
+    config.set_searchers([OverlappingCrawler()])
+    hunter = Hunter(config, IdMaintainer(":memory:"))
+    exposes = list(hunter.crawl_for_exposes())
+    assert [e['id'] for e in exposes] == [1, 2, 3, 4, 5]
+    assert hunter.deduplicator.overlaps() == {(CHEAP, MEDIUM): 2}
+    assert hunter.new_exposes_by_url(exposes) == {CHEAP: 3, MEDIUM: 2}
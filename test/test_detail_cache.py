@@ -0,0 +1,86 @@
+import time
+import pytest
+import requests_mock
+
+from flathunter.crawl_immowelt import CrawlImmowelt
+from flathunter.crawl_wggesucht import CrawlWgGesucht
+from flathunter.detail_cache import DetailPageCache
+from flathunter.rate_limiter import RateLimiter
+
+EXPOSE_URL = 'https://www.immowelt.de/expose/1234'
+EXPOSE_PAGE = """<html><body><div id="divImmobilie">
+  <div class="clear">
+    <div class="iw_left">Die Wohnung</div>
+    <div class="iw_right"><p>Bezug: 01.10.2020</p></div>
+  </div>
+</div></body></html>"""
+
+@pytest.fixture
+def cache(tmp_path):
+    yield DetailPageCache.configure({}, str(tmp_path / 'detail_pages.db'))
+    DetailPageCache.configure({'enabled': False})
+
+def test_pages_are_cached(cache):
+    assert cache.get(EXPOSE_URL, 60) is None
+    cache.put(EXPOSE_URL, b'page')
+    assert cache.get(EXPOSE_URL, 60) == b'page'
+    assert cache.stats() == {'misses': 1, 'hits': 1}
+
+def test_cache_survives_restart(tmp_path):
+    path = str(tmp_path / 'detail_pages.db')
+    DetailPageCache(path).put(EXPOSE_URL, b'page')
+    assert DetailPageCache(path).get(EXPOSE_URL, 60) == b'page'
+
+def test_pages_expire(cache):
+    cache.put(EXPOSE_URL, b'page')
+    time.sleep(0.01)
+    assert cache.get(EXPOSE_URL, 0) is None
+    assert cache.get(EXPOSE_URL, 60) is None
+    assert cache.stats()['expired'] == 1
+
+def test_least_recently_used_pages_are_evicted(tmp_path):
+    cache = DetailPageCache(str(tmp_path / 'detail_pages.db'), max_size=10)
+    cache.put('https://www.example.com/1', b'1234')
+    cache.put('https://www.example.com/2', b'1234')
+    assert cache.get('https://www.example.com/1', 60) == b'1234'
+    cache.put('https://www.example.com/3', b'1234')
+    assert cache.get('https://www.example.com/2', 60) is None
+    assert cache.get('https://www.example.com/1', 60) == b'1234'
+    assert cache.get('https://www.example.com/3', 60) == b'1234'
+    assert cache.stats()['evicted'] == 1
+
+def test_ttl_per_crawler(tmp_path):
+    cache = DetailPageCache.configure({'ttl': {'CrawlWgGesucht': 60}}, str(tmp_path / 'db'))
+    assert cache.ttl_for(CrawlWgGesucht().get_name(), 10) == 60
+    assert cache.ttl_for(CrawlImmowelt().get_name(), 10) == 10
+    DetailPageCache.configure({'enabled': False})
+
+def test_disabled_cache_stores_nothing():
+    cache = DetailPageCache.configure({'enabled': False}, 'unused.db')
+    cache.put(EXPOSE_URL, b'page')
+    assert cache.get(EXPOSE_URL, 60) is None
+
+@requests_mock.Mocker(kw='m')
+def test_expose_details_are_fetched_once(cache, **kwargs):
+    m = kwargs['m']
+    m.get(EXPOSE_URL, text=EXPOSE_PAGE)
+    crawler = CrawlImmowelt()
+    first = crawler.get_expose_details({'url': EXPOSE_URL})
+    second = crawler.get_expose_details({'url': EXPOSE_URL})
+    assert m.call_count == 1
+    assert first == second
+    assert first['from'] == '01.10.2020'
+
+@pytest.fixture
+def no_retries():
+    yield RateLimiter.configure({'retries': 0})
+    RateLimiter.configure({})
+
+@requests_mock.Mocker(kw='m')
+def test_error_pages_are_not_cached(cache, no_retries, **kwargs):
+    m = kwargs['m']
+    m.get(EXPOSE_URL, [{'status_code': 503, 'text': ''}, {'text': EXPOSE_PAGE}])
+    crawler = CrawlImmowelt()
+    crawler.get_expose_details({'url': EXPOSE_URL})
+    assert crawler.get_expose_details({'url': EXPOSE_URL})['from'] == '01.10.2020'
+    assert m.call_count == 2
@@ -112,3 +112,45 @@ def test_all_filters_can_be_loaded(id_watch):
     hunter.set_filters_for_user(123, filter)
     hunter.set_filters_for_user(124, filter)
     assert id_watch.get_user_settings() == [ (123, { 'filters': filter }), (124, { 'filters': filter }) ]
+
+def test_fingerprints_are_saved_and_found(id_watch):
+    expose = {'id': 101, 'crawler': 'CrawlImmowelt'}
+    id_watch.save_fingerprint(expose, [1, 2, 3], ['0:a', '1:b'])
+    since = datetime.datetime.now() - datetime.timedelta(days=1)
+    assert id_watch.get_fingerprint_candidates(['1:b', '2:c'], since) \
+        == [(101, 'CrawlImmowelt', [1, 2, 3])]
+    assert id_watch.get_fingerprint_candidates(['2:c'], since) == []
+
+def test_processed_ids_are_marked_and_found_in_batches(id_watch):
+    id_watch.mark_processed(1)
+    id_watch.mark_processed_many([(2, 'CrawlImmowelt'), (3, 'CrawlImmowelt')])
+    assert id_watch.is_processed(3)
+    assert id_watch.filter_unseen([(1, 'CrawlImmowelt'), (2, 'CrawlImmowelt'),
+                                   (4, 'CrawlImmowelt')]) == [(4, 'CrawlImmowelt')]
+
+def test_seen_set_is_off_by_default(id_watch):
+    id_watch.mark_processed(1)
+    id_watch.configure_seen_set({})
+    assert id_watch.seen_set is None
+    id_watch.configure_seen_set({'enabled': True})
+    assert id_watch.is_processed(1)
+    assert id_watch.seen_set.stats()['hits'] == 1
+
+def test_saved_exposes_are_counted_once_in_the_rollups(id_watch):
+    expose = {'id': 1, 'crawler': 'CrawlImmowelt', 'title': 'Wohnung', 'price': '1.000 €',
+              'size': '50 m²', 'rooms': '2', 'url': 'https://www.immowelt.de/expose/1'}
+    id_watch.save_expose(expose)
+    id_watch.save_expose(expose)
+    id_watch.save_expose(dict(expose, id=2, price='1.250 €', size='81 m²'))
+    today = datetime.date.today()
+    rows = id_watch.get_stats_since(today)
+    assert sorted(rows) == [
+        (today.isoformat(), 'CrawlImmowelt', 'count', 0, 2),
+        (today.isoformat(), 'CrawlImmowelt', 'price', 1000, 1),
+        (today.isoformat(), 'CrawlImmowelt', 'price', 1200, 1),
+        (today.isoformat(), 'CrawlImmowelt', 'price_per_sqm', 15.0, 1),
+        (today.isoformat(), 'CrawlImmowelt', 'price_per_sqm', 20, 1),
+        (today.isoformat(), 'CrawlImmowelt', 'size', 50, 1),
+        (today.isoformat(), 'CrawlImmowelt', 'size', 80, 1)
+    ]
+    assert id_watch.get_stats_since(today + datetime.timedelta(days=1)) == []
@@ -1,8 +1,11 @@
 import unittest
 import datetime
 import re
+import json
+import sqlite3
+import pytest
 
-from flathunter.idmaintainer import IdMaintainer
+from flathunter.idmaintainer import IdMaintainer, MIGRATIONS
 from flathunter.config import Config
 from flathunter.hunter import Hunter
 from flathunter.web_hunter import WebHunter
@@ -56,11 +59,11 @@ def test_ids_are_added_to_maintainer(mocker):
     config = Config(string=IdMaintainerTest.DUMMY_CONFIG)
     config.set_searchers([DummyCrawler()])
     id_watch = IdMaintainer(":memory:")
-    spy = mocker.spy(id_watch, "mark_processed")
+    spy = mocker.spy(id_watch, "mark_processed_many")
     hunter = Hunter(config, id_watch)
     exposes = hunter.hunt_flats()
     assert count(exposes) > 4
-    assert spy.call_count == 24
+    assert sum(len(call.args[0]) for call in spy.call_args_list) == 24
 
 def test_exposes_are_saved_to_maintainer():
     config = Config(string=IdMaintainerTest.CONFIG_WITH_FILTERS)
@@ -125,3 +128,207 @@ def test_all_filters_can_be_loaded():
     hunter.set_filters_for_user(123, filter)
     hunter.set_filters_for_user(124, filter)
     assert id_watch.get_user_settings() == [ (123, { 'filters': filter }), (124, { 'filters': filter }) ]
+
+def test_processed_ids_are_kept_per_crawler():
+    id_watch = IdMaintainer(":memory:")
+    id_watch.mark_processed(12345, 'CrawlImmowelt')
+    id_watch.mark_processed(12345, 'CrawlImmowelt')
+    assert id_watch.is_processed(12345, 'CrawlImmowelt')
+    assert id_watch.is_processed(12345)
+    assert not id_watch.is_processed(12345, 'CrawlWgGesucht')
+
+def test_legacy_database_is_upgraded(tmp_path):
+    db_name = str(tmp_path / 'processed_ids.db')
+    legacy = sqlite3.connect(db_name)
+    legacy.execute('CREATE TABLE processed (ID INTEGER)')
+    legacy.execute('CREATE TABLE executions (timestamp timestamp)')
+    legacy.execute('CREATE TABLE exposes (id INTEGER, created TIMESTAMP, \
+                    crawler STRING, details BLOB, PRIMARY KEY (id, crawler))')
+    legacy.execute('CREATE TABLE users (id INTEGER PRIMARY KEY, settings BLOB)')
+    legacy.executemany('INSERT INTO processed VALUES (?)', [(1,), (2,), (2,)])
+    legacy.commit()
+    legacy.close()
+
+    id_watch = IdMaintainer(db_name)
+    assert id_watch.is_processed(2, 'CrawlImmowelt')
+    assert not id_watch.is_processed(3, 'CrawlImmowelt')
+    connection = id_watch.get_connection()
+    assert connection.execute('PRAGMA user_version').fetchone()[0] == len(MIGRATIONS)
+    assert connection.execute('SELECT COUNT(*) FROM processed').fetchone()[0] == 2
+
+    # opening the upgraded database again changes nothing
+    assert IdMaintainer(db_name).is_processed(1)
+
+def test_lookups_use_indexes():
+    connection = IdMaintainer(":memory:").get_connection()
+    def plan(query, *args):
+        return ' '.join(row[-1] for row in connection.execute('EXPLAIN QUERY PLAN ' + query, args))
+    assert 'SCAN' not in plan("SELECT id FROM processed WHERE id = ? AND crawler IN (?, '')",
+                              1, 'CrawlImmowelt')
+    assert 'exposes_created' in plan('SELECT details FROM exposes WHERE created >= ? \
+                                      ORDER BY created DESC', datetime.datetime.now())
+
+def test_unseen_exposes_are_found_in_one_batch():
+    id_watch = IdMaintainer(":memory:")
+    id_watch.mark_processed(1)
+    id_watch.mark_processed_many([(2, 'CrawlImmowelt'), (3, 'CrawlImmowelt')])
+    assert id_watch.filter_unseen([(1, 'CrawlWgGesucht'), (2, 'CrawlImmowelt'),
+                                   (2, 'CrawlWgGesucht'), (4, 'CrawlImmowelt'), (3, None)]) \
+        == [(2, 'CrawlWgGesucht'), (4, 'CrawlImmowelt')]
+
+def test_already_seen_filter_marks_batches_at_once(mocker):
+    id_watch = IdMaintainer(":memory:")
+    id_watch.mark_processed(2, 'CrawlImmowelt')
+    mark_one = mocker.spy(id_watch, 'mark_processed')
+    mark_many = mocker.spy(id_watch, 'mark_processed_many')
+    filter_set = Filter.builder().filter_already_seen(id_watch).build()
+    exposes = [{'id': expose_id, 'crawler': 'CrawlImmowelt'} for expose_id in [1, 2, 3, 1]]
+    assert [expose['id'] for expose in filter_set.filter(exposes)] == [1, 3]
+    assert mark_one.call_count == 0
+    assert mark_many.call_count == 1
+    assert list(filter_set.filter(exposes)) == []
+
+def test_streamed_exposes_are_not_held_back():
+    filter_set = Filter.builder().filter_already_seen(IdMaintainer(":memory:")).build()
+    passed = []
+    def crawl():
+        for expose_id in range(3):
+            yield {'id': expose_id, 'crawler': 'CrawlImmowelt'}
+            # a crawler would fetch its next page here
+            assert passed == list(range(expose_id + 1))
+    for expose in filter_set.filter(crawl()):
+        passed.append(expose['id'])
+    assert passed == [0, 1, 2]
+
+def test_ready_exposes_are_filtered_together(mocker):
+    id_watch = IdMaintainer(":memory:")
+    lookup = mocker.spy(id_watch, 'filter_unseen')
+    filter_set = Filter.builder().filter_already_seen(id_watch).build()
+    page = []
+    def crawl():
+        for expose_ids in [[1, 2, 3], [4, 5]]:
+            page.extend(expose_ids)
+            while page:
+                yield {'id': page.pop(0), 'crawler': 'CrawlImmowelt'}
+    exposes = filter_set.filter(crawl(), ready=lambda: len(page) > 0)
+    assert [expose['id'] for expose in exposes] == [1, 2, 3, 4, 5]
+    assert [[expose_id for (expose_id, _) in call.args[0]] for call in lookup.call_args_list] \
+        == [[1, 2, 3], [4, 5]]
+
+def test_database_runs_in_wal_mode(tmp_path):
+    id_watch = IdMaintainer(str(tmp_path / 'processed_ids.db'))
+    connection = id_watch.get_connection()
+    assert connection.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert connection.execute('PRAGMA synchronous').fetchone()[0] == 1
+
+def test_unknown_durability_level_is_rejected():
+    with pytest.raises(ValueError):
+        IdMaintainer(":memory:", {'synchronous': 'sometimes'})
+
+def test_unit_of_work_commits_in_batches(tmp_path):
+    db_name = str(tmp_path / 'processed_ids.db')
+    id_watch = IdMaintainer(db_name, {'batch_size': 3})
+    reader = IdMaintainer(db_name)
+    with id_watch.unit_of_work():
+        id_watch.mark_processed(1)
+        id_watch.mark_processed(2)
+        # writes are queued until their batch is full
+        assert not reader.is_processed(1)
+        id_watch.mark_processed(3)
+        assert reader.is_processed(3)
+        id_watch.mark_processed(4)
+        assert not reader.is_processed(4)
+    assert reader.is_processed(4)
+
+def test_unit_of_work_does_not_block_other_writers(tmp_path):
+    db_name = str(tmp_path / 'processed_ids.db')
+    id_watch = IdMaintainer(db_name)
+    other = IdMaintainer(db_name)
+    other.get_connection().execute('PRAGMA busy_timeout = 100')
+    with id_watch.unit_of_work():
+        id_watch.save_expose(saved_expose(1, '1.000 €', '50 m²', '2'))
+        id_watch.mark_processed(1, 'CrawlImmowelt')
+        other.save_settings_for_user(1, {'filters': {'max_price': 1000}})
+        assert id_watch.is_processed(1, 'CrawlImmowelt')
+        other.save_settings_for_user(2, {'filters': {}})
+    assert other.is_processed(1, 'CrawlImmowelt')
+    assert id_watch.get_settings_for_user(2) == {'filters': {}}
+
+def test_queued_writes_are_rolled_back_together(tmp_path):
+    id_watch = IdMaintainer(str(tmp_path / 'processed_ids.db'))
+    with pytest.raises(sqlite3.Error):
+        with id_watch.unit_of_work():
+            id_watch.mark_processed(1)
+            id_watch.write(lambda cur: cur.execute('INSERT INTO missing VALUES (1)'))
+    assert not id_watch.is_processed(1)
+
+def saved_expose(expose_id, price, size, rooms, title='Wohnung'):
+    return {'id': expose_id, 'crawler': 'CrawlImmowelt', 'title': title,
+            'price': price, 'size': size, 'rooms': rooms}
+
+def test_filters_are_applied_by_the_query():
+    id_watch = IdMaintainer(":memory:")
+    exposes = [saved_expose(1, '800 €', '50 m²', '2'),
+               saved_expose(2, '1.250 €', '80 m²', '3'),
+               saved_expose(3, 'auf Anfrage', '65 m²', '2,5'),
+               saved_expose(4, '950 €', '70 m²', '3', title='WG-Zimmer'),
+               saved_expose(5, '700 €', '30 m²', '1')]
+    for expose in exposes:
+        id_watch.save_expose(expose)
+    filter_set = Filter.builder().read_config({'filters': {
+        'max_price': 1000, 'min_rooms': 2, 'excluded_titles': ['wg']}}).build()
+    condition, params, rest = filter_set.to_sql()
+    assert params == [1000, 2]
+    assert len(rest.filters) == 1
+    recent = id_watch.get_recent_exposes(10, filter_set)
+    assert sorted(expose['id'] for expose in recent) == \
+        sorted(expose['id'] for expose in filter_set.filter(exposes)) == [1, 3]
+    assert len(id_watch.get_recent_exposes(1, filter_set)) == 1
+    plan = ' '.join(row[-1] for row in id_watch.get_connection().execute(
+        'EXPLAIN QUERY PLAN SELECT details FROM exposes WHERE %s ORDER BY created DESC'
+        % condition, params))
+    assert 'USING INDEX' in plan
+
+def test_typed_columns_are_filled_for_saved_exposes(tmp_path):
+    db_name = str(tmp_path / 'processed_ids.db')
+    connection = sqlite3.connect(db_name)
+    for statements in MIGRATIONS[:2]:
+        for statement in statements:
+            connection.execute(statement)
+    connection.execute('PRAGMA user_version = 2')
+    connection.execute('INSERT INTO exposes VALUES (?, ?, ?, ?)',
+                       (1, datetime.datetime.now(), 'CrawlImmowelt',
+                        json.dumps(saved_expose(1, '1.250 €', '80,5 m²', '3'))))
+    connection.commit()
+    connection.close()
+    id_watch = IdMaintainer(db_name)
+    assert id_watch.get_connection().execute(
+        'SELECT price, size, rooms FROM exposes').fetchall() == [(1250.0, 80.5, 3.0)]
+
+def test_saved_exposes_are_counted_once_in_the_rollups():
+    id_watch = IdMaintainer(":memory:")
+    id_watch.save_expose(saved_expose(1, '1.000 €', '50 m²', '2'))
+    id_watch.save_expose(saved_expose(1, '1.000 €', '50 m²', '2'))
+    id_watch.save_expose(saved_expose(2, '1.250 €', '', '2'))
+    rows = id_watch.get_stats_since(datetime.date.today())
+    today = datetime.date.today().isoformat()
+    assert sorted(rows) == [
+        (today, 'CrawlImmowelt', 'count', 0, 2),
+        (today, 'CrawlImmowelt', 'price', 1000, 1),
+        (today, 'CrawlImmowelt', 'price', 1200, 1),
+        (today, 'CrawlImmowelt', 'price_per_sqm', 20, 1),
+        (today, 'CrawlImmowelt', 'size', 50, 1)
+    ]
+    assert id_watch.get_stats_since(datetime.date.today() + datetime.timedelta(days=1)) == []
+
+def test_rollups_are_backfilled_for_saved_exposes(tmp_path):
+    db_name = str(tmp_path / 'processed_ids.db')
+    id_watch = IdMaintainer(db_name)
+    id_watch.save_expose(saved_expose(1, '1.000 €', '50 m²', '2'))
+    connection = id_watch.get_connection()
+    connection.execute('DROP TABLE stats_buckets')
+    connection.execute('PRAGMA user_version = 3')
+    connection.commit()
+    connection.close()
+    id_watch = IdMaintainer(db_name)
+    assert len(id_watch.get_stats_since(datetime.date.today())) == 4
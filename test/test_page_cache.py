@@ -0,0 +1,95 @@
+import pytest
+import requests_mock
+
+from flathunter.crawl_immowelt import CrawlImmowelt
+from flathunter.page_cache import PageCache
+from flathunter.rate_limiter import RateLimiter
+
+TEST_URL = 'https://www.immowelt.de/liste/berlin/wohnungen/mieten?roomi=2&prima=1500&wflmi=70&sort=createdate%2Bdesc'
+
+LISTING = """<div class="listitem_wrap" data-estateid="%d">
+  <a href="/expose/%d"><h2>Wohnung %d</h2></a>
+  <div class="listlocation"><span>Lage</span>Berlin (Mitte)</div>
+  <div class="hardfact"><strong>900 EUR</strong></div>
+  <div class="hardfact">70 m<div>Wohnflaeche</div></div>
+  <div class="hardfact">3<div>Zimmer</div></div>
+</div>"""
+
+def result_page(*expose_ids):
+    return '<html><body><div id="listItemWrapperFixed">%s</div></body></html>' % \
+           "".join(LISTING % (i, i, i) for i in expose_ids)
+
+class CountingCrawler(CrawlImmowelt):
+
+    def __init__(self):
+        super().__init__()
+        self.extractions = 0
+
+    def extract_data(self, soup):
+        self.extractions += 1
+        return super().extract_data(soup)
+
+@pytest.fixture
+def crawler():
+    PageCache.configure({})
+    return CountingCrawler()
+
+@requests_mock.Mocker(kw='m')
+def test_not_modified_pages_are_not_parsed_again(crawler, **kwargs):
+    m = kwargs['m']
+    m.get(TEST_URL, [{'text': result_page(1, 2), 'headers': {'ETag': '"v1"'}},
+                     {'status_code': 304, 'text': ''}])
+    first = crawler.get_results(TEST_URL)
+    second = crawler.get_results(TEST_URL)
+    assert m.last_request.headers['If-None-Match'] == '"v1"'
+    assert crawler.extractions == 1
+    assert first == second
+    assert PageCache.shared().stats() == {'changed': 1, 'not_modified': 1}
+
+@requests_mock.Mocker(kw='m')
+def test_unchanged_pages_are_not_parsed_again(crawler, **kwargs):
+    m = kwargs['m']
+    m.get(TEST_URL, text=result_page(1, 2))
+    crawler.get_results(TEST_URL)
+    entries = crawler.get_results(TEST_URL)
+    assert crawler.extractions == 1
+    assert [expose['id'] for expose in entries] == [1, 2]
+
+@requests_mock.Mocker(kw='m')
+def test_changed_pages_are_parsed(crawler, **kwargs):
+    m = kwargs['m']
+    m.get(TEST_URL, [{'text': result_page(1, 2)}, {'text': result_page(3, 1, 2)}])
+    crawler.get_results(TEST_URL)
+    entries = crawler.get_results(TEST_URL)
+    assert crawler.extractions == 2
+    assert [expose['id'] for expose in entries] == [3, 1, 2]
+
+@requests_mock.Mocker(kw='m')
+def test_cached_exposes_are_copies(crawler, **kwargs):
+    m = kwargs['m']
+    m.get(TEST_URL, text=result_page(1))
+    crawler.get_results(TEST_URL)[0]['address'] = 'changed'
+    assert crawler.get_results(TEST_URL)[0]['address'] != 'changed'
+
+@pytest.fixture
+def no_retries():
+    yield RateLimiter.configure({'retries': 0})
+    RateLimiter.configure({})
+
+@requests_mock.Mocker(kw='m')
+def test_error_pages_are_not_cached(crawler, no_retries, **kwargs):
+    m = kwargs['m']
+    m.get(TEST_URL, [{'status_code': 500, 'text': 'oops'}, {'text': result_page(1)}])
+    assert crawler.get_results(TEST_URL) == []
+    assert len(crawler.get_results(TEST_URL)) == 1
+
+def test_cache_is_bounded():
+    cache = PageCache(max_pages=2)
+    class Response:
+        status_code = 200
+        headers = {}
+        def __init__(self, content):
+            self.content = content
+    for i in range(3):
+        cache.update('https://www.example.com/%d' % i, Response(b'page'))
+    assert list(cache.pages.keys()) == ['https://www.example.com/1', 'https://www.example.com/2']
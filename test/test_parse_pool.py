@@ -0,0 +1,69 @@
+import os
+import asyncio
+import pytest
+import requests_mock
+from collections import namedtuple
+
+from flathunter.crawl_immobilienscout import CrawlImmobilienscout
+from flathunter.crawl_immowelt import CrawlImmowelt
+from flathunter.detail_cache import DetailPageCache
+from flathunter.page_cache import CachedPage
+from flathunter.parse_pool import ParsePool
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+Response = namedtuple('Response', ['status_code', 'content', 'headers'])
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), 'rb') as fixture_file:
+        return fixture_file.read()
+
+def fetched_page(name):
+    return CachedPage('https://www.example.com/' + name, Response(200, fixture(name), {}))
+
+@pytest.fixture
+def pool():
+    pool = ParsePool.configure({'parse_workers': 2})
+    yield pool
+    ParsePool.configure({})
+
+def test_parses_in_process_by_default():
+    pool = ParsePool.configure({})
+    assert pool.get_executor() is None
+    assert pool.run(os.getpid) == os.getpid()
+
+def test_parses_in_worker_processes(pool):
+    assert pool.run(os.getpid) != os.getpid()
+
+def test_worker_errors_are_raised(pool):
+    with pytest.raises(ValueError):
+        pool.run(int, 'not a number')
+    assert pool.get_executor() is not None
+
+def test_falls_back_to_in_process_parsing(pool):
+    assert pool.run(lambda value: value * 2, 21) == 42
+    assert pool.get_executor() is None
+
+def test_result_pages_are_parsed_in_workers(pool):
+    crawler = CrawlImmowelt()
+    entries = crawler.extract_page(fetched_page('immowelt_results.html'))
+    ParsePool.configure({})
+    assert entries == crawler.extract_page(fetched_page('immowelt_results.html'))
+    assert len(entries) == 2
+
+def test_result_pages_are_parsed_in_workers_async(pool):
+    crawler = CrawlImmowelt()
+    entries = asyncio.run(crawler.extract_page_async(fetched_page('immowelt_results.html')))
+    assert [expose['id'] for expose in entries] == [2386811, 2391254]
+
+def test_expose_pages_are_parsed_in_workers(pool):
+    DetailPageCache.configure({'enabled': False})
+    crawler = CrawlImmobilienscout()
+    page = fetched_page('immobilienscout_results.html')
+    entries = crawler.extract_page(page)
+    with requests_mock.Mocker() as m:
+        m.get(entries[1]['url'], content=fixture('immobilienscout_expose.html'))
+        expose = crawler.get_expose_details(entries[1])
+    assert page.meta['result_count'] == 1234
+    assert expose['from'] == '01.12.2020'
+    assert expose['total_price'] == '1.450 €'
@@ -1,12 +1,32 @@
 import unittest
+import threading
 import yaml
 import re
 from flathunter.crawl_immowelt import CrawlImmowelt
 from flathunter.hunter import Hunter 
 from flathunter.config import Config
+from flathunter.filter import Filter
 from flathunter.idmaintainer import IdMaintainer
 from flathunter.processor import ProcessorChain
 from dummy_crawler import DummyCrawler
+
+class DetailsCrawler(DummyCrawler):
+
+    def __init__(self):
+        super().__init__()
+        self.barrier = threading.Barrier(2, timeout=5)
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def get_expose_details(self, expose):
+        with self.lock:
+            self.calls += 1
+            first_two = self.calls <= 2
+        if first_two:
+            # only passes if two exposes are being loaded at the same time
+            self.barrier.wait()
+        expose['from'] = '01.01.2021'
+        return expose
 from test_util import count
 
 class ProcessorTest(unittest.TestCase):
@@ -42,4 +62,50 @@ google_maps_api:
                               .build()
         exposes = chain.process(exposes)
         for expose in exposes:
-            self.assertFalse(expose['address'].startswith('http'), "Expected addresses to be processed")
\ No newline at end of file
+            self.assertFalse(expose['address'].startswith('http'), "Expected addresses to be processed")
+
+    def test_expose_details_are_crawled_concurrently(self):
+        crawler = DetailsCrawler()
+        config = Config(string=self.DUMMY_CONFIG)
+        config.set_searchers([crawler])
+        exposes = crawler.get_results("https://www.example.com/search")
+        interesting = [expose for expose in exposes if expose['id'] % 2 == 0]
+        chain = ProcessorChain.builder(config) \
+                              .apply_filter(Filter.builder() \
+                                                  .predicate_filter(lambda e: e['id'] % 2 == 0) \
+                                                  .build()) \
+                              .crawl_expose_details() \
+                              .build()
+        processed = list(chain.process(exposes))
+        self.assertEqual([expose['id'] for expose in processed],
+                         [expose['id'] for expose in interesting])
+        for expose in processed:
+            self.assertEqual(expose['from'], '01.01.2021')
+        for expose in exposes:
+            if expose['id'] % 2 == 1:
+                self.assertNotIn('from', expose, "Expected no details for filtered exposes")
+
+    def test_expose_details_are_passed_on_while_crawling(self):
+        config = Config(string=self.DUMMY_CONFIG)
+        config.set_searchers([DummyCrawler()])
+        taken = []
+        def stream():
+            for expose in DummyCrawler().get_results("https://www.example.com/search"):
+                taken.append(expose)
+                yield expose
+        chain = ProcessorChain.builder(config).crawl_expose_details().build()
+        next(iter(chain.process(stream())))
+        self.assertLessEqual(len(taken), 4)
+
+    def test_only_deferred_expose_details_are_crawled(self):
+        crawler = DetailsCrawler()
+        crawler.barrier = threading.Barrier(1)
+        config = Config(string=self.DUMMY_CONFIG)
+        config.set_searchers([crawler])
+        exposes = crawler.get_results("https://www.example.com/search")
+        chain = ProcessorChain.builder(config).crawl_expose_details(deferred_only=True).build()
+        self.assertEqual(len(list(chain.process(exposes))), len(exposes))
+        self.assertEqual(crawler.calls, 0)
+        crawler.DEFERRED_DETAILS = True
+        list(chain.process(exposes))
+        self.assertEqual(crawler.calls, len(exposes))
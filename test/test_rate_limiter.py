@@ -0,0 +1,82 @@
+import time
+import pytest
+import requests
+import requests_mock
+
+from flathunter.rate_limiter import RateLimiter, TokenBucket
+from flathunter.sessions import SessionPool
+
+URL = 'https://www.example.com/search'
+
+@pytest.fixture
+def limiter():
+    yield RateLimiter.configure({'backoff': 0.01, 'max_backoff': 0.05})
+    RateLimiter.configure({})
+
+def test_bucket_allows_bursts():
+    bucket = TokenBucket(rate=10, capacity=3, min_rate=1, max_rate=10)
+    assert [bucket.reserve() for _ in range(3)] == [0, 0, 0]
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+    assert bucket.reserve() == pytest.approx(0.2, abs=0.01)
+
+def test_hosts_are_limited_separately():
+    limiter = RateLimiter({'rate': 1, 'burst': 1})
+    assert limiter.delay(URL) == 0
+    assert limiter.delay('https://www.example.org/search') == 0
+    assert limiter.delay(URL) > 0
+    assert limiter.stats()['delayed'] == 1
+
+def test_throttling_slows_down():
+    limiter = RateLimiter({'rate': 4, 'min_rate': 1})
+    limiter.record(URL, 429)
+    assert limiter.bucket_for(URL).rate == 2
+    limiter.record(URL, 503)
+    limiter.record(URL, 503)
+    assert limiter.bucket_for(URL).rate == 1
+    limiter.record(URL, 200)
+    assert limiter.bucket_for(URL).rate == pytest.approx(1.4)
+    assert limiter.stats()['throttled'] == 3
+
+def test_retry_after_is_honoured(limiter):
+    assert limiter.retry_delay(URL, 0, '0.04') >= 0.04
+    assert limiter.retry_delay(URL, 0, 'Wed, 21 Oct 2015 07:28:00 GMT') <= 0.01
+
+def test_retries_are_limited():
+    limiter = RateLimiter({'retries': 2, 'retry_budget': 3})
+    assert limiter.retry_delay(URL, 2) is None
+    assert all(limiter.retry_delay(URL, 0) is not None for _ in range(3))
+    assert limiter.retry_delay(URL, 0) is None
+    assert limiter.stats() == {'retries': 3, 'budget_exhausted': 1}
+    limiter.start_cycle()
+    assert limiter.retry_delay(URL, 0) is not None
+
+def test_failed_requests_are_retried(limiter):
+    with requests_mock.Mocker() as m:
+        m.get(URL, [{'status_code': 503}, {'status_code': 502}, {'text': 'results'}])
+        resp = SessionPool().get(URL)
+    assert resp.text == 'results'
+    assert m.call_count == 3
+    assert limiter.stats()['retries'] == 2
+
+def test_last_failure_is_returned_when_retries_run_out(limiter):
+    with requests_mock.Mocker() as m:
+        m.get(URL, status_code=500)
+        resp = SessionPool().get(URL)
+    assert resp.status_code == 500
+    assert m.call_count == 4
+
+def test_connection_errors_are_retried(limiter):
+    with requests_mock.Mocker() as m:
+        m.get(URL, [{'exc': requests.exceptions.ConnectTimeout}, {'text': 'results'}])
+        assert SessionPool().get(URL).text == 'results'
+        m.get(URL, exc=requests.exceptions.ConnectionError)
+        with pytest.raises(requests.exceptions.ConnectionError):
+            SessionPool().get(URL)
+
+def test_client_errors_are_not_retried(limiter):
+    with requests_mock.Mocker() as m:
+        m.get(URL, status_code=404)
+        start = time.monotonic()
+        assert SessionPool().get(URL).status_code == 404
+    assert m.call_count == 1
+    assert time.monotonic() - start < 0.1
@@ -0,0 +1,67 @@
+import os
+import re
+import pytest
+import requests_mock
+from collections import namedtuple
+from bs4 import BeautifulSoup
+
+from flathunter.crawl_ebaykleinanzeigen import CrawlEbayKleinanzeigen
+from flathunter.crawl_immobilienscout import CrawlImmobilienscout
+from flathunter.crawl_immowelt import CrawlImmowelt
+from flathunter.crawl_wggesucht import CrawlWgGesucht
+from flathunter.detail_cache import DetailPageCache
+from flathunter.page_cache import CachedPage
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+Response = namedtuple('Response', ['status_code', 'content', 'headers'])
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), 'rb') as fixture_file:
+        return fixture_file.read()
+
+def fetched_page(name):
+    return CachedPage('https://www.example.com/' + name, Response(200, fixture(name), {}))
+
+@pytest.fixture
+def expose_pages():
+    DetailPageCache.configure({'enabled': False})
+    with requests_mock.Mocker() as m:
+        m.get(re.compile(r'https://www\.immobilienscout24\.de/expose/'),
+              content=fixture('immobilienscout_expose.html'))
+        yield m
+
+@pytest.mark.parametrize('crawler,name,count', [
+    (CrawlImmowelt(), 'immowelt_results.html', 2),
+    (CrawlEbayKleinanzeigen(), 'ebaykleinanzeigen_results.html', 2),
+    (CrawlWgGesucht(), 'wggesucht_results.html', 2),
+    (CrawlImmobilienscout(), 'immobilienscout_results.html', 2),
+])
+def test_strained_parse_matches_full_parse(expose_pages, crawler, name, count):
+    full = crawler.extract_data(BeautifulSoup(fixture(name), 'html.parser'))
+    strained = crawler.extract_page(fetched_page(name))
+    assert len(full) == count
+    assert strained == full
+
+def test_strainer_only_builds_result_list():
+    soup = CrawlImmowelt().parse_results(fixture('immowelt_results.html'))
+    assert soup.find('header') is None
+    assert len(soup.find_all('h2')) == 2
+
+def test_immobilienscout_result_count():
+    crawler = CrawlImmobilienscout()
+    page = fetched_page('immobilienscout_results.html')
+    entries = crawler.extract_page(page)
+    assert page.meta['result_count'] == crawler.read_result_count(page.content) == 1234
+    assert entries[0]['url'] == 'https://www.immobilienscout24.de/expose/120654321'
+    assert entries[0]['photos'] == []
+
+def test_immobilienscout_expose_details(expose_pages):
+    crawler = CrawlImmobilienscout()
+    expose = crawler.get_expose_details(
+        crawler.extract_page(fetched_page('immobilienscout_results.html'))[0])
+    assert expose['photos'] == ['https://pictures.immobilienscout24.de/listings/a.jpg',
+                                'https://pictures.immobilienscout24.de/listings/b.jpg']
+    assert expose['total_price'] == '1.450 €'
+    assert expose['free_from'] == '01.12.2020'
+    assert expose['from'] == '01.12.2020'
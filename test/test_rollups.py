@@ -0,0 +1,50 @@
+import datetime
+
+from flathunter.rollups import bucket, expose_buckets, bucket_key, parse_bucket_key, \
+    Rollup, summarize
+
+def test_values_are_bucketed_by_metric():
+    assert bucket('price', 1234.5) == 1200
+    assert bucket('size', 59.9) == 50
+    assert bucket('price_per_sqm', 15.7) == 15.5
+
+def test_implausible_exposes_have_no_price_per_sqm():
+    assert expose_buckets(1000, 50) == [('count', 0), ('price', 1000), ('size', 50),
+                                        ('price_per_sqm', 20)]
+    assert expose_buckets(1000, None) == [('count', 0), ('price', 1000)]
+    assert expose_buckets(100000, 50) == [('count', 0), ('price', 100000), ('size', 50)]
+
+def test_quantiles_are_interpolated_within_buckets():
+    rollup = Rollup()
+    rollup.add('price', 1000, 2)
+    rollup.add('price', 1200, 2)
+    assert rollup.quantile('price', 0.25) == 1050
+    assert rollup.quantile('price', 0.5) == 1100
+    assert rollup.quantile('price', 1) == 1300
+    assert rollup.quantile('size', 0.5) is None
+    assert rollup.box('size') is None
+
+def test_bucket_keys_name_the_bucket_without_dots():
+    assert bucket_key('price_per_sqm', 20.5) == 'price_per_sqm_41'
+    assert bucket_key('price', 1200) == 'price_12'
+    assert parse_bucket_key('price_per_sqm_41') == ('price_per_sqm', 20.5)
+    assert parse_bucket_key('count_0') == ('count', 0)
+
+def test_rollups_are_summarized_by_week_weekday_and_crawler():
+    today = datetime.date(2021, 3, 14)
+    rows = [
+        ('2021-03-14', 'CrawlImmowelt', 'count', 0, 3),
+        ('2021-03-14', 'CrawlImmowelt', 'price_per_sqm', 20, 2),
+        ('2021-03-08', 'CrawlWgGesucht', 'count', 0, 1),
+        ('2021-03-07', 'CrawlWgGesucht', 'count', 0, 4),
+    ]
+    statistics = summarize(rows, today)
+    assert statistics['weeks'] == [
+        {'start': '2021-03-08', 'count': 4,
+         'price_per_sqm': {'lowerfence': 20.02, 'q1': 20.12, 'median': 20.25,
+                           'q3': 20.38, 'upperfence': 20.48}},
+        {'start': '2021-03-01', 'count': 4, 'price_per_sqm': None}
+    ]
+    assert statistics['weekdays']['Sun'] == 7
+    assert statistics['weekdays']['Mon'] == 1
+    assert statistics['crawlers'] == {'CrawlImmowelt': 3, 'CrawlWgGesucht': 5}
@@ -0,0 +1,110 @@
+import threading
+import pytest
+
+from flathunter.config import Config
+from flathunter.hunter import Hunter
+from flathunter.idmaintainer import IdMaintainer
+from flathunter.scheduler import Scheduler
+from dummy_crawler import DummyCrawler
+
+BUSY = 'https://www.example.com/busy'
+QUIET = 'https://www.example.com/quiet'
+
+class Clock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+@pytest.fixture
+def scheduler(clock):
+    return Scheduler([BUSY, QUIET], {'sleeping_time': 600, 'min_sleeping_time': 100,
+                                     'max_sleeping_time': 2000, 'jitter': 0}, clock=clock)
+
+def test_all_urls_are_due_at_start(scheduler):
+    assert scheduler.due_urls() == [BUSY, QUIET]
+    assert scheduler.seconds_until_next_run() == 0
+
+def test_sleeping_time_without_urls():
+    assert Scheduler([], {'sleeping_time': 600}).seconds_until_next_run() == 600
+
+def test_intervals_adapt_to_new_exposes(scheduler, clock):
+    scheduler.run_due(lambda urls: {BUSY: 3})
+    assert scheduler.schedules[BUSY].interval == 300
+    assert scheduler.schedules[QUIET].interval == 900
+    assert scheduler.seconds_until_next_run() == 300
+    clock.now += 300
+    assert scheduler.due_urls() == [BUSY]
+    scheduler.run_due(lambda urls: {BUSY: 1})
+    assert scheduler.schedules[BUSY].interval == 150
+    stats = scheduler.stats()['urls'][BUSY]
+    assert stats['runs'] == 2
+    assert stats['new_exposes'] == 4
+
+def test_intervals_stay_within_bounds(scheduler):
+    for _ in range(10):
+        scheduler.record(BUSY, 5)
+        scheduler.record(QUIET, 0)
+    assert scheduler.schedules[BUSY].interval == 100
+    assert scheduler.schedules[QUIET].interval == 2000
+
+def test_next_runs_are_jittered(clock):
+    scheduler = Scheduler([BUSY], {'sleeping_time': 600, 'jitter': 0.1}, clock=clock)
+    runs = set()
+    for _ in range(10):
+        scheduler.record(BUSY, 1)
+        scheduler.schedules[BUSY].interval = 600
+        runs.add(scheduler.schedules[BUSY].next_run)
+    assert len(runs) > 1
+    assert all(clock.now + 270 <= run <= clock.now + 330 for run in runs)
+
+def test_overlapping_runs_are_skipped(scheduler):
+    started = threading.Event()
+    release = threading.Event()
+    def slow_hunt(urls):
+        started.set()
+        release.wait(timeout=5)
+        return {}
+    thread = threading.Thread(target=scheduler.run_due, args=(slow_hunt,))
+    thread.start()
+    started.wait(timeout=5)
+    assert scheduler.run_due(lambda urls: {}) is None
+    release.set()
+    thread.join()
+    assert scheduler.stats()['skipped_runs'] == 1
+
+def test_failing_runs_are_rescheduled(scheduler):
+    def failing_hunt(urls):
+        raise ValueError("Crawl failed")
+    with pytest.raises(ValueError):
+        scheduler.run_due(failing_hunt)
+    assert scheduler.due_urls() == []
+
+def test_only_enabled_by_config():
+    assert Scheduler.from_config(Config(string="loop:\n  active: yes")) is None
+    scheduler = Scheduler.from_config(Config(string="""
+loop:
+  adaptive: yes
+  min_sleeping_time: 60
+urls:
+  - %s
+""" % BUSY))
+    assert scheduler.settings['min_sleeping_time'] == 60
+    assert list(scheduler.schedules) == [BUSY]
+
+def test_hunter_counts_new_exposes_by_url():
+    config = Config(string="""
+urls:
+  - %s
+  - %s
+""" % (BUSY, QUIET))
+    config.set_searchers([DummyCrawler()])
+    hunter = Hunter(config, IdMaintainer(":memory:"))
+    exposes = list(hunter.crawl_for_exposes(urls=[QUIET]))
+    assert hunter.new_exposes_by_url(exposes) == {QUIET: len(exposes)}
@@ -0,0 +1,77 @@
+import tracemalloc
+
+from flathunter.idmaintainer import IdMaintainer
+from flathunter.seen_set import SeenSet
+
+def test_loaded_ids_are_known():
+    seen_set = SeenSet(lambda: [(3, 'CrawlImmowelt'), (1, ''), (2, 'CrawlWgGesucht')])
+    assert seen_set.lookup(1, 'CrawlImmowelt')
+    assert seen_set.lookup(2, 'CrawlWgGesucht')
+    assert seen_set.lookup(3)
+    assert seen_set.lookup(2, 'CrawlImmowelt') is None
+    assert seen_set.lookup(4) is None
+
+def test_misses_are_final_when_exclusive():
+    seen_set = SeenSet(lambda: [(1, 'CrawlImmowelt')], exclusive=True)
+    assert seen_set.lookup(1, 'CrawlImmowelt') is True
+    assert seen_set.lookup(2, 'CrawlImmowelt') is False
+
+def test_marked_ids_are_merged_into_the_array():
+    seen_set = SeenSet(lambda: [(expose_id, 'CrawlImmowelt') for expose_id in range(0, 100, 2)])
+    seen_set.MERGE_THRESHOLD = 10
+    seen_set.add_many([(expose_id, 'CrawlImmowelt') for expose_id in range(1, 20, 2)])
+    assert seen_set.pending == {}
+    assert all(seen_set.lookup(expose_id, 'CrawlImmowelt') for expose_id in range(20))
+    assert seen_set.stats()['ids'] == 60
+
+def test_large_history_takes_eight_bytes_per_id():
+    ids = 200000
+    seen_set = SeenSet(lambda: ((expose_id * 7, 'CrawlImmobilienscout') for expose_id in range(ids)))
+    assert seen_set.lookup(7 * 12345, 'CrawlImmobilienscout')
+    assert seen_set.lookup(7 * 12345 + 1, 'CrawlImmobilienscout') is None
+    assert seen_set.stats()['bytes'] < 9 * ids
+
+def test_loading_and_merging_do_not_copy_the_history_into_a_list():
+    ids = 200000
+    seen_set = SeenSet(lambda: ((expose_id * 7, 'CrawlImmobilienscout') for expose_id in range(ids)))
+    seen_set.MERGE_THRESHOLD = 100
+    tracemalloc.start()
+    seen_set.add_many([(expose_id * 7 + 1, 'CrawlImmobilienscout') for expose_id in range(100)])
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert seen_set.pending == {}
+    assert seen_set.lookup(7 * 99 + 1, 'CrawlImmobilienscout')
+    assert list(seen_set.keys) == sorted(seen_set.keys)
+    # the loaded array and the merged one, but no list of int objects
+    assert peak_bytes < 20 * ids
+
+def test_ids_are_loaded_in_order_from_the_database():
+    id_watch = IdMaintainer(":memory:")
+    id_watch.mark_processed_many([(3, 'CrawlImmowelt'), (1, 'CrawlWgGesucht'), (2, '')])
+    assert [expose_id for (expose_id, _) in id_watch.iter_processed()] == [1, 2, 3]
+
+def test_database_is_only_asked_about_unknown_ids(mocker):
+    id_watch = IdMaintainer(":memory:")
+    id_watch.mark_processed_many([(1, 'CrawlImmowelt'), (2, 'CrawlImmowelt')])
+    id_watch.configure_seen_set({})
+    query = mocker.spy(id_watch, 'query_unseen')
+    assert id_watch.filter_unseen([(1, 'CrawlImmowelt'), (2, 'CrawlImmowelt'),
+                                   (3, 'CrawlImmowelt')]) == [(3, 'CrawlImmowelt')]
+    assert query.call_args.args[0] == [(3, 'CrawlImmowelt')]
+    id_watch.mark_processed(3, 'CrawlImmowelt')
+    lookup = mocker.spy(id_watch, 'lookup_processed')
+    assert id_watch.is_processed(3, 'CrawlImmowelt')
+    assert lookup.call_count == 0
+
+def test_ids_marked_by_another_process_are_found(tmp_path):
+    db_name = str(tmp_path / 'processed_ids.db')
+    id_watch = IdMaintainer(db_name)
+    id_watch.configure_seen_set({})
+    assert not id_watch.is_processed(1, 'CrawlImmowelt')
+    IdMaintainer(db_name).mark_processed(1, 'CrawlImmowelt')
+    assert id_watch.is_processed(1, 'CrawlImmowelt')
+    stats = id_watch.seen_set.stats()
+    assert stats['fallbacks'] == 2
+    assert stats['stale'] == 1
+    assert id_watch.is_processed(1, 'CrawlImmowelt')
+    assert id_watch.seen_set.stats()['hits'] == 1
@@ -0,0 +1,104 @@
+import threading
+import time
+import pytest
+import requests_mock
+from http.server import HTTPServer, ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from flathunter.sessions import SessionPool
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'<html><body>hello</body></html>'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def server():
+    httpd = HTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:%d' % httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_connections_are_reused(server):
+    pool = SessionPool()
+    for page in range(5):
+        resp = pool.get('%s/page/%d' % (server, page))
+        assert resp.status_code == 200
+    stats = pool.stats()[server.split('/')[2]]
+    assert stats['requests'] == 5
+    assert stats['connections'] == 1
+    assert stats['reused'] == 4
+    pool.close()
+
+def test_one_session_per_host():
+    pool = SessionPool()
+    assert pool.session_for('https://www.example.com/a') is pool.session_for('https://www.example.com/b')
+    assert pool.session_for('https://www.example.com/a') is not pool.session_for('https://www.example.org/a')
+
+@requests_mock.Mocker(kw='m')
+def test_default_timeout_and_compression(**kwargs):
+    m = kwargs['m']
+    m.get('https://www.example.com/', text='ok')
+    pool = SessionPool({'timeout': 7})
+    pool.get('https://www.example.com/')
+    assert m.last_request.timeout == 7
+    assert 'gzip' in m.last_request.headers['Accept-Encoding']
+
+@requests_mock.Mocker(kw='m')
+def test_compression_can_be_disabled(**kwargs):
+    m = kwargs['m']
+    m.get('https://www.example.com/', text='ok')
+    pool = SessionPool({'compression': False})
+    pool.get('https://www.example.com/')
+    assert m.last_request.headers['Accept-Encoding'] == 'identity'
+
+def test_configure_replaces_shared_pool():
+    pool = SessionPool.configure({'pool_maxsize': 3})
+    assert SessionPool.shared() is pool
+    assert pool.settings['pool_maxsize'] == 3
+
+class SlowHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    lock = threading.Lock()
+    running = 0
+    peak = 0
+
+    def do_GET(self):
+        with SlowHandler.lock:
+            SlowHandler.running += 1
+            SlowHandler.peak = max(SlowHandler.peak, SlowHandler.running)
+        time.sleep(0.05)
+        with SlowHandler.lock:
+            SlowHandler.running -= 1
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, format, *args):
+        pass
+
+def test_parallel_requests_per_host_are_limited():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), SlowHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    pool = SessionPool({'max_parallel_requests': 2})
+    threads = [threading.Thread(target=pool.get,
+                                args=('http://127.0.0.1:%d/%d' % (httpd.server_address[1], i),))
+               for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    httpd.shutdown()
+    httpd.server_close()
+    pool.close()
+    assert SlowHandler.peak == 2
@@ -0,0 +1,76 @@
+import datetime
+
+from flathunter.config import Config
+from flathunter.idmaintainer import IdMaintainer
+from flathunter.processor import ProcessorChain
+from flathunter.similarity import normalize, signature, buckets, similarity, DuplicateFilterProcessor
+
+CONFIG = """
+duplicates:
+  enabled: yes
+  threshold: 0.6
+"""
+
+def immoscout_expose():
+    return {'id': 101, 'crawler': 'CrawlImmobilienscout',
+            'title': 'Helle 3-Zimmer-Wohnung mit Balkon in Friedrichshain',
+            'address': 'Boxhagener Straße 12, 10245 Berlin',
+            'price': '1.250 €', 'size': '78 m²', 'rooms': '3'}
+
+def immowelt_expose():
+    return {'id': 202, 'crawler': 'CrawlImmowelt',
+            'title': 'Helle 3 Zimmer Wohnung mit Balkon - Friedrichshain',
+            'address': 'Boxhagener Strasse 12, 10245 Berlin',
+            'price': '1250,00 €', 'size': '78,0 m²', 'rooms': '3'}
+
+def other_expose():
+    return {'id': 303, 'crawler': 'CrawlWgGesucht',
+            'title': 'Gemütliches WG-Zimmer nahe Tempelhofer Feld',
+            'address': 'Oderstraße 5, 12049 Berlin',
+            'price': '520 €', 'size': '16 m²', 'rooms': '1'}
+
+def test_normalize_spells_out_umlauts():
+    assert normalize('Boxhagener Straße 12, Köpenick') == 'boxhagener strasse 12 koepenick'
+
+def test_same_flat_on_two_portals_is_similar():
+    same = similarity(signature(immoscout_expose()), signature(immowelt_expose()))
+    different = similarity(signature(immoscout_expose()), signature(other_expose()))
+    assert same >= 0.6
+    assert different < 0.2
+
+def test_similar_exposes_share_a_bucket():
+    assert set(buckets(signature(immoscout_expose()))) \
+        & set(buckets(signature(immowelt_expose())))
+
+def test_fingerprints_are_saved_and_found():
+    id_watch = IdMaintainer(":memory:")
+    sig = signature(immoscout_expose())
+    id_watch.save_fingerprint(immoscout_expose(), sig, buckets(sig))
+    since = datetime.datetime.now() - datetime.timedelta(days=1)
+    assert id_watch.get_fingerprint_candidates(buckets(sig), since) \
+        == [(101, 'CrawlImmobilienscout', sig)]
+    assert id_watch.get_fingerprint_candidates(['nowhere'], since) == []
+    id_watch.delete_fingerprints_before(datetime.datetime.now() + datetime.timedelta(days=1))
+    assert id_watch.get_fingerprint_candidates(buckets(sig), since) == []
+
+def test_duplicates_from_other_portals_are_dropped():
+    config = Config(string=CONFIG)
+    chain = ProcessorChain.builder(config) \
+                          .filter_duplicates(IdMaintainer(":memory:")) \
+                          .build()
+    exposes = list(chain.process([immoscout_expose(), other_expose(), immowelt_expose()]))
+    assert [expose['id'] for expose in exposes] == [101, 303]
+
+def test_similar_exposes_of_one_portal_are_kept():
+    processor = DuplicateFilterProcessor(Config(string=CONFIG), IdMaintainer(":memory:"))
+    relisted = immoscout_expose()
+    relisted['id'] = 102
+    exposes = list(processor.process_exposes([immoscout_expose(), relisted]))
+    assert len(exposes) == 2
+    assert processor.suppressed == 0
+
+def test_duplicate_filter_is_disabled_by_default():
+    chain = ProcessorChain.builder(Config(string="urls: []")) \
+                          .filter_duplicates(IdMaintainer(":memory:")) \
+                          .build()
+    assert len(list(chain.process([immoscout_expose(), immowelt_expose()]))) == 2
@@ -0,0 +1,62 @@
+import pytest
+
+from flathunter.crawl_ebaykleinanzeigen import CrawlEbayKleinanzeigen
+from flathunter.crawl_immobilienscout import CrawlImmobilienscout
+from flathunter.crawl_immowelt import CrawlImmowelt
+from flathunter.crawl_wggesucht import CrawlWgGesucht
+from flathunter.detail_cache import DetailPageCache
+from flathunter.page_cache import PageCache
+from flathunter.rate_limiter import RateLimiter
+from flathunter.sessions import SessionPool
+from flathunter.standin import StandinServer, rewrite_url
+
+IMMOSCOUT_URL = 'https://www.immobilienscout24.de/Suche/de/berlin/berlin/wohnung-mieten?sorting=2&pagenumber=1'
+
+@pytest.fixture
+def standin():
+    PageCache.configure({'enabled': False})
+    DetailPageCache.configure({'enabled': False})
+    RateLimiter.configure({'rate': 1000, 'burst': 1000, 'backoff': 0.01})
+    with StandinServer({'listings': 45, 'page_size': 20}) as server:
+        SessionPool.configure({'standin_url': server.url})
+        yield server
+    SessionPool.configure({})
+    RateLimiter.configure({})
+    PageCache.configure({})
+
+def test_urls_are_rewritten():
+    assert rewrite_url('https://www.immowelt.de/liste/berlin?sort=1', 'http://127.0.0.1:8080/') \
+        == 'http://127.0.0.1:8080/www.immowelt.de/liste/berlin?sort=1'
+    assert rewrite_url('https://www.immowelt.de/liste', None) == 'https://www.immowelt.de/liste'
+
+@pytest.mark.parametrize('crawler,url,count', [
+    (CrawlImmowelt(), 'https://www.immowelt.de/liste/berlin/wohnungen/mieten', 20),
+    (CrawlEbayKleinanzeigen(), 'https://www.ebay-kleinanzeigen.de/s-wohnung-mieten/berlin/c203l3331', 20),
+    (CrawlWgGesucht(), 'https://www.wg-gesucht.de/wohnungen-in-Berlin.8.2.1.0.html', 20),
+    (CrawlImmobilienscout(), IMMOSCOUT_URL, 45),
+])
+def test_crawlers_run_against_standin(standin, crawler, url, count):
+    entries = crawler.get_results(url)
+    assert len(entries) == count
+    assert len(set(expose['id'] for expose in entries)) == count
+    for attr in ['title', 'price', 'size', 'rooms', 'address']:
+        assert entries[0][attr]
+    assert crawler.get_results(url) == entries
+
+def test_result_pages_are_paginated(standin):
+    CrawlImmobilienscout().get_results(IMMOSCOUT_URL)
+    assert standin.stats() == {'www.immobilienscout24.de': {'pages': 3, 'errors': 0}}
+
+def test_expose_pages_are_served(standin):
+    crawler = CrawlImmobilienscout()
+    expose = crawler.get_expose_details(crawler.get_results(IMMOSCOUT_URL)[0])
+    assert len(expose['photos']) == 2
+    assert expose['total_price'].endswith('€')
+    wg_crawler = CrawlWgGesucht()
+    expose = wg_crawler.get_results('https://www.wg-gesucht.de/wohnungen-in-Berlin.8.2.1.0.html')[0]
+    assert '10115 Berlin' in wg_crawler.load_address(expose['address'])
+
+def test_errors_are_served_at_error_rate(standin):
+    standin.settings['error_rate'] = 1.0
+    assert CrawlImmowelt().get_results('https://www.immowelt.de/liste/berlin') == []
+    assert standin.stats()['www.immowelt.de']['errors'] == 4
@@ -2,6 +2,7 @@ import pytest
 import tempfile
 import yaml
 import json
+import re
 import requests_mock
 
 from flask import session
@@ -39,3 +40,9 @@ def hunt_client():
 def test_statistics_view(hunt_client):
     rv = hunt_client.get('/stats')
     assert b'<a class="navbar-brand" href="/">Flathunter</a>' in rv.data
+
+def test_statistics_view_shows_saved_exposes(hunt_client):
+    app.config['HUNTER'].hunt_flats()
+    rv = hunt_client.get('/stats')
+    statistics = json.loads(re.search(rb'var statistics = (.*);', rv.data).group(1))
+    assert sum(statistics['weekdays'].values()) > 0